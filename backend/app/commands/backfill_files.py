@@ -0,0 +1,129 @@
+"""Index existing files under uploads/ into the files collection.
+
+Run from backend/:
+
+    python -m app.commands.backfill_files [--dry-run]
+
+Legacy uploads were stored as uploads/{images,documents}/<uuid><ext> without
+any metadata. Each one gets a record keyed by that uuid (the file_id clients
+already hold), with owner and organization taken from the message that
+attached it where one exists. Records are marked legacy: the file stays where
+it is, since stored messages link to that path. Re-running only adds files
+that are still missing.
+
+Legacy files only ever existed on local disk, so this reads UPLOAD_ROOT
+directly whatever STORAGE_BACKEND is set to.
+"""
+import argparse
+import hashlib
+import mimetypes
+import os
+from datetime import datetime, timezone
+
+from ..config import db
+from ..storage.factory import storage_path, UPLOAD_ROOT
+from ..services.file_service import (
+    files_collection, ensure_file_indexes, get_file_type, track_storage_usage
+)
+from ..services.message_service import ensure_message_indexes
+from ..services.thumbnail_service import (
+    rendition_name, thumbnail_path_for, RENDITION_SIZES, RENDITION_FORMATS
+)
+
+LEGACY_FOLDERS = ("images", "documents")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_rendition(filename: str) -> bool:
+    stem = os.path.splitext(filename)[0]
+    return stem.endswith("_thumb") or any(stem.endswith(f"_{size}") for size in RENDITION_SIZES)
+
+
+def _find_owner(file_id: str):
+    """Owner and organization of the first message that attached file_id"""
+    message = db["messages"].find_one({"attachment.file_id": file_id}, {"sender_id": 1, "chat_id": 1})
+    if not message:
+        return None, None
+    org_id = None
+    from bson import ObjectId
+    if ObjectId.is_valid(message["chat_id"]):
+        chat = db["chats"].find_one({"_id": ObjectId(message["chat_id"])}, {"organization_id": 1})
+        org_id = chat.get("organization_id") if chat else None
+    return message.get("sender_id"), org_id
+
+
+def build_record(disk_path: str, path: str) -> dict:
+    """Record for the file at disk_path, recorded under the logical path"""
+    filename = os.path.basename(path)
+    file_id = os.path.splitext(filename)[0]
+    content_type = mimetypes.guess_type(filename)[0]
+    file_type = get_file_type(content_type, filename)
+    owner_id, org_id = _find_owner(file_id)
+
+    thumbnail_path = None
+    renditions = {}
+    if file_type == "image":
+        for size in RENDITION_SIZES:
+            for ext in RENDITION_FORMATS:
+                name = rendition_name(file_id, size, ext)
+                if os.path.exists(os.path.join(os.path.dirname(disk_path), name)):
+                    renditions[f"{size}_{ext}"] = os.path.join(os.path.dirname(path), name)
+        if os.path.exists(thumbnail_path_for(disk_path, file_id)):
+            thumbnail_path = thumbnail_path_for(path, file_id)
+
+    return {
+        "_id": file_id,
+        "sha256": _sha256(disk_path),
+        "legacy": True,
+        "owner_id": owner_id,
+        "organization_id": org_id,
+        "path": path,
+        "thumbnail_path": thumbnail_path,
+        "thumbnail_status": "ready" if thumbnail_path else None,
+        "renditions": renditions or None,
+        "original_filename": filename,
+        "file_type": file_type,
+        "content_type": content_type,
+        "size": os.path.getsize(disk_path),
+        "uploaded_at": datetime.fromtimestamp(os.path.getmtime(disk_path), tz=timezone.utc),
+    }
+
+
+def backfill(dry_run: bool = False) -> dict:
+    ensure_file_indexes()
+    # _find_owner looks messages up by attachment.file_id once per file
+    ensure_message_indexes()
+    stats = {"scanned": 0, "indexed": 0, "skipped": 0}
+    for folder in LEGACY_FOLDERS:
+        directory = os.path.join(UPLOAD_ROOT, folder)
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or _is_rendition(entry.name):
+                    continue
+                stats["scanned"] += 1
+                file_id = os.path.splitext(entry.name)[0]
+                if files_collection.count_documents({"_id": file_id}, limit=1):
+                    stats["skipped"] += 1
+                    continue
+                record = build_record(entry.path, storage_path(f"{folder}/{entry.name}"))
+                if not dry_run:
+                    files_collection.insert_one(record)
+                    track_storage_usage(record["organization_id"], record["file_type"], record["size"], 1)
+                stats["indexed"] += 1
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index existing uploads into the files collection")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be indexed without writing")
+    print(backfill(parser.parse_args().dry_run))
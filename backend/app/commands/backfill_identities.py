@@ -0,0 +1,14 @@
+"""Rebuild the identities collection from the admins and users collections.
+
+Run from backend/:
+
+    python -m app.commands.backfill_identities
+
+The API adds identities for accounts that lack one on startup and
+user_service / admin_service keep them in sync afterwards; run this after
+editing accounts directly in the database.
+"""
+from ..services.identity_service import backfill_identities
+
+if __name__ == "__main__":
+    print(backfill_identities(), "identities synced")
@@ -0,0 +1,84 @@
+"""Move embedded ticket notes and communication into their own collections.
+
+Run from backend/:
+
+    python -m app.commands.migrate_ticket_threads [--dry-run]
+
+Each entry of a ticket's notes/communication array becomes a document in
+ticket_notes/ticket_messages. The ticket gets notes_count, messages_count and
+last_activity, and the arrays are removed. Entries keep their id and
+createdAt, and their _id is derived from createdAt so they sort before
+anything added through the API afterwards. Safe to re-run.
+"""
+import argparse
+import os
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from ..services.ticket_service import (
+    tickets_collection, ticket_notes_collection, ticket_messages_collection,
+    ensure_ticket_indexes, _last_activity
+)
+
+THREADS = (
+    ("notes", ticket_notes_collection, "note", "notes_count"),
+    ("communication", ticket_messages_collection, "message", "messages_count"),
+)
+
+
+def _entry_object_id(created_at, index: int) -> ObjectId:
+    """ObjectId ordered by createdAt, then by position in the original array"""
+    if not isinstance(created_at, datetime):
+        created_at = datetime.now(timezone.utc)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return ObjectId(int(created_at.timestamp()).to_bytes(4, "big") + index.to_bytes(3, "big") + os.urandom(5))
+
+
+def migrate_ticket(ticket: dict, dry_run: bool = False) -> dict:
+    ticket_id = str(ticket["_id"])
+    moved = {}
+    for field, collection, _, _ in THREADS:
+        entries = ticket.get(field) or []
+        moved[field] = len(entries)
+        if dry_run:
+            continue
+        for index, entry in enumerate(entries):
+            doc = {**entry, "ticket_id": ticket_id, "organization_id": ticket.get("organization_id")}
+            doc["_id"] = _entry_object_id(entry.get("createdAt"), index)
+            collection.update_one(
+                {"ticket_id": ticket_id, "id": entry.get("id")},
+                {"$setOnInsert": doc},
+                upsert=True,
+            )
+
+    if not dry_run:
+        update = {"$unset": {"notes": "", "communication": ""}, "$set": {}}
+        latest = []
+        for _, collection, kind, counter in THREADS:
+            update["$set"][counter] = collection.count_documents({"ticket_id": ticket_id})
+            last = collection.find_one({"ticket_id": ticket_id}, sort=[("_id", -1)])
+            if last and last.get("createdAt"):
+                latest.append((last["_id"].generation_time, kind, last))
+        update["$set"]["last_activity"] = _last_activity(*max(latest, key=lambda item: item[0])[1:]) if latest else None
+        tickets_collection.update_one({"_id": ticket["_id"]}, update)
+    return moved
+
+
+def migrate(dry_run: bool = False, batch_size: int = 200) -> dict:
+    ensure_ticket_indexes()
+    stats = {"tickets": 0, "notes": 0, "communication": 0}
+    query = {"$or": [{"notes": {"$exists": True}}, {"communication": {"$exists": True}}]}
+    for ticket in tickets_collection.find(query, {"notes": 1, "communication": 1, "organization_id": 1}).batch_size(batch_size):
+        moved = migrate_ticket(ticket, dry_run)
+        stats["tickets"] += 1
+        stats["notes"] += moved["notes"]
+        stats["communication"] += moved["communication"]
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move ticket notes and communication into separate collections")
+    parser.add_argument("--dry-run", action="store_true", help="count entries without moving them")
+    print(migrate(parser.parse_args().dry_run))
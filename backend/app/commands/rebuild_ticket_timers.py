@@ -0,0 +1,20 @@
+"""Recreate the pending SLA and travel alerts of every open ticket.
+
+Run from backend/:
+
+    python -m app.commands.rebuild_ticket_timers [--include-overdue]
+
+Timers are kept in step with tickets on create, update and delete; run this
+once for tickets created before the scheduler existed, or after changing
+TICKET_SLA_OPEN_HOURS / TICKET_TRAVEL_SOON_HOURS. Alerts that are already
+past due are skipped unless --include-overdue is given.
+"""
+import argparse
+
+from ..services.ticket_timer_service import rebuild_ticket_timers
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the ticket alert timers")
+    parser.add_argument("--include-overdue", action="store_true", help="also schedule alerts that are already due")
+    args = parser.parse_args()
+    print(rebuild_ticket_timers(include_overdue=args.include_overdue), "timers pending")
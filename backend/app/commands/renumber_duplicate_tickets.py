@@ -0,0 +1,48 @@
+"""Give fresh ids to tickets that share a TKT-nnn id within an organization.
+
+Run from backend/:
+
+    python -m app.commands.renumber_duplicate_tickets [--dry-run]
+
+Ids used to be derived from a global count_documents, so concurrent creates
+and deletes could hand out the same id twice. In each duplicate group the
+oldest ticket keeps its id and the rest get the organization's next numbers.
+The unique (organization_id, id) index is created afterwards.
+"""
+import argparse
+
+from ..services.ticket_service import (
+    tickets_collection, reserve_ticket_numbers, format_ticket_id, ensure_ticket_indexes
+)
+
+
+def renumber(dry_run: bool = False) -> list:
+    changes = []
+    duplicates = tickets_collection.aggregate([
+        {"$sort": {"createdAt": 1}},
+        {"$group": {
+            "_id": {"org": "$organization_id", "id": "$id"},
+            "tickets": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    for group in duplicates:
+        org_id = group["_id"]["org"]
+        extra = group["tickets"][1:]
+        first = reserve_ticket_numbers(org_id, len(extra)) if not dry_run else None
+        for offset, mongo_id in enumerate(extra):
+            new_id = format_ticket_id(first + offset) if first is not None else None
+            if not dry_run:
+                tickets_collection.update_one({"_id": mongo_id}, {"$set": {"id": new_id}})
+            changes.append({"_id": str(mongo_id), "organization_id": org_id, "old_id": group["_id"]["id"], "new_id": new_id})
+    if not dry_run:
+        ensure_ticket_indexes()
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renumber tickets with duplicate ids")
+    parser.add_argument("--dry-run", action="store_true", help="list duplicates without changing them")
+    for change in renumber(parser.parse_args().dry_run):
+        print(change)
@@ -0,0 +1,25 @@
+"""Run the storage garbage collector once.
+
+Run from backend/:
+
+    python -m app.commands.storage_gc [--dry-run] [--grace-hours N]
+
+The API runs the same job every STORAGE_GC_INTERVAL_SECONDS; this is for
+operators who want to reclaim space or check what would be removed now.
+"""
+import argparse
+
+from ..services.file_service import ensure_file_indexes
+from ..services.message_service import ensure_message_indexes
+from ..services.storage_gc_service import run_storage_gc, STORAGE_GC_GRACE_HOURS, STORAGE_GC_BATCH_SIZE
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete orphaned uploads and reconcile storage usage")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without deleting")
+    parser.add_argument("--grace-hours", type=int, default=STORAGE_GC_GRACE_HOURS)
+    parser.add_argument("--batch-size", type=int, default=STORAGE_GC_BATCH_SIZE)
+    args = parser.parse_args()
+    # The reference lookups rely on these; the API creates them on startup
+    ensure_file_indexes()
+    ensure_message_indexes()
+    print(run_storage_gc(args.grace_hours, args.batch_size, args.dry_run))
@@ -1,11 +1,13 @@
 from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
+from .core.metrics import MongoCommandMetrics
+from .core.profiling import SlowQueryListener
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "internal_chatapp")
 
-client = MongoClient(MONGO_URI)
+client = MongoClient(MONGO_URI, event_listeners=[MongoCommandMetrics(), SlowQueryListener()])
 db = client[DB_NAME]
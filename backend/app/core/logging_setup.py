@@ -0,0 +1,108 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# "json" (one object per line, for pm2 / log shippers) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-logger levels: "chatapp.messages=DEBUG,chatapp.files=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Fraction of records below WARNING that are kept, by logger name prefix or by
+# route template for access logs: "chatapp.http=0.1,/metrics=0,/messages/chat/{chat_id}=0.05"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+_listener: Optional[QueueListener] = None
+
+
+def _parse_pairs(spec: str) -> Dict[str, str]:
+    pairs = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+class SamplingFilter(logging.Filter):
+    """Drops a share of DEBUG/INFO records; warnings and errors always pass"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.route_rates = {name: rate for name, rate in rates.items() if name.startswith("/")}
+        # Longest prefix first so "chatapp.http.static" beats "chatapp.http"
+        self.logger_rates = sorted(
+            ((name, rate) for name, rate in rates.items() if not name.startswith("/")),
+            key=lambda pair: len(pair[0]), reverse=True,
+        )
+
+    def _rate(self, record: logging.LogRecord) -> float:
+        route = getattr(record, "route", None)
+        if route in self.route_rates:
+            return self.route_rates[route]
+        for name, rate in self.logger_rates:
+            if record.name == name or record.name.startswith(name + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record)
+        return rate >= 1.0 or random.random() < rate
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        from pythonjsonlogger.json import JsonFormatter
+        return JsonFormatter(
+            "%(asctime)s %(levelname)s %(name)s %(message)s",
+            rename_fields={"asctime": "time", "levelname": "level", "name": "logger"},
+        )
+    return logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def configure_logging():
+    """Route all logging through a queue so request handlers never wait on stdout.
+
+    Records are sampled and enqueued on the calling thread; a listener thread
+    formats and writes them.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(_formatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter({name: float(rate) for name, rate in _parse_pairs(LOG_SAMPLE_RATES).items()}))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+    # uvicorn installs its own stream handlers; send its logs through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
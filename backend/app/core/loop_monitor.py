@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+from . import metrics
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+# Samples the percentiles are computed over (600 x 100ms = the last minute)
+LOOP_LAG_WINDOW = int(os.getenv("LOOP_LAG_WINDOW", "600"))
+# Debug mode: snapshot the loop thread's stack whenever one step holds the
+# loop longer than the threshold
+LOOP_BLOCK_DETECT = os.getenv("LOOP_BLOCK_DETECT", "false").lower() == "true"
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+LOOP_BLOCK_REPORTS = int(os.getenv("LOOP_BLOCK_REPORTS", "50"))
+
+PERCENTILES = (0.5, 0.9, 0.99)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE_DIR = os.path.join(APP_DIR, "core")
+ROUTES_DIR = os.path.join(APP_DIR, "routes")
+STACK_DEPTH = 40
+
+logger = logging.getLogger("chatapp.loop_monitor")
+
+_lags: Deque[float] = deque(maxlen=LOOP_LAG_WINDOW)
+_reports: Deque[dict] = deque(maxlen=LOOP_BLOCK_REPORTS)
+_task: Optional[asyncio.Task] = None
+_watchdog: Optional["BlockWatchdog"] = None
+# monotonic time the sampler last ran; read by the watchdog thread
+_heartbeat = 0.0
+
+
+def _interval() -> float:
+    interval = LOOP_LAG_INTERVAL_MS / 1000
+    if LOOP_BLOCK_DETECT:
+        # Tick often enough that a stall just over the threshold is noticed
+        interval = min(interval, LOOP_BLOCK_THRESHOLD_MS / 4000)
+    return interval
+
+
+async def _sample_lag():
+    global _heartbeat
+    interval = _interval()
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - expected, 0.0)
+        _heartbeat = time.monotonic()
+        _lags.append(lag)
+        metrics.event_loop_lag_seconds.observe(lag)
+
+
+def lag_percentiles() -> Dict[str, float]:
+    """p50/p90/p99/max lag in milliseconds over the recent window"""
+    samples = sorted(_lags)
+    if not samples:
+        return {}
+    result = {f"p{int(q * 100)}_ms": round(samples[min(int(q * len(samples)), len(samples) - 1)] * 1000, 2)
+              for q in PERCENTILES}
+    result["max_ms"] = round(samples[-1] * 1000, 2)
+    result["samples"] = len(samples)
+    return result
+
+
+def export_percentiles():
+    """Refresh the percentile gauges; called when /metrics is scraped"""
+    samples = sorted(_lags)
+    if not samples:
+        return
+    for q in PERCENTILES:
+        metrics.event_loop_lag_window.set(samples[min(int(q * len(samples)), len(samples) - 1)], quantile=str(q))
+
+
+# ---------------- Blocking-call detector ----------------
+
+def _module(filename: str) -> str:
+    return os.path.relpath(filename, os.path.dirname(APP_DIR))[:-3].replace(os.sep, ".")
+
+
+def _frame_scope(frame) -> Optional[dict]:
+    """The ASGI scope local of this frame, if it has one"""
+    if "scope" not in frame.f_code.co_varnames:
+        return None
+    scope = frame.f_locals.get("scope")
+    if not isinstance(scope, dict) or scope.get("type") not in ("http", "websocket"):
+        return None
+    return scope
+
+
+def _scope_route(scope: dict) -> Optional[str]:
+    """Method and route template of a matched request"""
+    template = metrics.route_template(scope)
+    if template is None:
+        return None
+    return f"{scope.get('method', 'WS')} {template}"
+
+
+def describe_stack(frame) -> dict:
+    """The blocked loop's stack, root first, with the route and app functions named.
+
+    route is the matched route template, handler the outermost frame in
+    app/routes and function the innermost frame in the app: the service
+    call (or the handler itself) that was holding the loop. organization_id
+    is the caller's, as recorded on the request state by the middleware.
+    """
+    report: Dict[str, object] = {"route": None, "organization_id": None, "handler": None, "function": None}
+    stack: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.abspath(code.co_filename)
+        if len(stack) < STACK_DEPTH:
+            stack.append(f"{code.co_name} ({filename}:{frame.f_lineno})")
+        if filename.startswith(APP_DIR) and not filename.startswith(CORE_DIR):
+            name = f"{_module(filename)}.{code.co_name}"
+            if report["function"] is None:
+                report["function"] = name
+            if filename.startswith(ROUTES_DIR):
+                report["handler"] = name
+        if report["route"] is None:
+            scope = _frame_scope(frame)
+            route = _scope_route(scope) if scope is not None else None
+            if route is not None:
+                report["route"] = route
+                report["organization_id"] = (scope.get("state") or {}).get("org_id")
+        frame = frame.f_back
+    report["stack"] = list(reversed(stack))
+    return report
+
+
+class BlockWatchdog(threading.Thread):
+    """Watches the sampler's heartbeat from outside the loop.
+
+    When the heartbeat goes stale the loop thread is stuck in one step, so its
+    current stack is the code holding the loop. The report is filed when the
+    loop recovers, with the full duration of the stall.
+    """
+
+    def __init__(self, loop_thread_id: int):
+        super().__init__(name="loop-block-watchdog", daemon=True)
+        self.loop_thread_id = loop_thread_id
+        self.threshold = LOOP_BLOCK_THRESHOLD_MS / 1000
+        self.interval = _interval()
+        self._done = threading.Event()
+
+    def run(self):
+        current: Optional[dict] = None
+        while not self._done.wait(self.threshold / 4):
+            stalled = time.monotonic() - _heartbeat - self.interval
+            if stalled > self.threshold:
+                if current is None:
+                    frame = sys._current_frames().get(self.loop_thread_id)
+                    if frame is None:
+                        continue
+                    current = describe_stack(frame)
+                    current["detected_at"] = datetime.now(timezone.utc).isoformat()
+                current["blocked_ms"] = round(stalled * 1000, 1)
+            elif current is not None:
+                _file_report(current)
+                current = None
+
+    def stop(self):
+        self._done.set()
+
+
+def _file_report(report: dict):
+    _reports.append(report)
+    culprit = report["function"] or "unknown"
+    metrics.event_loop_blocked.inc(function=culprit)
+    logger.warning(
+        "Event loop blocked for %.0fms in %s (%s)", report["blocked_ms"], culprit, report["route"] or "no route",
+        extra={key: report[key] for key in ("blocked_ms", "route", "handler", "function", "stack")},
+    )
+
+
+def blocking_reports(org_id: Optional[str] = None) -> List[dict]:
+    """Recent stalls, newest first; only those during org_id's requests if given"""
+    reports = list(reversed(_reports))
+    if org_id is None:
+        return reports
+    return [report for report in reports if report["organization_id"] == org_id]
+
+
+def start_loop_monitor():
+    global _task, _watchdog, _heartbeat
+    if not LOOP_MONITOR_ENABLED or _task is not None:
+        return
+    _heartbeat = time.monotonic()
+    _task = asyncio.get_running_loop().create_task(_sample_lag())
+    if LOOP_BLOCK_DETECT:
+        _watchdog = BlockWatchdog(threading.get_ident())
+        _watchdog.start()
+
+
+def stop_loop_monitor():
+    global _task, _watchdog
+    if _watchdog is not None:
+        _watchdog.stop()
+        _watchdog = None
+    if _task is not None:
+        _task.cancel()
+        _task = None
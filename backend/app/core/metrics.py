@@ -0,0 +1,187 @@
+"""In-process metrics in the Prometheus text format, served at /metrics.
+
+Counters, gauges and histograms are plain dicts keyed by label values, so
+recording costs a lock and an addition. Each worker process keeps its own
+values; scrape every worker (or run one) when more than one is started.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+# Seconds; covers sub-millisecond Mongo reads up to slow uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def _samples(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+class _Timer:
+    """with histogram.time(label=...): observes the block's duration in seconds"""
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+http_requests = Counter("chatapp_http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_request_seconds = Histogram("chatapp_http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+mongo_command_seconds = Histogram("chatapp_mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command"))
+mongo_command_failures = Counter("chatapp_mongo_command_failures_total", "MongoDB commands that failed", ("collection", "command"))
+ws_connections = Gauge("chatapp_ws_connections", "Open WebSocket connections")
+ws_rooms = Gauge("chatapp_ws_rooms", "Chats with at least one viewer connected")
+ws_broadcast_recipients = Histogram("chatapp_ws_broadcast_recipients", "Sockets a broadcast was sent to", ("scope",), SIZE_BUCKETS)
+ws_broadcast_seconds = Histogram("chatapp_ws_broadcast_duration_seconds", "Time to send a broadcast to every recipient", ("scope",))
+ws_sends_in_flight = Gauge("chatapp_ws_sends_in_flight", "WebSocket frames queued or being written")
+ws_send_failures = Counter("chatapp_ws_send_failures_total", "WebSocket sends that failed or timed out")
+fcm_send_seconds = Histogram("chatapp_fcm_send_duration_seconds", "FCM send latency", ("kind",))
+fcm_send_failures = Counter("chatapp_fcm_send_failures_total", "FCM sends that failed", ("kind",))
+thumbnail_job_seconds = Histogram("chatapp_thumbnail_job_duration_seconds", "Time to render and store an image's renditions", ("status",))
+event_loop_lag_seconds = Histogram("chatapp_event_loop_lag_seconds", "How late a timer on the event loop fired", buckets=DEFAULT_BUCKETS)
+event_loop_lag_window = Gauge("chatapp_event_loop_lag_window_seconds", "Event loop lag percentiles over the recent window", ("quantile",))
+event_loop_blocked = Counter("chatapp_event_loop_blocked_total", "Times the event loop was held past the block threshold", ("function",))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command per collection; registered on the MongoClient"""
+
+    def __init__(self):
+        # request_id -> collection of commands in flight
+        self._collections: Dict[Tuple[int, int], str] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[(event.request_id, event.operation_id)] = target if isinstance(target, str) else ""
+
+    def _collection(self, event) -> str:
+        return self._collections.pop((event.request_id, event.operation_id), "")
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, collection=self._collection(event),
+                                      command=event.command_name)
+
+    def failed(self, event):
+        collection = self._collection(event)
+        mongo_command_seconds.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        mongo_command_failures.inc(collection=collection, command=event.command_name)
+
+
+def route_template(scope: dict) -> Optional[str]:
+    """The matched route's path ("/tickets/{ticket_id}"), so ids do not explode label cardinality"""
+    route = scope.get("route")
+    return getattr(route, "path", None)
@@ -0,0 +1,59 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# werkzeug method string: "scrypt:N:r:p" or "pbkdf2:sha256:iterations".
+# Hashes made with anything else are upgraded the next time their owner logs in.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# hashlib's scrypt and pbkdf2_hmac release the GIL, so threads hash in parallel
+# without the pickling and startup cost of a process pool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _executor
+
+
+def shutdown_password_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def hash_password(password: str) -> str:
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+@lru_cache(maxsize=1)
+def _current_method() -> str:
+    # werkzeug fills in defaults ("pbkdf2:sha256" -> "pbkdf2:sha256:1000000"),
+    # so compare against what it actually writes
+    return hash_password("").split("$", 1)[0]
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hash.split("$", 1)[0] != _current_method()
+
+
+def verify_password(password_hash: Optional[str], password: str) -> Tuple[bool, Optional[str]]:
+    """Check a password; on success also return a new hash if the stored one is outdated"""
+    if not password_hash or not check_password_hash(password_hash, password):
+        return False, None
+    return True, hash_password(password) if needs_rehash(password_hash) else None
+
+
+async def verify_password_async(password_hash: Optional[str], password: str) -> Tuple[bool, Optional[str]]:
+    """verify_password on the hashing pool, keeping the event loop free"""
+    if not password_hash:
+        return False, None
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), verify_password, password_hash, password)
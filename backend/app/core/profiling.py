@@ -0,0 +1,316 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+from .metrics import route_template
+
+# Fraction of HTTP requests profiled; 0 turns the profiler off
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "500"))
+# Mongo commands slower than this are logged; negative turns the log off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# Re-run slow reads with explain to record documents and keys examined. Off
+# by default: each explain repeats the slow query on the primary
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() == "true"
+# Each query shape is explained at most once per this many seconds
+SLOW_QUERY_EXPLAIN_INTERVAL_S = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_S", "600"))
+EXPLAINED_SHAPES_MAX = 10000
+DIAGNOSTICS_RETENTION_HOURS = int(os.getenv("DIAGNOSTICS_RETENTION_HOURS", "72"))
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "getMore",
+                    "buildInfo", "explain"}
+# Threads parked in these files are idle, not doing request work
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py", os.path.join("concurrent", "futures", "thread.py"))
+STACK_DEPTH = 64
+
+logger = logging.getLogger("chatapp.profiling")
+
+# ASGI scope and token claims of the request being handled, so a slow query
+# can be attributed to its route and organization
+request_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("request_context", default=None)
+
+_writes: "queue.SimpleQueue[tuple]" = queue.SimpleQueue()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+# Set on the writer thread so its own commands are not logged
+_local = threading.local()
+# Query shape -> monotonic time of its last explain; used by the writer thread only
+_explained: Dict[tuple, float] = {}
+
+
+def _db():
+    from ..config import db
+    return db
+
+
+def ensure_diagnostics_indexes():
+    db = _db()
+    for name in ("request_profiles", "slow_queries"):
+        db[name].create_index("created_at", expireAfterSeconds=DIAGNOSTICS_RETENTION_HOURS * 3600)
+        db[name].create_index([("organization_id", 1), ("created_at", -1)])
+
+
+# ---------------- Writer thread ----------------
+
+def _enqueue(kind: str, document: dict):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="diagnostics-writer", daemon=True)
+                _writer.start()
+    _writes.put((kind, document))
+
+
+def _write_loop():
+    _local.suppress = True
+    while True:
+        kind, document = _writes.get()
+        try:
+            if kind == "slow_query":
+                _explain(document)
+                _db()["slow_queries"].insert_one(document)
+            else:
+                _db()["request_profiles"].insert_one(document)
+        except Exception as exc:
+            logger.warning("Failed to store %s: %s", kind, exc)
+
+
+# ---------------- Sampling profiler ----------------
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace(os.sep, "/")
+    short = "/".join(path.rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({short})"
+
+
+def _collapse(frame) -> Optional[str]:
+    """Root-first "a;b;c" stack, or None for a thread that is only waiting"""
+    if frame.f_code.co_filename.endswith(IDLE_FILES):
+        return None
+    labels = []
+    while frame is not None and len(labels) < STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler(threading.Thread):
+    """Samples every busy thread's stack until stopped.
+
+    Async handlers share the event loop thread, so a profile also contains
+    whatever else the loop ran meanwhile; sync handlers show up under the
+    worker thread that ran them.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._done.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = _collapse(frame)
+                if stack:
+                    self.samples[f"{names.get(ident, ident)};{stack}"] += 1
+
+    def stop(self) -> Counter:
+        self._done.set()
+        self.join()
+        return self.samples
+
+
+def should_profile() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile() -> StackSampler:
+    sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+    sampler.start()
+    return sampler
+
+
+def save_profile(sampler: StackSampler, scope: dict, status: int, duration: float, claims: Optional[dict]):
+    samples = sampler.stop()
+    _enqueue("profile", {
+        "organization_id": (claims or {}).get("org_id"),
+        "user_id": (claims or {}).get("user_id"),
+        "method": scope.get("method"),
+        "path": scope.get("path"),
+        "route": route_template(scope) or "unmatched",
+        "status": status,
+        "duration_ms": round(duration * 1000, 2),
+        "interval_ms": PROFILE_INTERVAL_MS,
+        "sample_count": sum(samples.values()),
+        # Collapsed stacks ("thread;outer;...;inner" -> samples), heaviest first
+        "stacks": [[stack, count] for stack, count in samples.most_common(PROFILE_MAX_STACKS)],
+        "created_at": datetime.now(timezone.utc),
+    })
+
+
+def list_profiles(organization_id: str, route: Optional[str] = None, limit: int = 50) -> List[dict]:
+    query: Dict[str, Any] = {"organization_id": organization_id}
+    if route:
+        query["route"] = route
+    profiles = list(_db()["request_profiles"].find(query, {"stacks": 0}).sort("created_at", -1).limit(limit))
+    for profile in profiles:
+        profile["_id"] = str(profile["_id"])
+    return profiles
+
+
+def get_profile(organization_id: str, profile_id: str) -> Optional[dict]:
+    from bson import ObjectId
+    try:
+        profile = _db()["request_profiles"].find_one({"_id": ObjectId(profile_id), "organization_id": organization_id})
+    except Exception:
+        return None
+    if profile:
+        profile["_id"] = str(profile["_id"])
+    return profile
+
+
+def collapsed_stacks(profile: dict) -> str:
+    """Profile in the collapsed format read by flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in profile.get("stacks", []))
+
+
+# ---------------- Slow-query log ----------------
+
+def query_shape(value: Any) -> Any:
+    """A filter with its values replaced by "?", keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+def _command_filter(command_name: str, command: dict) -> Any:
+    if command_name in ("find", "count", "distinct"):
+        return command.get("filter") or command.get("query") or {}
+    if command_name == "aggregate":
+        return command.get("pipeline", [])
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        return statements[0].get("q", {}) if statements else {}
+    if command_name == "findAndModify":
+        return command.get("query", {})
+    return {}
+
+
+def _docs_returned(command_name: str, reply: dict) -> Optional[int]:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", []))
+    if command_name in ("count", "update", "delete", "insert"):
+        return reply.get("n")
+    if command_name == "distinct":
+        return len(reply.get("values", []))
+    return None
+
+
+def _explain(entry: dict):
+    command = entry.pop("_command", None)
+    if not SLOW_QUERY_EXPLAIN or command is None:
+        return
+    shape_key = (entry["database"], entry.get("collection"), entry["command"], entry.get("shape"))
+    now = time.monotonic()
+    last = _explained.get(shape_key)
+    if last is not None and now - last < SLOW_QUERY_EXPLAIN_INTERVAL_S:
+        return
+    if len(_explained) >= EXPLAINED_SHAPES_MAX:
+        _explained.clear()
+    _explained[shape_key] = now
+    explainable = {key: value for key, value in command.items()
+                   if not key.startswith("$") and key not in ("lsid", "txnNumber", "signature", "cursor")}
+    if entry["command"] == "aggregate":
+        explainable["cursor"] = {}
+    try:
+        plan = _db().client[entry["database"]].command({"explain": explainable, "verbosity": "executionStats"})
+    except Exception as exc:
+        entry["explain_error"] = str(exc)
+        return
+    stats = plan.get("executionStats")
+    if stats is None:
+        # Aggregations report per stage; the $cursor stage holds the query stats
+        for stage in plan.get("stages", []):
+            stats = (stage.get("$cursor") or {}).get("executionStats")
+            if stats:
+                break
+    if stats:
+        entry["docs_examined"] = stats.get("totalDocsExamined")
+        entry["keys_examined"] = stats.get("totalKeysExamined")
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Logs MongoDB commands slower than SLOW_QUERY_MS; registered on the MongoClient"""
+
+    def __init__(self):
+        # (request_id, operation_id) -> started command, kept until it finishes
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        if SLOW_QUERY_MS < 0 or event.command_name in IGNORED_COMMANDS or getattr(_local, "suppress", False):
+            return
+        self._pending[(event.request_id, event.operation_id)] = (event.command, event.database_name)
+
+    def succeeded(self, event):
+        started = self._pending.pop((event.request_id, event.operation_id), None)
+        if started is None or event.duration_micros < SLOW_QUERY_MS * 1000:
+            return
+        command, database = started
+        collection = command.get(event.command_name)
+        context = request_context.get() or {}
+        claims = context.get("claims") or {}
+        scope = context.get("scope") or {}
+        _enqueue("slow_query", {
+            "organization_id": claims.get("org_id"),
+            "route": route_template(scope) if scope else None,
+            "database": database,
+            "collection": collection if isinstance(collection, str) else None,
+            "command": event.command_name,
+            # Stored as text: filter shapes are full of "$" operator keys
+            "shape": json.dumps(query_shape(_command_filter(event.command_name, command)), default=str),
+            "duration_ms": round(event.duration_micros / 1000, 2),
+            "docs_returned": _docs_returned(event.command_name, event.reply or {}),
+            "created_at": datetime.now(timezone.utc),
+            "_command": command if event.command_name in EXPLAINABLE_COMMANDS else None,
+        })
+
+    def failed(self, event):
+        self._pending.pop((event.request_id, event.operation_id), None)
+
+
+def list_slow_queries(organization_id: str, limit: int = 100, min_ms: Optional[float] = None) -> List[dict]:
+    query: Dict[str, Any] = {"organization_id": organization_id}
+    if min_ms is not None:
+        query["duration_ms"] = {"$gte": min_ms}
+    entries = list(_db()["slow_queries"].find(query).sort("created_at", -1).limit(limit))
+    for entry in entries:
+        entry["_id"] = str(entry["_id"])
+    return entries
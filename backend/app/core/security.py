@@ -1,5 +1,12 @@
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 import os
@@ -9,6 +16,22 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")   # fallback
 ALGORITHM = os.getenv("ALGORITHM", "HS256")        # fallback
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+FILE_URL_SECRET = os.getenv("FILE_URL_SECRET", SECRET_KEY)
+FILE_URL_TTL_SECONDS = int(os.getenv("FILE_URL_TTL_SECONDS", "3600"))
+# Verified tokens kept in memory, keyed by digest, until they expire
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+# How often each process picks up tokens revoked by the others
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", "5"))
+
+logger = logging.getLogger("chatapp.security")
+
+_claims_cache: "OrderedDict[str, Tuple[dict, Optional[float]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+# Revoked token digest -> token expiry; entries are dropped once the token
+# would have expired anyway
+_revoked: Dict[str, float] = {}
+_revocations_synced_at = 0.0
+_revocations_seen_until: Optional[datetime] = None
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     """Generate JWT access token"""
@@ -17,10 +40,114 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _revoked_tokens_collection():
+    from ..config import db
+    return db["revoked_tokens"]
+
+def ensure_revoked_token_indexes():
+    collection = _revoked_tokens_collection()
+    collection.create_index("expires_at", expireAfterSeconds=0)
+    collection.create_index("revoked_at")
+
+def _sync_revocations(now: float):
+    """Pull revocations made by other processes, at most every TOKEN_REVOCATION_SYNC_SECONDS"""
+    global _revocations_synced_at, _revocations_seen_until
+    if now - _revocations_synced_at < TOKEN_REVOCATION_SYNC_SECONDS:
+        return
+    _revocations_synced_at = now
+    # Overlap the previous window so a revocation written with a slightly
+    # older clock on another server is not skipped
+    query = {"revoked_at": {"$gt": _revocations_seen_until - timedelta(minutes=1)}} if _revocations_seen_until else {}
+    try:
+        for entry in _revoked_tokens_collection().find(query, {"expires_at": 1, "revoked_at": 1}):
+            expires_at = entry["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+            _revoked[entry["_id"]] = expires_at
+            revoked_at = entry["revoked_at"].replace(tzinfo=timezone.utc)
+            if _revocations_seen_until is None or revoked_at > _revocations_seen_until:
+                _revocations_seen_until = revoked_at
+    except Exception as exc:
+        logger.warning("Failed to sync revoked tokens: %s", exc)
+    for digest, expires_at in list(_revoked.items()):
+        if expires_at <= now:
+            _revoked.pop(digest, None)
+
+def _forget(digest: str):
+    with _cache_lock:
+        _claims_cache.pop(digest, None)
+
 def decode_access_token(token: str):
-    """Decode JWT token and return payload"""
+    """Decode JWT token and return payload.
+
+    Verified claims are cached until the token's exp, so repeat requests with
+    the same token skip signature verification; revoked tokens are rejected.
+    """
+    now = time.time()
+    digest = token_digest(token)
+    _sync_revocations(now)
+    if digest in _revoked:
+        return None
+    with _cache_lock:
+        cached = _claims_cache.get(digest)
+        if cached is not None:
+            _claims_cache.move_to_end(digest)
+    if cached is not None:
+        payload, expires_at = cached
+        if expires_at is None or expires_at > now:
+            return dict(payload)
+        _forget(digest)
+        return None
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    expires_at = payload.get("exp")
+    with _cache_lock:
+        _claims_cache[digest] = (payload, float(expires_at) if expires_at is not None else None)
+        if len(_claims_cache) > JWT_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+    return dict(payload)
+
+def revoke_access_token(token: str) -> bool:
+    """Reject a token from now on, in every process; returns False if it was not valid"""
+    payload = decode_access_token(token)
+    if payload is None:
+        return False
+    digest = token_digest(token)
+    exp = payload.get("exp")
+    expires_at = datetime.fromtimestamp(exp, timezone.utc) if exp else datetime.now(timezone.utc) + timedelta(days=30)
+    _revoked[digest] = expires_at.timestamp()
+    _forget(digest)
+    _revoked_tokens_collection().update_one(
+        {"_id": digest},
+        {"$set": {"expires_at": expires_at, "revoked_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    return True
+
+
+def _file_signature(path: str, exp: int, chat_id: str) -> str:
+    message = f"{path}\n{exp}\n{chat_id}".encode()
+    return hmac.new(FILE_URL_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+def sign_file_path(path: str, chat_id: str | None = None, now: float | None = None) -> dict:
+    """Return the query parameters that authorize access to a file path.
+
+    Expiry is rounded up to a TTL boundary so the same file signed within one
+    window gets the same URL and stays cacheable by the browser; links are
+    valid for between one and two TTLs.
+    """
+    now = time.time() if now is None else now
+    exp = (int(now) // FILE_URL_TTL_SECONDS + 2) * FILE_URL_TTL_SECONDS
+    params = {"exp": str(exp), "sig": _file_signature(path, exp, chat_id or "")}
+    if chat_id:
+        params["cid"] = chat_id
+    return params
+
+def verify_file_signature(path: str, exp: str | None, sig: str | None, chat_id: str | None = None) -> bool:
+    """Check a signed file URL's signature and expiry"""
+    if not exp or not sig or not exp.isdigit() or int(exp) < time.time():
+        return False
+    return hmac.compare_digest(_file_signature(path, int(exp), chat_id or ""), sig)
@@ -0,0 +1,48 @@
+"""JSON encoding for API responses and WebSocket frames, backed by orjson.
+
+orjson writes datetimes itself (the same text as isoformat()) and ObjectIds
+go through _default, so Mongo documents can be returned without converting
+them field by field first.
+"""
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.encoders import ENCODERS_BY_TYPE
+from fastapi.responses import ORJSONResponse
+
+OPTIONS = orjson.OPT_NON_STR_KEYS
+# Naive datetimes from Mongo are UTC; written with a "Z" like stored message timestamps
+UTC_OPTIONS = OPTIONS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+# Routes that return plain values still go through jsonable_encoder first
+ENCODERS_BY_TYPE[ObjectId] = str
+
+loads = orjson.loads
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any, utc: bool = False) -> bytes:
+    return orjson.dumps(value, default=_default, option=UTC_OPTIONS if utc else OPTIONS)
+
+
+def dumps_text(value: Any) -> str:
+    """For send_text: the frontend expects text WebSocket frames"""
+    return dumps(value).decode()
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """The default response class. Returned directly from a route, it also
+    skips FastAPI's jsonable_encoder pass over the content."""
+
+    def __init__(self, content: Any, *args, utc: bool = False, **kwargs):
+        self.utc = utc
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content, utc=self.utc)
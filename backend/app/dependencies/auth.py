@@ -1,4 +1,4 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from ..core.security import decode_access_token
 
@@ -18,3 +18,17 @@ def get_current_admin(current_user=Depends(get_current_user)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
     return current_user
+
+def get_request_token(request: Request):
+    """Bearer token from the Authorization header, or the access_token cookie"""
+    authorization = request.headers.get("authorization")
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return request.cookies.get("access_token")
+
+def get_optional_user(request: Request):
+    """Return token claims from the Authorization header or access_token cookie, if valid"""
+    token = get_request_token(request)
+    if not token:
+        return None
+    return decode_access_token(token)
@@ -1,11 +1,15 @@
 from datetime import timedelta
+import hmac
 from fastapi import FastAPI, HTTPException, APIRouter, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from werkzeug.security import check_password_hash
-from werkzeug.security import check_password_hash as check_user_password_hash
+from .core import loop_monitor, metrics, profiling
+from .core.serialization import MongoJSONResponse, dumps_text, loads as json_loads
+from .dependencies.auth import get_optional_user
+from .core.metrics import route_template
 from .core.security import create_access_token
+from .core.passwords import verify_password_async
 from .routes.user_routes import router as user_routes
 from .routes.org_routes import router as org_routes 
 from .routes.chat_routes import router as chat_routes
@@ -13,26 +17,28 @@ from .routes.message_routes import router as message_routes
 from .routes.file_routes import router as file_routes
 from .routes.admin_routes import router as admin_routes
 from .routes.ticket_routes import router as ticket_routes
-from .config import db
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
-from .services.user_service import users_collection
-from .services.admin_service import get_admin_by_email
+from .services.admin_service import update_admin
+from .services.user_service import update_user_by_id
+from .services.identity_service import ADMINS, find_identity
 from .websocket_manager import manager
-import json
+import time
 # UNUSED IMPORT - FLAG FOR REMOVAL
 # from .services import org_service  # TODO: REMOVE - not used in this file
 load_dotenv()
 import logging
 from starlette.middleware.sessions import SessionMiddleware
 
+from .core.logging_setup import configure_logging
+
+configure_logging()
 logger = logging.getLogger("chatapp")
-if not logger.handlers:
-    logging.basicConfig(level=logging.INFO)
+access_logger = logging.getLogger("chatapp.http")
 
-app = FastAPI(title="Internal Chat Application")
+app = FastAPI(title="Internal Chat Application", default_response_class=MongoJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,6 +46,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Paged listings (GET /tickets/) return the next page's cursor here
+    expose_headers=["X-Next-Cursor"],
 )
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SESSION_SECRET", "change-me-session-secret"))
 
@@ -71,9 +79,38 @@ async def validation_exception_handler(request, exc: RequestValidationError):
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info("%s %s", request.method, request.url.path)
+    started = time.perf_counter()
     response = await call_next(request)
-    logger.info("%s %s -> %s", request.method, request.url.path, response.status_code)
+    elapsed = time.perf_counter() - started
+    route = route_template(request.scope) or "unmatched"
+    metrics.http_request_seconds.observe(elapsed, method=request.method, route=route)
+    metrics.http_requests.inc(method=request.method, route=route, status=response.status_code)
+    # One line per request; LOG_SAMPLE_RATES can thin it out per route
+    access_logger.info("%s %s -> %s", request.method, request.url.path, response.status_code, extra={
+        "method": request.method,
+        "path": request.url.path,
+        "route": route,
+        "status": response.status_code,
+        "duration_ms": round(elapsed * 1000, 2),
+    })
+    return response
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    # Tags slow queries and event loop stalls with the request's route and
+    # organization, and profiles a PROFILE_SAMPLE_RATE share of requests
+    claims = get_optional_user(request)
+    # Also kept on the scope, where the loop monitor's watchdog thread can read it
+    request.state.org_id = (claims or {}).get("org_id")
+    token = profiling.request_context.set({"scope": request.scope, "claims": claims})
+    sampler = profiling.start_profile() if profiling.should_profile() else None
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.request_context.reset(token)
+    if sampler is not None:
+        profiling.save_profile(sampler, request.scope, response.status_code, time.perf_counter() - started, claims)
     return response
 
 # include routers
@@ -93,63 +130,111 @@ def root():
 def api_root():
     return {"message": "API is working"}
 
+# When set, scrapers must send it as a bearer token; nginx also keeps
+# /api/metrics from the public side (see nginx-chatapp.conf)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Not authorized")
+    # Connection gauges are read when scraped rather than kept up to date per event
+    metrics.ws_connections.set(len(manager.active_connections))
+    metrics.ws_rooms.set(len(manager.chat_connections))
+    loop_monitor.export_percentiles()
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.on_event("startup")
 def on_startup():
+    from .services.file_service import ensure_file_indexes
+    from .services.upload_session_service import ensure_upload_session_indexes
+    from .services.ticket_service import ensure_ticket_indexes
+    from .services.ticket_timer_service import ensure_ticket_timer_indexes
+    from .services.identity_service import ensure_identity_indexes
+    from .services.message_service import ensure_message_indexes
+    from .core.security import ensure_revoked_token_indexes
+    from .core.profiling import ensure_diagnostics_indexes
+    try:
+        ensure_file_indexes()
+        ensure_upload_session_indexes()
+        ensure_ticket_indexes()
+        ensure_ticket_timer_indexes()
+        ensure_identity_indexes()
+        ensure_message_indexes()
+        ensure_revoked_token_indexes()
+        ensure_diagnostics_indexes()
+    except Exception as exc:
+        logger.warning("Failed to ensure indexes: %s", exc)
+    from .services.storage_gc_service import start_storage_gc
+    from .services.ticket_timer_service import start_ticket_timers
+    from .core.loop_monitor import start_loop_monitor
+    start_storage_gc()
+    start_ticket_timers()
+    start_loop_monitor()
     logger.info("Backend started and ready to accept requests")
 
+@app.on_event("shutdown")
+def on_shutdown():
+    from .services.thumbnail_service import shutdown_thumbnail_pool
+    from .services.storage_gc_service import stop_storage_gc
+    from .services.ticket_timer_service import stop_ticket_timers
+    from .core.passwords import shutdown_password_pool
+    from .core.loop_monitor import stop_loop_monitor
+    stop_loop_monitor()
+    shutdown_thumbnail_pool()
+    shutdown_password_pool()
+    stop_storage_gc()
+    stop_ticket_timers()
+
 router = APIRouter(prefix="/auth", tags=["Auth"])
-admin_collection = db["admins"]
 
 class AdminLogin(BaseModel):
     email: str
     password: str
 
 @router.post("/login")
-def login_admin(data: AdminLogin, response: Response):
-    # Admin login
-    admin = admin_collection.find_one({"email": data.email})
-    if admin and check_password_hash(admin["password"], data.password):
-        token = create_access_token(
-            {"sub": data.email, "role": "admin", "org_id": str(admin["organization_id"]), "user_id": str(admin["_id"])},
-            expires_delta=timedelta(hours=24)  # Extended to 24 hours to prevent frequent logouts
-        )
-        response.set_cookie("access_token", token, httponly=True, samesite="lax")
-        return {
-            "access_token": token, 
-            "token_type": "bearer", 
-            "role": "admin", 
-            "org_id": str(admin["organization_id"]),
-            "user_id": str(admin["_id"])
-        }
-
-    # User login (hashed)
-    user = users_collection.find_one({"email": data.email})
-    if user and check_user_password_hash(user["password"], data.password):
-        token = create_access_token(
-            {"sub": data.email, "role": user.get("role", "user"), "org_id": str(user.get("organization_id")), "user_id": str(user["_id"])},
-            expires_delta=timedelta(hours=24)  # Extended to 24 hours to prevent frequent logouts
-        )
-        response.set_cookie("access_token", token, httponly=True, samesite="lax")
-        return {
-            "access_token": token, 
-            "token_type": "bearer", 
-            "role": user.get("role", "user"), 
-            "org_id": str(user.get("organization_id")),
-            "user_id": str(user["_id"])
-        }
+async def login_admin(data: AdminLogin, response: Response):
+    # One lookup covers admins and users
+    identity = find_identity(data.email)
+    verified, new_hash = await verify_password_async(identity and identity.get("password"), data.password)
+    if not verified:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        if identity["collection"] == ADMINS:
+            update_admin(identity["account_id"], {"password": new_hash})
+        else:
+            update_user_by_id(identity["account_id"], {"password": new_hash})
 
-    raise HTTPException(status_code=401, detail="Invalid credentials")
+    role = identity["role"]
+    org_id = str(identity.get("organization_id"))
+    token = create_access_token(
+        {"sub": identity["email"], "role": role, "org_id": org_id, "user_id": identity["account_id"]},
+        expires_delta=timedelta(hours=24)  # Extended to 24 hours to prevent frequent logouts
+    )
+    response.set_cookie("access_token", token, httponly=True, samesite="lax")
+    return {
+        "access_token": token, 
+        "token_type": "bearer", 
+        "role": role, 
+        "org_id": org_id,
+        "user_id": identity["account_id"]
+    }
 
 # Check if email exists and whether org setup is needed
 @router.get("/check_email")
 def check_email(email: str):
-    admin = get_admin_by_email(email)
-    if admin:
-        return {"exists": True, "type": "admin", "need_org_setup": False, "org_id": str(admin.get("organization_id"))}
-    user = users_collection.find_one({"email": email})
-    if user:
-        return {"exists": True, "type": "user", "need_org_setup": user.get("organization_id") is None, "org_id": str(user.get("organization_id"))}
-    return {"exists": False, "need_org_setup": True}
+    identity = find_identity(email)
+    if identity is None:
+        return {"exists": False, "need_org_setup": True}
+    is_admin = identity["collection"] == ADMINS
+    return {
+        "exists": True,
+        "type": "admin" if is_admin else "user",
+        "need_org_setup": not is_admin and identity.get("organization_id") is None,
+        "org_id": str(identity.get("organization_id")),
+    }
 
 # Register admin and organization in one step for a brand-new email
 class RegisterAdminWithOrg(BaseModel):
@@ -163,9 +248,7 @@ class RegisterAdminWithOrg(BaseModel):
 
 @router.post("/register_admin_with_org")
 def register_admin_with_org(payload: RegisterAdminWithOrg):
-    existing_admin = get_admin_by_email(payload.email)
-    existing_user = users_collection.find_one({"email": payload.email})
-    if existing_admin or existing_user:
+    if find_identity(payload.email):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     admin_data = {
@@ -216,7 +299,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
         await websocket.close(code=4003, reason="User ID mismatch")
         return
     
-    await manager.connect(websocket, user_id)
+    await manager.connect(websocket, user_id, payload.get("org_id"))
     connected = True
     
     # Set user as online when they connect
@@ -241,7 +324,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
     try:
         while True:
             data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = json_loads(data)
             message_type = message_data.get("type")
 
             if message_type == "pong":
@@ -253,7 +336,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 logger.debug("User %s joining chat %s", user_id, chat_id)
                 await manager.join_chat(user_id, chat_id)
                 # Send confirmation back to client
-                await websocket.send_text(json.dumps({
+                await websocket.send_text(dumps_text({
                     "type": "joined_chat",
                     "chat_id": chat_id
                 }))
@@ -315,11 +398,11 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 chat_id = message_data.get("chat_id")
                 from .services.message_service import mark_messages_as_read
                 from .services.user_service import get_user_by_id
-                from .services.admin_service import get_admin_by_id
+                from .services.admin_service import get_admin
                 from datetime import datetime
                 
                 # Get username for the user
-                user = get_user_by_id(user_id) or get_admin_by_id(user_id)
+                user = get_user_by_id(user_id) or get_admin(user_id)
                 username = "User"
                 if user:
                     username = user.get("username") or user.get("first_name") or user.get("email", "User")
@@ -360,8 +443,13 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
         if connected:
             manager.disconnect(user_id)
 
-# Logout endpoint clears cookie session
+# Logout endpoint revokes the token and clears the cookie session
 @app.post("/auth/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response):
+    from .core.security import revoke_access_token
+    from .dependencies.auth import get_request_token
+    token = get_request_token(request)
+    if token:
+        revoke_access_token(token)
     response.delete_cookie("access_token")
     return {"message": "Logged out"}
\ No newline at end of file
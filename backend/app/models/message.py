@@ -15,6 +15,8 @@ class FileAttachment(BaseModel):
     file_type: str  # "image" or "document"
     file_url: str
     thumbnail_url: Optional[str] = None
+    thumbnail_status: Optional[str] = None  # "pending", "ready" or "failed"
+    renditions: Optional[Dict[str, str]] = None  # e.g. {"200_webp": url}
     size: int
 
 class ChatMessage(BaseModel):
@@ -1,19 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import PlainTextResponse
 from ..models.admin_model import Admin
 from ..models.org_model import Organization
 from ..services import admin_service
 from ..dependencies.auth import get_current_admin
-from werkzeug.security import generate_password_hash
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
 @router.post("/create")
 def create_admin(admin: Admin, org: Organization):
-    # Ensure password is hashed if not already
-    admin_payload = admin.dict()
-    if admin_payload.get("password") and not admin_payload["password"].startswith("pbkdf2:"):
-        admin_payload["password"] = generate_password_hash(admin_payload["password"])
-    admin_result, org_result = admin_service.create_admin(admin_payload, org.dict())
+    from ..services.identity_service import find_identity
+    if find_identity(admin.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    # create_admin hashes the password
+    admin_result, org_result = admin_service.create_admin(admin.dict(), org.dict())
     return {
         "admin_id": str(admin_result.inserted_id),
         "org_id": str(org_result.inserted_id),
@@ -25,6 +26,7 @@ def create_admin(admin: Admin, org: Organization):
 def get_admin_profile(current_admin=Depends(get_current_admin)):
     """Get current admin profile"""
     from ..services.admin_service import get_admin_by_email
+    from ..services.file_service import sign_account_images
     admin = get_admin_by_email(current_admin.get("sub"))
     if not admin:
         raise HTTPException(status_code=404, detail="Admin not found")
@@ -36,13 +38,14 @@ def get_admin_profile(current_admin=Depends(get_current_admin)):
     theme_preference = preferences.get("theme") or admin.get("theme_preference") or "light"
     admin["preferences"] = {**preferences, "theme": theme_preference}
     admin["theme_preference"] = theme_preference
-    return admin
+    return sign_account_images(admin)
 
 # Update admin profile
 @router.put("/profile")
 def update_admin_profile(updates: dict, current_admin=Depends(get_current_admin)):
     """Update current admin profile"""
     from ..services.admin_service import get_admin_by_email, update_admin
+    from ..services.file_service import sign_account_images
     from bson import ObjectId
     
     admin = get_admin_by_email(current_admin.get("sub"))
@@ -67,4 +70,68 @@ def update_admin_profile(updates: dict, current_admin=Depends(get_current_admin)
     updated_admin = get_admin_by_email(current_admin.get("sub"))
     updated_admin["_id"] = str(updated_admin["_id"])
     updated_admin.pop("password", None)  # Remove password from response
-    return updated_admin
+    return sign_account_images(updated_admin)
+
+# Storage usage for the admin's organization
+@router.get("/storage-usage")
+def get_storage_usage(current_admin=Depends(get_current_admin)):
+    """Get storage used by uploads in the current admin's organization"""
+    from ..services.file_service import get_storage_usage as get_org_storage_usage
+    org_id = current_admin.get("org_id")
+    if not org_id:
+        raise HTTPException(status_code=400, detail="Organization ID missing in token")
+    return get_org_storage_usage(org_id)
+
+def _admin_org_id(current_admin: dict) -> str:
+    org_id = current_admin.get("org_id")
+    if not org_id:
+        raise HTTPException(status_code=400, detail="Organization ID missing in token")
+    return org_id
+
+# Sampled request profiles (PROFILE_SAMPLE_RATE) for the admin's organization
+@router.get("/diagnostics/profiles")
+def list_request_profiles(
+    route: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_admin=Depends(get_current_admin),
+):
+    from ..core.profiling import list_profiles
+    return list_profiles(_admin_org_id(current_admin), route, limit)
+
+@router.get("/diagnostics/profiles/{profile_id}")
+def get_request_profile(
+    profile_id: str,
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    current_admin=Depends(get_current_admin),
+):
+    """A profile's stacks; format=collapsed gives flamegraph.pl / speedscope input"""
+    from ..core.profiling import get_profile, collapsed_stacks
+    profile = get_profile(_admin_org_id(current_admin), profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(collapsed_stacks(profile))
+    return profile
+
+# MongoDB commands slower than SLOW_QUERY_MS made while serving the admin's organization
+@router.get("/diagnostics/slow-queries")
+def list_slow_queries(
+    min_ms: Optional[float] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_admin=Depends(get_current_admin),
+):
+    from ..core.profiling import list_slow_queries as list_org_slow_queries
+    return list_org_slow_queries(_admin_org_id(current_admin), limit, min_ms)
+
+# Event loop lag percentiles and, with LOOP_BLOCK_DETECT on, the stacks of recent stalls.
+# Lag is process-wide (every tenant shares the loop); stalls are limited to
+# those that happened during the admin's organization's requests.
+@router.get("/diagnostics/loop")
+def get_event_loop_health(current_admin=Depends(get_current_admin)):
+    from ..core.loop_monitor import LOOP_BLOCK_DETECT, LOOP_BLOCK_THRESHOLD_MS, lag_percentiles, blocking_reports
+    return {
+        "lag": lag_percentiles(),
+        "block_detection": LOOP_BLOCK_DETECT,
+        "block_threshold_ms": LOOP_BLOCK_THRESHOLD_MS,
+        "blocked": blocking_reports(_admin_org_id(current_admin)),
+    }
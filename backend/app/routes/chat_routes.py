@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from ..models.chat import Chat
@@ -7,6 +8,7 @@ from ..services.chat_service import (
 from ..dependencies.auth import get_current_user
 
 router = APIRouter(prefix="/chats", tags=["Chats"])
+logger = logging.getLogger("chatapp.chats")
 
 # ✅ Create direct chat between two users
 @router.post("/create-direct")
@@ -17,11 +19,10 @@ def create_direct_chat(payload: dict, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="other_user_id is required")
     
     # Get current user ID from database
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    current_user_obj = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    current_user_obj = get_account_by_email(user_email)
     if not current_user_obj:
         raise HTTPException(status_code=404, detail="Current user not found")
     
@@ -76,32 +77,27 @@ def create_direct_chat(payload: dict, current_user=Depends(get_current_user)):
 @router.post("/")
 def start_chat(chat: Chat, current_user=Depends(get_current_user)):
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    print(f"DEBUG: User email from token: {user_email}")
-    print(f"DEBUG: Chat participants: {chat.participants}")
-    print(f"DEBUG: Chat org_id: {chat.organization_id}")
+    logger.debug("Creating chat for %s: participants=%s org=%s", user_email, chat.participants, chat.organization_id)
     
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
-        print(f"DEBUG: User not found for email: {user_email}")
+        logger.debug("User not found for email: %s", user_email)
         raise HTTPException(status_code=404, detail="User not found")
     
     user_id = str(user["_id"])
-    print(f"DEBUG: User ID from database: {user_id}")
     
     # Ensure user is in the chat participants and organization matches
     if user_id not in chat.participants:
-        print(f"DEBUG: User ID {user_id} not in participants {chat.participants}")
+        logger.debug("User %s not in participants %s", user_id, chat.participants)
         raise HTTPException(status_code=400, detail="You must be a participant in the chat")
     
     # Verify organization_id matches user's organization
     user_org_id = current_user.get("org_id")
-    print(f"DEBUG: User org_id from token: {user_org_id}")
     if chat.organization_id != user_org_id:
-        print(f"DEBUG: Org ID mismatch - chat: {chat.organization_id}, user: {user_org_id}")
+        logger.debug("Org mismatch creating chat: chat=%s user=%s", chat.organization_id, user_org_id)
         raise HTTPException(status_code=403, detail="Cannot create chat outside your organization")
     
     # Check if chat already exists with these participants
@@ -113,10 +109,9 @@ def start_chat(chat: Chat, current_user=Depends(get_current_user)):
     })
     
     if existing_chat:
-        print(f"DEBUG: Chat already exists: {existing_chat['_id']}")
+        logger.debug("Chat already exists: %s", existing_chat["_id"])
         return {"message": "Chat already exists", "chat_id": str(existing_chat["_id"])}
     
-    print(f"DEBUG: Creating new chat")
     chat_id = create_chat(chat)
     return {"message": "Chat created", "chat_id": chat_id}
 
@@ -124,11 +119,10 @@ def start_chat(chat: Chat, current_user=Depends(get_current_user)):
 @router.get("/my-chats")
 def fetch_my_chats(current_user=Depends(get_current_user)):
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -147,11 +141,10 @@ def fetch_chat(chat_id: str, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -195,11 +188,10 @@ def create_group_chat(payload: dict, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="At least 2 participants are required for group chat")
     
     # Get current user ID from database
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    current_user_obj = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    current_user_obj = get_account_by_email(user_email)
     if not current_user_obj:
         raise HTTPException(status_code=404, detail="Current user not found")
     
@@ -276,11 +268,10 @@ def add_members_to_group(chat_id: str, payload: dict, current_user=Depends(get_c
         raise HTTPException(status_code=400, detail="member_ids is required")
     
     # Get current user ID
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    current_user_obj = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    current_user_obj = get_account_by_email(user_email)
     if not current_user_obj:
         raise HTTPException(status_code=404, detail="Current user not found")
     
@@ -334,11 +325,10 @@ def remove_members_from_group(chat_id: str, payload: dict, current_user=Depends(
         raise HTTPException(status_code=400, detail="member_ids is required")
     
     # Get current user ID
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    current_user_obj = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    current_user_obj = get_account_by_email(user_email)
     if not current_user_obj:
         raise HTTPException(status_code=404, detail="Current user not found")
     
@@ -392,11 +382,10 @@ def update_group_info(chat_id: str, payload: dict, current_user=Depends(get_curr
     group_description = payload.get("group_description")
     
     # Get current user ID
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    current_user_obj = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    current_user_obj = get_account_by_email(user_email)
     if not current_user_obj:
         raise HTTPException(status_code=404, detail="Current user not found")
     
@@ -1,14 +1,36 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+import logging
 import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+from pydantic import BaseModel
 from ..services.file_service import (
-    validate_file, save_file, get_file_url, delete_file,
-    UPLOAD_DIR, ALLOWED_IMAGE_TYPES, ALLOWED_DOCUMENT_TYPES
+    validate_file, save_file, save_stream, get_file_url, delete_file,
+    check_file_type, get_max_size, file_too_large, get_file_record, release_file, serialize_file_record,
+    resolve_file_path, forget_resolved_path, normalize_file_path, sign_file_url, find_readable_record,
+    UPLOAD_DIR, ALLOWED_IMAGE_TYPES, ALLOWED_DOCUMENT_TYPES, MAX_PROFILE_PICTURE_SIZE
 )
-from ..dependencies.auth import get_current_user
+from ..services.thumbnail_service import get_thumbnail_status
+from ..services.upload_session_service import (
+    create_upload_session, get_upload_session, write_upload_chunk, complete_upload_session,
+    abort_upload_session, serialize_upload_session
+)
+from ..core.security import verify_file_signature
+from ..storage.factory import get_storage, storage_key
+from ..dependencies.auth import get_current_user, get_optional_user
 
 router = APIRouter(prefix="/files", tags=["Files"])
+logger = logging.getLogger("chatapp.files")
+
+def _multipart_error(exc: HTTPException, too_large_detail: Optional[str] = None) -> HTTPException:
+    """The multipart endpoints answer oversized files with 400, as before streaming;
+    413 is only used by the raw-body endpoints"""
+    if exc.status_code != 413:
+        return exc
+    return HTTPException(status_code=400, detail=too_large_detail or exc.detail)
 
 @router.get("/test")
 async def test_file_serving():
@@ -18,15 +40,15 @@ async def test_file_serving():
 async def upload_file_test(file: UploadFile = File(...)):
     """Upload a file (image or document) - TEST ENDPOINT (no auth required)"""
     try:
-        print(f"📁 Upload attempt: {file.filename}, Content-Type: {file.content_type}")
+        logger.debug("Upload attempt: %s (%s)", file.filename, file.content_type)
         
         # Validate file
         file_info = validate_file(file)
-        print(f"✅ File validation passed: {file_info}")
+        logger.debug("File validation passed: %s", file_info)
         
         # Save file
         saved_file = await save_file(file, file_info["type"])
-        print(f"💾 File saved: {saved_file}")
+        logger.debug("File saved: %s", saved_file["file_id"])
         
         # Generate URL
         file_url = get_file_url(saved_file["file_path"])
@@ -39,18 +61,20 @@ async def upload_file_test(file: UploadFile = File(...)):
             "file_type": saved_file["file_type"],
             "file_url": file_url,
             "thumbnail_url": thumbnail_url,
+            "thumbnail_status": saved_file["thumbnail_status"],
+            "signed_url": sign_file_url(file_url),
             "size": saved_file["size"],
             "uploaded_at": saved_file["uploaded_at"]
         }
         
-        print(f"🎉 Upload successful: {result}")
+        logger.info("Upload stored: %s (%s, %s bytes)", result["file_id"], result["file_type"], result["size"])
         return result
         
     except HTTPException as e:
-        print(f"❌ HTTP Exception: {e.detail}")
-        raise
+        logger.info("Upload rejected: %s", e.detail)
+        raise _multipart_error(e)
     except Exception as e:
-        print(f"❌ General Exception: {str(e)}")
+        logger.exception("Upload failed")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 @router.post("/upload")
@@ -58,17 +82,24 @@ async def upload_file(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
-    """Upload a file (image or document)"""
+    """Upload a file (image or document).
+
+    Starlette spools the whole multipart body before this handler runs, so the
+    size limit only stops the copy into storage; clients that should be cut
+    off early use /upload-stream.
+    """
     try:
-        print(f"📁 Upload attempt: {file.filename}, Content-Type: {file.content_type}, Size: {file.size if hasattr(file, 'size') else 'unknown'}")
+        logger.debug("Upload attempt: %s (%s, %s bytes)", file.filename, file.content_type, getattr(file, "size", "unknown"))
         
         # Validate file
         file_info = validate_file(file)
-        print(f"✅ File validation passed: {file_info}")
+        logger.debug("File validation passed: %s", file_info)
         
         # Save file
-        saved_file = await save_file(file, file_info["type"])
-        print(f"💾 File saved: {saved_file}")
+        saved_file = await save_file(
+            file, file_info["type"], owner_id=current_user.get("user_id"), org_id=current_user.get("org_id")
+        )
+        logger.debug("File saved: %s", saved_file["file_id"])
         
         # Generate URL
         file_url = get_file_url(saved_file["file_path"])
@@ -81,20 +112,120 @@ async def upload_file(
             "file_type": saved_file["file_type"],
             "file_url": file_url,
             "thumbnail_url": thumbnail_url,
+            "thumbnail_status": saved_file["thumbnail_status"],
+            "signed_url": sign_file_url(file_url),
             "size": saved_file["size"],
             "uploaded_at": saved_file["uploaded_at"]
         }
         
-        print(f"🎉 Upload successful: {result}")
+        logger.info("Upload stored: %s (%s, %s bytes)", result["file_id"], result["file_type"], result["size"])
         return result
         
     except HTTPException as e:
-        print(f"❌ HTTP Exception: {e.detail}")
-        raise
+        logger.info("Upload rejected: %s", e.detail)
+        raise _multipart_error(e)
     except Exception as e:
-        print(f"❌ General Exception: {str(e)}")
+        logger.exception("Upload failed")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@router.post("/upload-stream")
+async def upload_file_stream(
+    request: Request,
+    filename: str = Query(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """Upload a file sent as the raw request body.
+
+    The body is written to disk in fixed-size chunks as it arrives, and the
+    upload is aborted as soon as it exceeds the size limit for its type.
+    """
+    content_type = request.headers.get("content-type")
+    file_type = check_file_type(content_type, filename)
+    max_size = get_max_size(file_type)
+    _check_content_length(request, file_type, max_size)
+    
+    saved_file = await save_stream(
+        request.stream(), filename, content_type, file_type, max_size,
+        current_user.get("user_id"), current_user.get("org_id")
+    )
+    
+    file_url = get_file_url(saved_file["file_path"])
+    thumbnail_url = get_file_url(saved_file["thumbnail_path"]) if saved_file["thumbnail_path"] else None
+    
+    return {
+        "success": True,
+        "file_id": saved_file["file_id"],
+        "filename": saved_file["original_filename"],
+        "file_type": saved_file["file_type"],
+        "file_url": file_url,
+        "thumbnail_url": thumbnail_url,
+        "thumbnail_status": saved_file["thumbnail_status"],
+        "signed_url": sign_file_url(file_url),
+        "size": saved_file["size"],
+        "uploaded_at": saved_file["uploaded_at"]
+    }
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    size: int
+    chunk_size: Optional[int] = None
+
+@router.post("/uploads")
+async def start_resumable_upload(
+    payload: UploadSessionCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Start a resumable upload and return its upload_id and chunk layout"""
+    session = create_upload_session(
+        payload.filename, payload.content_type, payload.size,
+        current_user.get("user_id"), current_user.get("org_id"), payload.chunk_size
+    )
+    return serialize_upload_session(session)
+
+@router.get("/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Report which chunks have arrived, so a client can resume with the missing ones"""
+    return serialize_upload_session(get_upload_session(upload_id, current_user.get("user_id")))
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """Store chunk number index (0-based) sent as the raw request body"""
+    session = await write_upload_chunk(upload_id, current_user.get("user_id"), index, request.stream())
+    return serialize_upload_session(session)
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Assemble the uploaded chunks into a file"""
+    saved_file = await complete_upload_session(upload_id, current_user.get("user_id"))
+    
+    file_url = get_file_url(saved_file["file_path"])
+    thumbnail_url = get_file_url(saved_file["thumbnail_path"]) if saved_file["thumbnail_path"] else None
+    
+    return {
+        "success": True,
+        "file_id": saved_file["file_id"],
+        "filename": saved_file["original_filename"],
+        "file_type": saved_file["file_type"],
+        "file_url": file_url,
+        "thumbnail_url": thumbnail_url,
+        "thumbnail_status": saved_file["thumbnail_status"],
+        "signed_url": sign_file_url(file_url),
+        "size": saved_file["size"],
+        "uploaded_at": saved_file["uploaded_at"]
+    }
+
+@router.delete("/uploads/{upload_id}")
+async def abort_resumable_upload(upload_id: str, current_user: dict = Depends(get_current_user)):
+    """Cancel a resumable upload and discard its chunks"""
+    abort_upload_session(upload_id, current_user.get("user_id"))
+    return {"success": True, "message": "Upload cancelled"}
+
 @router.post("/upload-profile-picture")
 async def upload_profile_picture(
     file: UploadFile = File(...),
@@ -106,41 +237,13 @@ async def upload_profile_picture(
         if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Only image files are allowed for profile pictures")
         
-        # Validate file size (max 5MB for profile pictures)
-        file_content = await file.read()
-        if len(file_content) > 5 * 1024 * 1024:  # 5MB
-            raise HTTPException(status_code=400, detail="Profile picture size must be less than 5MB")
-        
-        # Reset file pointer
-        await file.seek(0)
-        
-        # Save file
-        saved_file = await save_file(file, "image")
-        
-        # Update user profile picture in database
-        from ..services.user_service import users_collection, get_user_by_email
-        from ..services.admin_service import get_admin_by_email, admin_collection
-        user_email = current_user.get("sub")
-        role = current_user.get("role", "user")
-        
-        if role == "admin":
-            admin = get_admin_by_email(user_email)
-            if not admin:
-                raise HTTPException(status_code=404, detail="Admin not found")
-            admin_collection.update_one(
-                {"_id": admin["_id"]},
-                {"$set": {"profile_picture": saved_file["file_path"]}}
-            )
-        else:
-            user = get_user_by_email(user_email)
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            users_collection.update_one(
-                {"_id": user["_id"]},
-                {"$set": {"profile_picture": saved_file["file_path"]}}
-            )
+        # Save file (max 5MB for profile pictures, enforced while streaming)
+        saved_file = await save_file(
+            file, "image", MAX_PROFILE_PICTURE_SIZE, current_user.get("user_id"), current_user.get("org_id")
+        )
+        _set_user_image("profile_picture", saved_file["file_path"], current_user)
         
-        file_url = get_file_url(saved_file["file_path"])
+        file_url = sign_file_url(get_file_url(saved_file["file_path"]))
         
         return {
             "success": True,
@@ -148,11 +251,35 @@ async def upload_profile_picture(
             "message": "Profile picture updated successfully"
         }
         
-    except HTTPException:
-        raise
+    except HTTPException as e:
+        raise _multipart_error(e, "Profile picture size must be less than 5MB")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Profile picture upload failed: {str(e)}")
 
+@router.post("/upload-profile-picture-stream")
+async def upload_profile_picture_stream(
+    request: Request,
+    filename: str = Query(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """Upload a profile picture sent as the raw request body"""
+    content_type = request.headers.get("content-type")
+    if not content_type or not content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Only image files are allowed for profile pictures")
+    _check_content_length(request, "image", MAX_PROFILE_PICTURE_SIZE)
+    
+    saved_file = await save_stream(
+        request.stream(), filename, content_type, "image", MAX_PROFILE_PICTURE_SIZE,
+        current_user.get("user_id"), current_user.get("org_id")
+    )
+    _set_user_image("profile_picture", saved_file["file_path"], current_user)
+    
+    return {
+        "success": True,
+        "profile_picture_url": sign_file_url(get_file_url(saved_file["file_path"])),
+        "message": "Profile picture updated successfully"
+    }
+
 @router.post("/upload-selfie")
 async def upload_selfie(
     file: UploadFile = File(...),
@@ -164,41 +291,13 @@ async def upload_selfie(
         if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Only image files are allowed for selfies")
         
-        # Validate file size (max 5MB for selfies)
-        file_content = await file.read()
-        if len(file_content) > 5 * 1024 * 1024:  # 5MB
-            raise HTTPException(status_code=400, detail="Selfie size must be less than 5MB")
-        
-        # Reset file pointer
-        await file.seek(0)
-        
-        # Save file
-        saved_file = await save_file(file, "image")
-        
-        # Update user selfie in database
-        from ..services.user_service import users_collection, get_user_by_email
-        from ..services.admin_service import get_admin_by_email, admin_collection
-        user_email = current_user.get("sub")
-        role = current_user.get("role", "user")
-        
-        if role == "admin":
-            admin = get_admin_by_email(user_email)
-            if not admin:
-                raise HTTPException(status_code=404, detail="Admin not found")
-            admin_collection.update_one(
-                {"_id": admin["_id"]},
-                {"$set": {"selfie": saved_file["file_path"]}}
-            )
-        else:
-            user = get_user_by_email(user_email)
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            users_collection.update_one(
-                {"_id": user["_id"]},
-                {"$set": {"selfie": saved_file["file_path"]}}
-            )
+        # Save file (max 5MB for selfies, enforced while streaming)
+        saved_file = await save_file(
+            file, "image", MAX_PROFILE_PICTURE_SIZE, current_user.get("user_id"), current_user.get("org_id")
+        )
+        _set_user_image("selfie", saved_file["file_path"], current_user)
         
-        file_url = get_file_url(saved_file["file_path"])
+        file_url = sign_file_url(get_file_url(saved_file["file_path"]))
         
         return {
             "success": True,
@@ -206,8 +305,8 @@ async def upload_selfie(
             "message": "Selfie updated successfully"
         }
         
-    except HTTPException:
-        raise
+    except HTTPException as e:
+        raise _multipart_error(e, "Selfie size must be less than 5MB")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Selfie upload failed: {str(e)}")
 
@@ -236,105 +335,304 @@ async def get_supported_file_types():
         }
     }
 
+@router.get("/thumbnail-status/{file_id}")
+async def get_thumbnail_status_endpoint(file_id: str, current_user: dict = Depends(get_current_user)):
+    """Report whether an image's thumbnails are pending, ready or failed"""
+    record = get_file_record(file_id)
+    if record:
+        status = get_thumbnail_status(record["sha256"], record["path"], record.get("thumbnail_status"))
+    else:
+        status = get_thumbnail_status(file_id, os.path.join(UPLOAD_DIR, "images", file_id))
+    return {"file_id": file_id, "thumbnail_status": status}
+
+@router.get("/meta/{file_id}")
+async def get_file_metadata(file_id: str, current_user: dict = Depends(get_current_user)):
+    """Look up an upload's metadata by file_id"""
+    record = _get_accessible_record(file_id, current_user)
+    return serialize_file_record(record)
+
+@router.get("/by-id/{file_id}")
+async def get_file_by_id(file_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Serve an upload by file_id"""
+    record = _get_accessible_record(file_id, current_user)
+    response = _serve_stored(request, storage_key(record["path"]))
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return response
+
+# Uploaded files never change once written (their names are a uuid or the
+# content hash), so clients may cache them indefinitely; private because
+# access is authorized per user
+FILE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Set when the API runs behind nginx-chatapp.conf: local files are then handed
+# to nginx with X-Accel-Redirect instead of being streamed by a uvicorn worker
+FILE_ACCEL_REDIRECT = os.getenv("FILE_ACCEL_REDIRECT", "false").lower() == "true"
+# Internal nginx location aliased to uploads/ (see nginx-chatapp.conf)
+FILES_X_ACCEL_PREFIX = os.getenv("FILES_X_ACCEL_PREFIX", "/protected-files/")
+FILE_RANGE_CHUNK_SIZE = 64 * 1024
+# Staged uploads and resumable-upload chunks are never served
+PRIVATE_FILE_FOLDERS = {"tmp", "sessions"}
+# Lifetime of the redirect to a remote backend's presigned URL
+FILE_PRESIGN_TTL_SECONDS = int(os.getenv("FILE_PRESIGN_TTL_SECONDS", "300"))
+
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.pdf': 'application/pdf',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.txt': 'text/plain',
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.ppt': 'application/vnd.ms-powerpoint',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    '.zip': 'application/zip',
+    '.csv': 'text/csv',
+    '.json': 'application/json',
+    '.xml': 'application/xml'
+}
+INLINE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
 @router.get("/{file_path:path}")
-async def get_file(file_path: str):
-    """Serve uploaded files"""
-    # Handle different path formats
-    if file_path.startswith('uploads/'):
-        file_path = file_path.replace('uploads/', '')
-    
-    # Remove leading slash if present
-    file_path = file_path.lstrip('/')
-    
-    full_path = os.path.join(UPLOAD_DIR, file_path)
-    
-    # Debug logging
-    print(f"🔍 File request: {file_path}")
-    print(f"🔍 Full path: {full_path}")
-    print(f"🔍 File exists: {os.path.exists(full_path)}")
+async def get_file(
+    file_path: str,
+    request: Request,
+    exp: Optional[str] = Query(None),
+    sig: Optional[str] = Query(None),
+    cid: Optional[str] = Query(None),
+):
+    """Serve uploaded files with validators, conditional GET and Range support.
+
+    Requests must carry a signed URL (see sign_file_url) or a valid access
+    token whose user or organization owns an upload of the file. With
+    FILE_ACCEL_REDIRECT the transfer itself is handed off to nginx.
+    """
+    file_path = normalize_file_path(file_path)
+    if file_path.split("/", 1)[0] in PRIVATE_FILE_FOLDERS:
+        raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+    if not (sig and verify_file_signature(file_path, exp, sig, cid)):
+        current_user = get_optional_user(request)
+        if not current_user:
+            raise HTTPException(status_code=401, detail="Not authorized to access this file")
+        if not find_readable_record(file_path, current_user.get("user_id"), current_user.get("org_id")):
+            raise HTTPException(status_code=403, detail="Access denied")
     
-    if not os.path.exists(full_path):
-        # Try alternative path formats
-        alt_paths = [
-            os.path.join(UPLOAD_DIR, file_path),
-            os.path.join(UPLOAD_DIR, "images", file_path),
-            os.path.join(UPLOAD_DIR, "documents", file_path),
-        ]
-        
-        for alt_path in alt_paths:
-            if os.path.exists(alt_path):
-                full_path = alt_path
-                break
-        else:
-            raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+    key = resolve_file_path(file_path)
+    response = _serve_stored(request, key) if key else None
+    if response is None:
+        forget_resolved_path(file_path)
+        raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+    return response
+
+def _serve_stored(request: Request, key: str) -> Optional[Response]:
+    """Serve a stored object, or return None if it does not exist"""
+    storage = get_storage()
+    full_path = storage.local_path(key)
+    if full_path:
+        try:
+            return _serve_file(request, full_path, os.stat(full_path), key)
+        except FileNotFoundError:
+            return None
     
+    # Remote backends serve the bytes (and Range requests) themselves
+    if not storage.exists(key):
+        return None
+    filename = os.path.basename(key)
+    url = storage.presign(
+        key, FILE_PRESIGN_TTL_SECONDS, filename, os.path.splitext(filename)[1].lower() in INLINE_EXTENSIONS
+    )
+    if url:
+        return RedirectResponse(url, status_code=307, headers={'Cache-Control': f'private, max-age={FILE_PRESIGN_TTL_SECONDS // 2}'})
+    return StreamingResponse(
+        storage.stream(key),
+        media_type=CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), 'application/octet-stream'),
+        headers={'Cache-Control': FILE_CACHE_CONTROL},
+    )
+
+def _serve_file(request: Request, full_path: str, stat_result: os.stat_result, key: str):
     # Get file extension to determine content type
     file_extension = os.path.splitext(full_path)[1].lower()
-    content_type_map = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.gif': 'image/gif',
-        '.webp': 'image/webp',
-        '.pdf': 'application/pdf',
-        '.doc': 'application/msword',
-        '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        '.txt': 'text/plain',
-        '.xls': 'application/vnd.ms-excel',
-        '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        '.ppt': 'application/vnd.ms-powerpoint',
-        '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-        '.zip': 'application/zip',
-        '.csv': 'text/csv',
-        '.json': 'application/json',
-        '.xml': 'application/xml'
-    }
-    
-    content_type = content_type_map.get(file_extension, 'application/octet-stream')
+    content_type = CONTENT_TYPES.get(file_extension, 'application/octet-stream')
     
     # Set appropriate headers for file download
     # For images, show inline; for documents, force download
-    if file_extension in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
+    if file_extension in INLINE_EXTENSIONS:
         disposition = f'inline; filename="{os.path.basename(full_path)}"'
     else:
         disposition = f'attachment; filename="{os.path.basename(full_path)}"'
     
+    etag = _file_etag(key, stat_result)
     headers = {
-        'Content-Type': content_type,
         'Content-Disposition': disposition,
-        'Cache-Control': 'no-cache, no-store, must-revalidate',
-        'Pragma': 'no-cache',
-        'Expires': '0'
+        'Cache-Control': FILE_CACHE_CONTROL,
+        'ETag': etag,
+        'Last-Modified': formatdate(stat_result.st_mtime, usegmt=True),
+        'Accept-Ranges': 'bytes',
     }
     
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers={k: headers[k] for k in ('Cache-Control', 'ETag', 'Last-Modified')})
+    
+    # Let nginx stream the bytes (and handle Range) instead of a uvicorn worker
+    if FILE_ACCEL_REDIRECT:
+        return Response(
+            media_type=content_type,
+            headers={
+                'X-Accel-Redirect': FILES_X_ACCEL_PREFIX + quote(key),
+                'Content-Disposition': disposition,
+                'Cache-Control': FILE_CACHE_CONTROL,
+            },
+        )
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, stat_result.st_size)
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={'Content-Range': f'bytes */{stat_result.st_size}', 'Accept-Ranges': 'bytes'},
+            )
+        if byte_range != (0, stat_result.st_size - 1):
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{stat_result.st_size}'
+            headers['Content-Length'] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_file_range(full_path, start, end),
+                status_code=206,
+                media_type=content_type,
+                headers=headers,
+            )
+    
     return FileResponse(
         full_path,
         media_type=content_type,
-        headers=headers
+        headers=headers,
+        stat_result=stat_result,
     )
 
+def _file_etag(key: str, stat_result: os.stat_result) -> str:
+    """Strong ETag: the content hash for stored objects, mtime/size otherwise."""
+    name = os.path.splitext(os.path.basename(key))[0]
+    if key.startswith("objects/"):
+        return f'"{name}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=" range into inclusive offsets.
+
+    Returns the whole file for range forms we do not serve (multiple ranges,
+    other units) and None when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return (0, size - 1)
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return None
+            return (max(size - length, 0), size - 1)
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return (0, size - 1)
+    if start >= size or start > end:
+        return None
+    return (start, min(end, size - 1))
+
+def _iter_file_range(full_path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(full_path, "rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(FILE_RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
 @router.delete("/{file_id}")
 async def delete_uploaded_file(
     file_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    """Delete an uploaded file"""
-    try:
-        # Find the file by ID
-        for root, dirs, files in os.walk(UPLOAD_DIR):
-            for file in files:
-                if file.startswith(file_id):
-                    file_path = os.path.join(root, file)
-                    delete_file(file_path)
-                    return {"success": True, "message": "File deleted"}
-        
+    """Delete an uploaded file (owner, or an admin of the owner's organization)"""
+    record = get_file_record(file_id)
+    if not record:
         raise HTTPException(status_code=404, detail="File not found")
-        
+    
+    is_owner = record.get("owner_id") and record["owner_id"] == current_user.get("user_id")
+    is_org_admin = current_user.get("role") == "admin" and record.get("organization_id") == current_user.get("org_id")
+    if not (is_owner or is_org_admin):
+        raise HTTPException(status_code=403, detail="Not allowed to delete this file")
+    
+    try:
+        if not release_file(file_id):
+            raise HTTPException(status_code=404, detail="File not found")
+        return {"success": True, "message": "File deleted"}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
 
+def _get_accessible_record(file_id: str, current_user: dict) -> dict:
+    """Fetch an upload record visible to the current user (same organization or owner)"""
+    record = get_file_record(file_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="File not found")
+    if record.get("owner_id") != current_user.get("user_id") and record.get("organization_id") != current_user.get("org_id"):
+        raise HTTPException(status_code=403, detail="Access denied")
+    return record
+
+def _check_content_length(request: Request, file_type: str, max_size: int):
+    """Reject an upload before reading its body when the declared length is too large."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size:
+        raise file_too_large(file_type, max_size, int(content_length))
+
+def _set_user_image(field_name: str, file_path: str, current_user: dict):
+    """Utility to store a profile/selfie image path on the current user/admin."""
+    user_email = current_user.get("sub")
+    role = current_user.get("role", "user")
+
+    if role == "admin":
+        from ..services.admin_service import get_admin_by_email, admin_collection
+        admin = get_admin_by_email(user_email)
+        if not admin:
+            raise HTTPException(status_code=404, detail="Admin not found")
+        admin_collection.update_one(
+            {"_id": admin["_id"]},
+            {"$set": {field_name: file_path}}
+        )
+    else:
+        from ..services.user_service import get_user_by_email, users_collection
+        user = get_user_by_email(user_email)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        users_collection.update_one(
+            {"_id": user["_id"]},
+            {"$set": {field_name: file_path}}
+        )
+
 def _clear_user_image(field_name: str, current_user: dict):
     """Utility to remove profile/selfie images for current user/admin."""
     user_email = current_user.get("sub")
@@ -369,6 +667,6 @@ def _clear_user_image(field_name: str, current_user: dict):
         try:
             delete_file(file_path)
         except Exception as exc:
-            print(f"Failed to delete {field_name} file {file_path}: {exc}")
+            logger.warning("Failed to delete %s file %s: %s", field_name, file_path, exc)
 
     return {"success": True, "message": f"{field_name.replace('_', ' ').title()} removed"}
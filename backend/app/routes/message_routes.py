@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 import asyncio
+import logging
 from ..models.message import ChatMessage
 from ..services.fcm_notification_service import fcm_service
 from ..services.message_service import (
@@ -9,8 +10,11 @@ from ..services.message_service import (
 )
 from ..dependencies.auth import get_current_user
 from ..services.chat_service import get_chat
+from ..services.file_service import sign_attachment
+from ..core.serialization import MongoJSONResponse
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
+logger = logging.getLogger("chatapp.messages")
 
 # Send a message in a chat
 @router.post("/send")
@@ -30,11 +34,10 @@ async def send_chat_message(message_data: dict, current_user=Depends(get_current
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -95,14 +98,16 @@ async def send_chat_message(message_data: dict, current_user=Depends(get_current
             )
         )
         
-        print(f"✅ Message sent and FCM notifications triggered for {len(recipient_ids)} users")
+        logger.debug("FCM notifications triggered for %d users", len(recipient_ids))
         
     except Exception as e:
         # Don't fail the message send if notifications fail
-        print(f"⚠️ Warning: Failed to send FCM notifications: {str(e)}")
+        logger.warning("Failed to send FCM notifications: %s", e)
     
     # ==================== END NEW CODE ====================
     
+    if created_message:
+        created_message["attachment"] = sign_attachment(created_message.get("attachment"), chat_id)
     return created_message
 
 # Get all messages for a chat
@@ -118,13 +123,12 @@ def fetch_messages(chat_id: str, current_user=Depends(get_current_user)):
     
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
     # print(f"DEBUG FETCH: User email from token: {user_email}")
     
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         # print(f"DEBUG FETCH: User not found for email: {user_email}")
         raise HTTPException(status_code=404, detail="User not found")
@@ -140,12 +144,17 @@ def fetch_messages(chat_id: str, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Access denied - not a participant")
     
     if chat.get("organization_id") != user_org_id:
-        print(f"DEBUG FETCH: Org ID mismatch - chat: {chat.get('organization_id')}, user: {user_org_id}")
+        logger.debug("Org mismatch fetching messages: chat=%s user=%s", chat.get("organization_id"), user_org_id)
         raise HTTPException(status_code=403, detail="Access denied - wrong organization")
     
-    print(f"DEBUG FETCH: All checks passed, fetching messages")
     messages = get_messages(chat_id)
-    return messages
+    # Attachments are served only through URLs signed for this chat
+    for msg in messages:
+        if msg.get("attachment"):
+            msg["attachment"] = sign_attachment(msg["attachment"], chat_id)
+    # Returned as a response so the list skips jsonable_encoder; utc keeps the
+    # "Z" on legacy datetime timestamps
+    return MongoJSONResponse(messages, utc=True)
 
 # Get a specific message
 @router.get("/{message_id}")
@@ -160,11 +169,10 @@ def fetch_message(message_id: str, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -189,11 +197,10 @@ def modify_message(message_id: str, updates: dict, current_user=Depends(get_curr
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -225,11 +232,10 @@ def remove_message(message_id: str, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -257,11 +263,10 @@ def mark_delivered(chat_id: str, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -283,11 +288,10 @@ def mark_read(chat_id: str, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -299,8 +303,8 @@ def mark_read(chat_id: str, current_user=Depends(get_current_user)):
     
     # Get username for the user
     from ..services.user_service import get_user_by_id
-    from ..services.admin_service import get_admin_by_id
-    user_obj = get_user_by_id(user_id) or get_admin_by_id(user_id)
+    from ..services.admin_service import get_admin
+    user_obj = get_user_by_id(user_id) or get_admin(user_id)
     username = "User"
     if user_obj:
         username = user_obj.get("username") or user_obj.get("first_name") or user_obj.get("email", "User")
@@ -325,11 +329,10 @@ def update_status(message_id: str, status_data: dict, current_user=Depends(get_c
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # Get user ID from database using email
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -351,8 +354,7 @@ def get_chat_unread_count(chat_id: str, current_user=Depends(get_current_user)):
     """
     Get unread message count for a specific chat.
     """
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
     from ..services.chat_service import get_chat
     from ..services.message_service import messages_collection
     
@@ -362,7 +364,7 @@ def get_chat_unread_count(chat_id: str, current_user=Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Chat not found")
     
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
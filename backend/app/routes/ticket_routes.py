@@ -1,47 +1,38 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from bson import ObjectId
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import List
+from typing import List, Optional
 from ..models.ticket_model import (
     Ticket, TicketCreate, TicketUpdate, TicketStatus,
     NoteCreate, TicketMessageCreate
 )
 from ..services.ticket_service import (
     create_ticket, get_ticket_by_id, get_ticket_by_ticket_id,
-    get_tickets_by_org, get_tickets_by_user, update_ticket,
-    add_note_to_ticket, add_message_to_ticket, delete_ticket
+    get_tickets_by_user, update_ticket,
+    add_note_to_ticket, add_message_to_ticket, delete_ticket,
+    attach_ticket_threads, get_ticket_notes, get_ticket_messages, TICKET_THREAD_LIMIT,
+    build_ticket_filter, find_tickets, count_tickets, TICKET_PAGE_SIZE, MAX_TICKET_PAGE_SIZE
 )
+from ..services.ticket_stats_service import get_ticket_stats, rebuild_ticket_stats
 from ..dependencies.auth import get_current_user, get_current_admin
 from ..services.user_service import get_user_by_id
 from ..services.admin_service import get_admin
 from ..websocket_manager import manager
+from ..core.serialization import MongoJSONResponse
 
 router = APIRouter(prefix="/tickets", tags=["Tickets"])
 
 def _serialize_ticket(ticket: dict) -> dict:
-    """Serialize ticket for JSON response"""
-    if not ticket:
-        return {}
-    serialized = {**ticket}
-    if "_id" in serialized:
-        serialized["_id"] = str(serialized["_id"])
-    # Convert datetime objects to ISO strings
-    for field in ["createdAt", "updatedAt", "travelDate"]:
-        if field in serialized and isinstance(serialized[field], datetime):
-            serialized[field] = serialized[field].isoformat()
-    # Serialize notes and communication
-    if "notes" in serialized:
-        for note in serialized["notes"]:
-            if "createdAt" in note and isinstance(note["createdAt"], datetime):
-                note["createdAt"] = note["createdAt"].isoformat()
-    if "communication" in serialized:
-        for msg in serialized["communication"]:
-            if "createdAt" in msg and isinstance(msg["createdAt"], datetime):
-                msg["createdAt"] = msg["createdAt"].isoformat()
-    return serialized
+    """Ticket for a JSON response or broadcast; ObjectId and datetime values are
+    encoded by the JSON layer (app/core/serialization)"""
+    return ticket or {}
+
+def _ticket_summary(serialized: dict) -> dict:
+    """Drop the thread and body from a serialized ticket for broadcasts"""
+    return {k: v for k, v in serialized.items() if k not in ("notes", "communication", "body")}
 
 @router.post("/create")
 async def create_new_ticket(
@@ -197,11 +188,11 @@ async def create_new_ticket(
         import asyncio
         asyncio.create_task(manager.broadcast_to_org(org_id, {
             "type": "ticket_created",
-            "ticket": _serialize_ticket(ticket)
+            "ticket": _ticket_summary(_serialize_ticket(ticket))
         }, exclude_user=created_by_id))
         
         logger.info(f"🎉 Ticket creation successful: {ticket_id}")
-        return _serialize_ticket(ticket)
+        return _serialize_ticket(attach_ticket_threads(ticket))
     except HTTPException as he:
         logger.error(f"❌ HTTPException: {he.status_code} - {he.detail}")
         raise
@@ -213,30 +204,98 @@ async def create_new_ticket(
         logger.error(f"❌ Traceback: {error_trace}")
         raise HTTPException(status_code=400, detail=f"Failed to create ticket: {error_detail}")
 
+def _resolve_org_id(current_user: dict) -> Optional[str]:
+    """Organization of the current user, from their record or else the token"""
+    user_id = current_user.get("_id") or current_user.get("user_id")
+    if not user_id:
+        return None
+    user = get_user_by_id(user_id) or get_admin(user_id)
+    if user and "organization_id" in user:
+        return user["organization_id"]
+    return current_user.get("org_id")
+
+def _ticket_filter(
+    org_id: str,
+    status: Optional[List[TicketStatus]],
+    assigned_to: Optional[str],
+    created_by: Optional[str],
+    destination: Optional[str],
+    travel_from: Optional[datetime],
+    travel_to: Optional[datetime],
+) -> dict:
+    return build_ticket_filter(
+        org_id,
+        status=[s.value for s in status] if status else None,
+        assigned_to=assigned_to,
+        created_by=created_by,
+        destination=destination,
+        travel_from=travel_from,
+        travel_to=travel_to,
+    )
+
 @router.get("/")
-async def get_my_tickets(current_user=Depends(get_current_user)):
-    """Get all tickets for the current user's organization"""
+async def get_my_tickets(
+    status: Optional[List[TicketStatus]] = Query(None),
+    assigned_to: Optional[str] = Query(None),
+    created_by: Optional[str] = Query(None),
+    destination: Optional[str] = Query(None),
+    travel_from: Optional[datetime] = Query(None, description="travelDate on or after"),
+    travel_to: Optional[datetime] = Query(None, description="travelDate on or before"),
+    limit: int = Query(TICKET_PAGE_SIZE, ge=1, le=MAX_TICKET_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    current_user=Depends(get_current_user)
+):
+    """Get tickets for the current user's organization, newest first.
+
+    All filters are optional. One page of limit tickets is returned; the
+    cursor for the next page is sent in the X-Next-Cursor header.
+    """
     try:
-        user_id = current_user.get("_id") or current_user.get("user_id")
-        if not user_id:
-            return []
-        
-        user = get_user_by_id(user_id) or get_admin(user_id)
-        if not user or "organization_id" not in user:
-            # Try using org_id from token
-            org_id = current_user.get("org_id")
-            if org_id:
-                tickets = get_tickets_by_org(org_id)
-                return [_serialize_ticket(ticket) for ticket in tickets]
+        org_id = _resolve_org_id(current_user)
+        if not org_id:
             return []
         
-        org_id = user["organization_id"]
-        tickets = get_tickets_by_org(org_id)
-        
-        return [_serialize_ticket(ticket) for ticket in tickets]
+        query = _ticket_filter(org_id, status, assigned_to, created_by, destination, travel_from, travel_to)
+        tickets, next_cursor = find_tickets(query, limit, cursor)
+        # Returned as a response so the list skips jsonable_encoder
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return MongoJSONResponse([_serialize_ticket(ticket) for ticket in tickets], headers=headers)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/stats")
+async def get_ticket_dashboard_stats(current_user=Depends(get_current_user)):
+    """Dashboard counters: tickets per status, per assignee and upcoming travel dates"""
+    org_id = _resolve_org_id(current_user)
+    if not org_id:
+        raise HTTPException(status_code=403, detail="User must belong to an organization")
+    return get_ticket_stats(org_id)
+
+@router.post("/stats/rebuild")
+async def rebuild_ticket_dashboard_stats(current_admin=Depends(get_current_admin)):
+    """Recompute the organization's dashboard counters from its tickets and report drift"""
+    org_id = current_admin.get("org_id")
+    if not org_id:
+        raise HTTPException(status_code=400, detail="Organization ID missing in token")
+    return rebuild_ticket_stats(org_id)
+
+@router.get("/count")
+async def get_ticket_count(
+    status: Optional[List[TicketStatus]] = Query(None),
+    assigned_to: Optional[str] = Query(None),
+    created_by: Optional[str] = Query(None),
+    destination: Optional[str] = Query(None),
+    travel_from: Optional[datetime] = Query(None),
+    travel_to: Optional[datetime] = Query(None),
+    current_user=Depends(get_current_user)
+):
+    """Count matching tickets, with a per-status breakdown for the desk's tabs"""
+    org_id = _resolve_org_id(current_user)
+    if not org_id:
+        return {"total": 0, "by_status": {}}
+    query = _ticket_filter(org_id, status, assigned_to, created_by, destination, travel_from, travel_to)
+    return count_tickets(query)
+
 @router.get("/my-created")
 async def get_tickets_i_created(current_user=Depends(get_current_user)):
     """Get tickets created by the current user"""
@@ -257,7 +316,7 @@ async def get_ticket(ticket_id: str, current_user=Depends(get_current_user)):
         ticket = get_ticket_by_id(ticket_id)
         if not ticket:
             # Try ticket ID format (TKT-001)
-            ticket = get_ticket_by_ticket_id(ticket_id)
+            ticket = get_ticket_by_ticket_id(ticket_id, current_user.get("org_id"))
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -280,7 +339,7 @@ async def get_ticket(ticket_id: str, current_user=Depends(get_current_user)):
         if ticket.get("organization_id") != org_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        return _serialize_ticket(ticket)
+        return _serialize_ticket(attach_ticket_threads(ticket))
     except HTTPException:
         raise
     except Exception as e:
@@ -296,7 +355,7 @@ async def update_ticket_status(
     try:
         ticket = get_ticket_by_id(ticket_id)
         if not ticket:
-            ticket = get_ticket_by_ticket_id(ticket_id)
+            ticket = get_ticket_by_ticket_id(ticket_id, current_user.get("org_id"))
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -334,14 +393,14 @@ async def update_ticket_status(
         if not success:
             raise HTTPException(status_code=400, detail="Failed to update ticket")
         
-        updated_ticket = get_ticket_by_id(str(mongo_id))
+        updated_ticket = attach_ticket_threads(get_ticket_by_id(str(mongo_id)))
         serialized = _serialize_ticket(updated_ticket)
         
         # Broadcast ticket update to organization members
         import asyncio
         asyncio.create_task(manager.broadcast_to_org(ticket.get("organization_id"), {
             "type": "ticket_updated",
-            "ticket": serialized
+            "ticket": _ticket_summary(serialized)
         }))
         
         return serialized
@@ -350,6 +409,51 @@ async def update_ticket_status(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _get_ticket_for_org(ticket_id: str, current_user: dict) -> dict:
+    """Look up a ticket by _id or TKT id and check it belongs to the caller's organization"""
+    ticket = get_ticket_by_id(ticket_id) or get_ticket_by_ticket_id(ticket_id, current_user.get("org_id"))
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    if not current_user.get("org_id") or ticket.get("organization_id") != current_user.get("org_id"):
+        raise HTTPException(status_code=403, detail="Access denied")
+    return ticket
+
+@router.get("/{ticket_id}/notes")
+async def list_ticket_notes(
+    ticket_id: str,
+    response: Response,
+    limit: int = Query(TICKET_THREAD_LIMIT, ge=1, le=200),
+    before: str = Query(None, description="Cursor from X-Next-Cursor for the previous (older) page"),
+    current_user=Depends(get_current_user)
+):
+    """Get a page of a ticket's notes, oldest first; X-Next-Cursor points at older notes"""
+    ticket = _get_ticket_for_org(ticket_id, current_user)
+    try:
+        notes, next_cursor = get_ticket_notes(str(ticket["_id"]), limit, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return notes
+
+@router.get("/{ticket_id}/messages")
+async def list_ticket_messages(
+    ticket_id: str,
+    response: Response,
+    limit: int = Query(TICKET_THREAD_LIMIT, ge=1, le=200),
+    before: str = Query(None, description="Cursor from X-Next-Cursor for the previous (older) page"),
+    current_user=Depends(get_current_user)
+):
+    """Get a page of a ticket's communication, oldest first; X-Next-Cursor points at older messages"""
+    ticket = _get_ticket_for_org(ticket_id, current_user)
+    try:
+        messages, next_cursor = get_ticket_messages(str(ticket["_id"]), limit, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return messages
+
 @router.post("/{ticket_id}/notes")
 async def add_note(
     ticket_id: str,
@@ -360,7 +464,7 @@ async def add_note(
     try:
         ticket = get_ticket_by_id(ticket_id)
         if not ticket:
-            ticket = get_ticket_by_ticket_id(ticket_id)
+            ticket = get_ticket_by_ticket_id(ticket_id, current_user.get("org_id"))
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -386,14 +490,14 @@ async def add_note(
         if not success:
             raise HTTPException(status_code=400, detail="Failed to add note")
         
-        updated_ticket = get_ticket_by_id(str(mongo_id))
+        updated_ticket = attach_ticket_threads(get_ticket_by_id(str(mongo_id)))
         serialized = _serialize_ticket(updated_ticket)
         
         # Broadcast ticket update
         import asyncio
         asyncio.create_task(manager.broadcast_to_org(ticket.get("organization_id"), {
             "type": "ticket_updated",
-            "ticket": serialized
+            "ticket": _ticket_summary(serialized)
         }))
         
         return serialized
@@ -412,7 +516,7 @@ async def add_message(
     try:
         ticket = get_ticket_by_id(ticket_id)
         if not ticket:
-            ticket = get_ticket_by_ticket_id(ticket_id)
+            ticket = get_ticket_by_ticket_id(ticket_id, current_user.get("org_id"))
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -439,14 +543,14 @@ async def add_message(
         if not success:
             raise HTTPException(status_code=400, detail="Failed to add message")
         
-        updated_ticket = get_ticket_by_id(str(mongo_id))
+        updated_ticket = attach_ticket_threads(get_ticket_by_id(str(mongo_id)))
         serialized = _serialize_ticket(updated_ticket)
         
         # Broadcast ticket message update
         import asyncio
         asyncio.create_task(manager.broadcast_to_org(ticket.get("organization_id"), {
             "type": "ticket_message_added",
-            "ticket": serialized
+            "ticket": _ticket_summary(serialized)
         }))
         
         return serialized
@@ -464,7 +568,7 @@ async def delete_ticket_endpoint(
     try:
         ticket = get_ticket_by_id(ticket_id)
         if not ticket:
-            ticket = get_ticket_by_ticket_id(ticket_id)
+            ticket = get_ticket_by_ticket_id(ticket_id, current_user.get("org_id"))
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -1,5 +1,6 @@
+import logging
 from fastapi import APIRouter, HTTPException, Depends
-from werkzeug.security import generate_password_hash
+from ..core.passwords import hash_password
 from ..models.user_model import User, FCMTokenUpdate, ThemePreferenceUpdate
 from bson import ObjectId, Code
 
@@ -7,6 +8,8 @@ from datetime import datetime
 from ..services.user_service import users_collection
 from ..services import user_service
 from ..services import org_service
+from ..services.file_service import sign_account_images
+from ..services.identity_service import find_identity
 from ..dependencies.auth import get_current_user, get_current_admin
 
 def _serialize_user(user: dict) -> dict:
@@ -21,18 +24,19 @@ def _serialize_user(user: dict) -> dict:
     theme_preference = preferences.get("theme") or serialized.get("theme_preference") or "light"
     serialized["preferences"] = {**preferences, "theme": theme_preference}
     serialized["theme_preference"] = theme_preference
-    return serialized
+    return sign_account_images(serialized)
 
 router = APIRouter(prefix="/users", tags=["Users"])
+logger = logging.getLogger("chatapp.users")
 # Create a new user
 @router.post("/create_user")
 def add_user(user: User):
-    existing_user =  user_service.get_user_by_email(user.email)
-    if existing_user:
+    # Any admin or user, whatever the case of the email
+    if find_identity(user.email):
         raise HTTPException(status_code=400, detail="User already exists")
     # Hash the password before saving
     user_dict = user.dict()
-    user_dict["password"] = generate_password_hash(user_dict["password"]) 
+    user_dict["password"] = hash_password(user_dict["password"]) 
     result =  user_service.create_user(user_dict)
     return {"message": "User created", "user_id": str(result.inserted_id)}
 
@@ -40,16 +44,15 @@ def add_user(user: User):
 @router.get("/")
 def list_all_users():
     users =  user_service.list_users()
-    return users
+    return [sign_account_images(u) for u in users]
 
 # Update current user profile (requires auth)
 @router.get("/profile/me")
 def get_my_profile(current_user=Depends(get_current_user)):
-    from ..services.user_service import get_user_by_email
-    from ..services.admin_service import get_admin_by_email
+    from ..services.identity_service import get_account_by_email
 
     user_email = current_user.get("sub")
-    user = get_user_by_email(user_email) or get_admin_by_email(user_email)
+    user = get_account_by_email(user_email)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -249,13 +252,13 @@ def list_users_by_org(current_user=Depends(get_current_user)):
     # Sort by last message timestamp (most recent first)
     unique_members.sort(key=lambda user: get_last_message_timestamp(str(user["_id"])), reverse=True)
     
-    return unique_members
+    return [sign_account_images(member) for member in unique_members]
 
 # Admin-only list by org_id
 @router.get("/admin/by_org")
 def admin_list_users_by_org(org_id: str, current_admin=Depends(get_current_admin)):
     all_users = user_service.list_users()
-    return [u for u in all_users if u.get("organization_id") == org_id]
+    return [sign_account_images(u) for u in all_users if u.get("organization_id") == org_id]
 
 # Get user by email
 @router.get("/{email}")
@@ -264,7 +267,7 @@ def get_user(email: str):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user["_id"] = str(user["_id"])  # Convert ObjectId to str
-    return user
+    return sign_account_images(user)
 
 # Update user by email
 @router.put("/{email}")
@@ -305,8 +308,7 @@ def signup_with_invite(user_data: dict):
     if not org_service.consume_invite(org_id, token):
         raise HTTPException(status_code=400, detail="Invalid or expired invite")
     
-    existing_user = user_service.get_user_by_email(user_data.get("email"))
-    if existing_user:
+    if find_identity(user_data.get("email")):
         raise HTTPException(status_code=400, detail="User already exists")
     
     # Create user with organization_id
@@ -319,26 +321,25 @@ def signup_with_invite(user_data: dict):
     }
     
     # Hash the password before saving
-    user_dict["password"] = generate_password_hash(user_dict["password"])
+    user_dict["password"] = hash_password(user_dict["password"])
     result = user_service.create_user(user_dict)
     return {"message": "User created via invite", "user_id": str(result.inserted_id)}
 
 # ---------------- Admin user management (scoped to admin's organization) ----------------
 from fastapi import Depends
-from werkzeug.security import generate_password_hash
+from ..core.passwords import hash_password
 
 @router.post("/admin/create")
 def admin_create_user(payload: dict, current_admin=Depends(get_current_admin)):
     required = ["username", "email", "password"]
     if not all(k in payload and payload[k] for k in required):
         raise HTTPException(status_code=400, detail="username, email and password are required")
-    existing = user_service.get_user_by_email(payload["email"])
-    if existing:
+    if find_identity(payload["email"]):
         raise HTTPException(status_code=400, detail="User already exists")
     to_create = {
         "username": payload["username"],
         "email": payload["email"],
-        "password": generate_password_hash(payload["password"]),
+        "password": hash_password(payload["password"]),
         "role": "user",
         "organization_id": current_admin.get("org_id"),
     }
@@ -354,7 +355,7 @@ def admin_update_user(email: str, updates: dict, current_admin=Depends(get_curre
         raise HTTPException(status_code=403, detail="Not allowed")
     updates = {k: v for k, v in updates.items() if k in ["username", "password"]}
     if "password" in updates and updates["password"]:
-        updates["password"] = generate_password_hash(updates["password"])
+        updates["password"] = hash_password(updates["password"])
     result = user_service.update_user(email, updates)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
@@ -413,7 +414,7 @@ async def save_fcm_token(
             )
         
         if result.modified_count > 0 or result.matched_count > 0:
-            print(f"✅ FCM token saved for {user_email} (role: {user_role})")
+            logger.info("FCM token saved for %s (role: %s)", user_email, user_role)
             return {
                 "success": True,
                 "message": "FCM token saved successfully",
@@ -428,7 +429,7 @@ async def save_fcm_token(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error saving FCM token: {str(e)}")
+        logger.error("Error saving FCM token: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Error saving FCM token: {str(e)}"
@@ -462,13 +463,13 @@ async def delete_fcm_token(current_user=Depends(get_current_user)):
                 {"$unset": {"fcm_token": "", "fcm_token_updated_at": ""}}
             )
         
-        print(f"✅ FCM token removed for {user_email}")
+        logger.info("FCM token removed for %s", user_email)
         return {"success": True, "message": "FCM token removed successfully"}
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error deleting FCM token: {str(e)}")
+        logger.error("Error deleting FCM token: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Error deleting FCM token: {str(e)}"
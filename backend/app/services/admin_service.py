@@ -1,6 +1,7 @@
 from ..config import db
 from bson import ObjectId
-from werkzeug.security import generate_password_hash
+from ..core.passwords import hash_password
+from .identity_service import ADMINS, sync_account, touches_identity
 
 admin_collection = db["admins"]
 org_collection = db["organizations"]
@@ -16,7 +17,7 @@ def create_admin(admin_data: dict, org_data: dict):
     """
     # ensure password is hashed
     if admin_data.get("password"):
-        admin_data["password"] = generate_password_hash(admin_data["password"])
+        admin_data["password"] = hash_password(admin_data["password"])
 
     # insert admin
     admin_insert_result = admin_collection.insert_one(admin_data)
@@ -29,6 +30,7 @@ def create_admin(admin_data: dict, org_data: dict):
 
     # back-link admin to org
     admin_collection.update_one({"_id": admin_insert_result.inserted_id}, {"$set": {"organization_id": org_id_str}})
+    sync_account(ADMINS, admin_id_str)
 
     return admin_insert_result, org_insert_result
 
@@ -41,6 +43,8 @@ def get_admin(admin_id: str):
 def update_admin(admin_id: str, updates: dict):
     """Update admin by ID"""
     result = admin_collection.update_one({"_id": ObjectId(admin_id)}, {"$set": updates})
+    if result.matched_count and touches_identity(updates):
+        sync_account(ADMINS, admin_id)
     return result.modified_count > 0
 
 def get_admins_by_org(org_id: str):
@@ -6,6 +6,7 @@ from firebase_admin import credentials, messaging
 from typing import List, Dict, Optional
 import logging
 from datetime import datetime
+from ..core import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +33,7 @@ class FCMNotificationService:
                 # Normalize the path (resolve .. references)
                 key_path = os.path.normpath(key_path)
                 
-                print(f"🔍 Looking for Firebase key at: {key_path}")
+                logger.info(f"🔍 Looking for Firebase key at: {key_path}")
                 
                 if not os.path.exists(key_path):
                     raise FileNotFoundError(f"Service account key not found at: {key_path}")
@@ -159,7 +160,12 @@ class FCMNotificationService:
             )
             
             # Send message (this is VERY fast, typically <50ms)
-            response = messaging.send(message)
+            try:
+                with metrics.fcm_send_seconds.time(kind="message"):
+                    response = messaging.send(message)
+            except Exception:
+                metrics.fcm_send_failures.inc(kind="message")
+                raise
             logger.info(f"✅ FCM notification sent successfully: {response}")
             return True
             
@@ -273,6 +279,60 @@ class FCMNotificationService:
             chat_name=chat_name
         )
 
+    async def send_ticket_notification(
+        self,
+        user_ids: List[str],
+        title: str,
+        body: str,
+        ticket_id: str,
+        event_type: str
+    ) -> Dict[str, bool]:
+        """Send a ticket alert (SLA breach, upcoming travel) to the given users"""
+        from ..services.user_service import users_collection
+        from ..services.admin_service import admin_collection
+        from bson import ObjectId
+
+        results = {}
+        for user_id in user_ids:
+            try:
+                user = users_collection.find_one({"_id": ObjectId(user_id)}, {"fcm_token": 1})
+                if not user:
+                    user = admin_collection.find_one({"_id": ObjectId(user_id)}, {"fcm_token": 1})
+                if not user or not user.get("fcm_token"):
+                    results[user_id] = False
+                    continue
+
+                message = messaging.Message(
+                    token=user["fcm_token"],
+                    notification=messaging.Notification(title=title, body=body),
+                    data={
+                        'ticket_id': ticket_id,
+                        'type': event_type,
+                        'timestamp': str(datetime.now().timestamp()),
+                        'click_action': f'/tickets/{ticket_id}'
+                    },
+                    android=messaging.AndroidConfig(priority='high'),
+                    webpush=messaging.WebpushConfig(
+                        notification=messaging.WebpushNotification(
+                            title=title,
+                            body=body,
+                            icon='/icon-192.png',
+                            tag=f'{event_type}:{ticket_id}'
+                        )
+                    )
+                )
+                try:
+                    with metrics.fcm_send_seconds.time(kind="ticket"):
+                        messaging.send(message)
+                except Exception:
+                    metrics.fcm_send_failures.inc(kind="ticket")
+                    raise
+                results[user_id] = True
+            except Exception as e:
+                logger.error(f"❌ Error sending ticket notification to user {user_id}: {e}")
+                results[user_id] = False
+        return results
+
 
 # Create singleton instance
 fcm_service = FCMNotificationService()
\ No newline at end of file
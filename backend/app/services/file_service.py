@@ -1,17 +1,41 @@
+import asyncio
+import hashlib
+import logging
 import os
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from fastapi import UploadFile, HTTPException
-from PIL import Image
-import shutil
-from typing import Dict, Any
+from pymongo import ReturnDocument
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 from zoneinfo import ZoneInfo
+from urllib.parse import urlencode
+from ..config import db
+from ..core.security import sign_file_path
+from ..storage.factory import get_storage, storage_key, UPLOAD_ROOT
+from .thumbnail_service import (
+    schedule_thumbnails, thumbnail_path_for, get_thumbnail_status,
+    rendition_name, RENDITION_SIZES, RENDITION_FORMATS
+)
 
-# Create uploads directory if it doesn't exist
+# One record per upload, pointing at a shared content-addressed blob
+files_collection = db["files"]
+# One record per distinct file content (keyed by SHA-256) with a reference count
+file_blobs_collection = db["file_blobs"]
+# Per-organization storage counters (logical bytes and upload count), keyed by org id
+storage_usage_collection = db["storage_usage"]
+
+logger = logging.getLogger("chatapp.files")
+
+# Prefix of the logical file paths stored on records; the bytes live in the
+# configured storage backend (see app/storage)
 UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(f"{UPLOAD_DIR}/images", exist_ok=True)
-os.makedirs(f"{UPLOAD_DIR}/documents", exist_ok=True)
+# Content-addressed objects, sharded as objects/<ab>/<cd>/<sha256><ext>
+OBJECTS_DIR = os.path.join(UPLOAD_DIR, "objects")
+# In-flight uploads are staged on local disk; with the local backend this sits
+# under its root so finished files can be renamed into place
+TMP_DIR = os.getenv("UPLOAD_TMP_DIR", os.path.join(UPLOAD_ROOT, "tmp"))
+os.makedirs(TMP_DIR, exist_ok=True)
 
 # Allowed file types
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
@@ -56,90 +80,202 @@ def get_file_type(content_type: str, filename: str = "") -> str:
     
     return "unknown"
 
-def validate_file(file: UploadFile) -> Dict[str, Any]:
-    """Validate uploaded file and return file info"""
-    file_type = get_file_type(file.content_type, file.filename or "")
-    
+# Uploads are streamed to disk in chunks of this size, so peak memory per
+# upload stays constant regardless of file size
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+MAX_PROFILE_PICTURE_SIZE = 5 * 1024 * 1024  # 5MB
+
+def get_max_size(file_type: str) -> int:
+    """Return the upload size limit for a file type"""
+    return MAX_IMAGE_SIZE if file_type == "image" else MAX_DOCUMENT_SIZE
+
+def file_too_large(file_type: str, max_size: int, file_size: Optional[int] = None) -> HTTPException:
+    """Build the error raised when an upload exceeds its size limit"""
+    file_type_name = "image" if file_type == "image" else "document"
+    detail = f"File too large. Max size for {file_type_name}s: {max_size // (1024*1024)}MB"
+    if file_size is not None:
+        detail += f" (your file: {file_size // (1024*1024)}MB)"
+    return HTTPException(status_code=413, detail=detail)
+
+def check_file_type(content_type: Optional[str], filename: str = "") -> str:
+    """Return the file type for an upload or raise if it is not supported"""
+    file_type = get_file_type(content_type, filename or "")
     if file_type == "unknown":
         raise HTTPException(
             status_code=400, 
-            detail=f"File type {file.content_type} not supported. Supported types: Images (JPG, PNG, GIF, WebP) and Documents (PDF, DOC, DOCX, TXT, XLS, XLSX, PPT, PPTX, RTF, ZIP, CSV, JSON, XML)"
+            detail=f"File type {content_type} not supported. Supported types: Images (JPG, PNG, GIF, WebP) and Documents (PDF, DOC, DOCX, TXT, XLS, XLSX, PPT, PPTX, RTF, ZIP, CSV, JSON, XML)"
         )
+    return file_type
+
+def validate_file(file: UploadFile) -> Dict[str, Any]:
+    """Validate uploaded file and return file info.
+
+    Only the declared size is checked here; the actual byte count is enforced
+    by save_file while the upload is streamed to disk.
+    """
+    return validate_upload(file.filename, file.content_type, getattr(file, "size", None))
+
+def validate_upload(filename: Optional[str], content_type: Optional[str], file_size: Optional[int]) -> Dict[str, Any]:
+    """Validate an upload's declared name, type and size and return file info"""
+    file_type = check_file_type(content_type, filename or "")
     
-    # Check file size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    max_size = MAX_IMAGE_SIZE if file_type == "image" else MAX_DOCUMENT_SIZE
-    if file_size > max_size:
-        file_type_name = "image" if file_type == "image" else "document"
-        max_size_mb = max_size // (1024*1024)
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Max size for {file_type_name}s: {max_size_mb}MB (your file: {file_size // (1024*1024)}MB)"
-        )
+    max_size = get_max_size(file_type)
+    if file_size is not None and file_size > max_size:
+        raise file_too_large(file_type, max_size, file_size)
     
     return {
         "type": file_type,
         "size": file_size,
-        "content_type": file.content_type
+        "content_type": content_type
     }
 
-async def save_file(file: UploadFile, file_type: str) -> Dict[str, Any]:
-    """Save uploaded file and return file info"""
-    # Generate unique filename
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield an UploadFile's contents in fixed-size chunks"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+async def write_stream(chunks: AsyncIterator[bytes], dest_path: str, max_size: int, file_type: str) -> Tuple[int, str]:
+    """Write chunks to dest_path, aborting as soon as max_size is exceeded.
+
+    Returns the size and SHA-256 hex digest of the written bytes. The
+    partially written file is removed on any failure.
+    """
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(dest_path, "wb") as buffer:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise file_too_large(file_type, max_size)
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return size, digest.hexdigest()
+
+def blob_path(sha256: str, extension: str = "") -> str:
+    """Sharded storage path of a content-addressed object"""
+    return os.path.join(OBJECTS_DIR, sha256[:2], sha256[2:4], f"{sha256}{extension.lower()}")
+
+def ensure_file_indexes():
+    files_collection.create_index("sha256")
+    files_collection.create_index("path")
+    # Legacy /files/ reads resolve by path or thumbnail_path; an $or needs both indexed
+    files_collection.create_index("thumbnail_path")
+    files_collection.create_index([("owner_id", 1), ("uploaded_at", -1)])
+    files_collection.create_index([("organization_id", 1), ("uploaded_at", -1)])
+    # Storage GC: uploads never checked (null) or due for a recheck
+    files_collection.create_index([("gc_checked_at", 1), ("uploaded_at", 1)])
+
+async def save_stream(
+    chunks: AsyncIterator[bytes],
+    filename: Optional[str],
+    content_type: Optional[str],
+    file_type: str,
+    max_size: Optional[int] = None,
+    owner_id: Optional[str] = None,
+    org_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Stream an upload into the content-addressed store and return file info.
+
+    Content already in the store only gains a reference and a new upload
+    record; nothing is written to disk and no thumbnails are rendered.
+    """
     file_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(file.filename)[1] if file.filename else ""
-    filename = f"{file_id}{file_extension}"
+    file_extension = os.path.splitext(filename)[1] if filename else ""
+    tmp_path = os.path.join(TMP_DIR, f"{file_id}.part")
+    
+    size, sha256 = await write_stream(chunks, tmp_path, max_size or get_max_size(file_type), file_type)
     
-    # Determine save path
-    subfolder = "images" if file_type == "image" else "documents"
-    file_path = os.path.join(UPLOAD_DIR, subfolder, filename)
+    # Take the reference before touching storage, so a concurrent release of
+    # the last reference sees ref_count > 0 and leaves the bytes alone
+    uploaded_at = datetime.now(ZoneInfo("Asia/Kolkata"))
+    previous = file_blobs_collection.find_one_and_update(
+        {"_id": sha256},
+        {
+            "$inc": {"ref_count": 1},
+            "$setOnInsert": {
+                "path": blob_path(sha256, file_extension),
+                "size": size,
+                "file_type": file_type,
+                "content_type": content_type,
+                "created_at": uploaded_at,
+            },
+        },
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    file_path = previous["path"] if previous else blob_path(sha256, file_extension)
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Concurrent uploads of the same content write identical bytes, so
+    # whichever write lands last wins and nothing is lost
+    storage = get_storage()
+    if previous is not None and await asyncio.to_thread(storage.exists, storage_key(file_path)):
+        os.remove(tmp_path)
+    else:
+        await asyncio.to_thread(storage.put_file, storage_key(file_path), tmp_path, content_type)
     
-    # If it's an image, create thumbnail
+    # Images get renditions once per blob; duplicates reuse them
     thumbnail_path = None
+    thumbnail_status = None
+    renditions = None
     if file_type == "image":
-        try:
-            thumbnail_path = await create_thumbnail(file_path, file_id)
-        except Exception as e:
-            print(f"Failed to create thumbnail: {e}")
+        if previous is None:
+            thumbnail_path = schedule_thumbnails(file_path, sha256, owner_id, file_id)
+            thumbnail_status = "pending"
+        else:
+            thumbnail_path = thumbnail_path_for(file_path, sha256)
+            thumbnail_status = get_thumbnail_status(sha256, file_path, previous.get("thumbnail_status"))
+            renditions = previous.get("renditions")
+    
+    files_collection.insert_one({
+        "_id": file_id,
+        "sha256": sha256,
+        "owner_id": owner_id,
+        "organization_id": org_id,
+        "path": file_path,
+        "thumbnail_path": thumbnail_path,
+        "thumbnail_status": thumbnail_status,
+        "renditions": renditions,
+        "original_filename": filename,
+        "file_type": file_type,
+        "content_type": content_type,
+        "size": size,
+        "uploaded_at": uploaded_at,
+    })
+    track_storage_usage(org_id, file_type, size, 1)
     
     return {
         "file_id": file_id,
-        "original_filename": file.filename,
-        "filename": filename,
+        "original_filename": filename,
+        "filename": os.path.basename(file_path),
         "file_path": file_path,
         "thumbnail_path": thumbnail_path,
+        "thumbnail_status": thumbnail_status,
         "file_type": file_type,
-        "content_type": file.content_type,
-        "size": os.path.getsize(file_path),
-        "uploaded_at": datetime.now(ZoneInfo("Asia/Kolkata")).isoformat()
+        "content_type": content_type,
+        "size": size,
+        "sha256": sha256,
+        "uploaded_at": uploaded_at.isoformat()
     }
 
-async def create_thumbnail(image_path: str, file_id: str) -> str:
-    """Create a thumbnail for the image"""
-    try:
-        with Image.open(image_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            
-            # Create thumbnail (max 200x200)
-            img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-            
-            # Save thumbnail
-            thumbnail_path = os.path.join(UPLOAD_DIR, "images", f"{file_id}_thumb.jpg")
-            img.save(thumbnail_path, "JPEG", quality=85)
-            
-            return thumbnail_path
-    except Exception as e:
-        print(f"Error creating thumbnail: {e}")
-        return None
+async def save_file(
+    file: UploadFile,
+    file_type: str,
+    max_size: Optional[int] = None,
+    owner_id: Optional[str] = None,
+    org_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Save uploaded file and return file info"""
+    return await save_stream(
+        iter_upload_file(file), file.filename, file.content_type, file_type, max_size, owner_id, org_id
+    )
 
 def get_file_url(file_path: str) -> str:
     """Generate URL for accessing the file"""
@@ -151,15 +287,205 @@ def get_file_url(file_path: str) -> str:
     
     return f"/files/{relative_path}"
 
+def normalize_file_path(file_path: str) -> str:
+    """Path of a file relative to /files/, as requested by clients"""
+    if file_path.startswith('uploads/'):
+        file_path = file_path.replace('uploads/', '')
+    return file_path.lstrip('/')
+
+def sign_file_url(file_url: Optional[str], chat_id: Optional[str] = None) -> Optional[str]:
+    """Append a short-lived signature to a /files/ URL, optionally bound to a chat"""
+    if not file_url or not file_url.startswith("/files/"):
+        return file_url
+    base_url = file_url.split("?", 1)[0]
+    params = sign_file_path(normalize_file_path(base_url[len("/files/"):]), chat_id)
+    return f"{base_url}?{urlencode(params)}"
+
+def sign_attachment(attachment: Optional[dict], chat_id: Optional[str] = None) -> Optional[dict]:
+    """Return a copy of a message attachment with signed file URLs"""
+    if not attachment:
+        return attachment
+    signed = {**attachment}
+    signed["file_url"] = sign_file_url(attachment.get("file_url"), chat_id)
+    signed["thumbnail_url"] = sign_file_url(attachment.get("thumbnail_url"), chat_id)
+    if attachment.get("renditions"):
+        signed["renditions"] = {name: sign_file_url(url, chat_id) for name, url in attachment["renditions"].items()}
+    return signed
+
+def sign_account_images(account: Optional[dict]) -> Optional[dict]:
+    """Replace the stored profile_picture/selfie paths of a user or admin with signed URLs"""
+    if not account:
+        return account
+    for field in ("profile_picture", "selfie"):
+        path = account.get(field)
+        if path and not path.startswith("http"):
+            account[field] = sign_file_url(path if path.startswith("/files/") else get_file_url(path))
+    return account
+
+# Requested /files/ path -> storage key, so serving a file does not probe
+# several candidate locations on every request
+RESOLVED_PATH_CACHE_SIZE = 4096
+_resolved_paths: "OrderedDict[str, str]" = OrderedDict()
+
+def resolve_file_path(relative_path: str) -> Optional[str]:
+    """Map a path under /files/ to its storage key, or None if it does not exist"""
+    key = _resolved_paths.get(relative_path)
+    if key:
+        _resolved_paths.move_to_end(relative_path)
+        return key
+    if ".." in relative_path.replace("\\", "/").split("/"):
+        return None
+    storage = get_storage()
+    # Legacy URLs may omit the images/ or documents/ folder
+    for candidate in (relative_path, f"images/{relative_path}", f"documents/{relative_path}"):
+        if storage.exists(candidate):
+            _resolved_paths[relative_path] = candidate
+            if len(_resolved_paths) > RESOLVED_PATH_CACHE_SIZE:
+                _resolved_paths.popitem(last=False)
+            return candidate
+    return None
+
+def forget_resolved_path(relative_path: str):
+    _resolved_paths.pop(relative_path, None)
+
+def record_renditions(sha256: str, renditions: Optional[Dict[str, str]]):
+    """Store finished (or failed, when None) renditions on a blob and its uploads"""
+    status = "ready" if renditions is not None else "failed"
+    try:
+        blob_update = {"thumbnail_status": status}
+        if renditions is not None:
+            blob_update["renditions"] = renditions
+        file_blobs_collection.update_one({"_id": sha256}, {"$set": blob_update})
+        files_collection.update_many(
+            {"sha256": sha256},
+            {"$set": {"renditions": renditions, "thumbnail_status": status}},
+        )
+    except Exception as e:
+        logger.warning("Failed to record renditions for %s: %s", sha256, e)
+
+def get_file_record(file_id: str) -> Optional[dict]:
+    """Get the upload record for a file_id"""
+    return files_collection.find_one({"_id": file_id})
+
+def find_readable_record(relative_path: str, owner_id: Optional[str], org_id: Optional[str]) -> Optional[dict]:
+    """The upload record behind a /files/ path (an object, one of its renditions
+    or a legacy upload) that the given owner or organization may read"""
+    name = os.path.basename(relative_path)
+    sha256 = name.split("_", 1)[0].split(".", 1)[0]
+    if relative_path.startswith("objects/") and len(sha256) == 64:
+        location = {"sha256": sha256}
+    else:
+        candidates = [
+            os.path.join(UPLOAD_DIR, path)
+            for path in (relative_path, f"images/{relative_path}", f"documents/{relative_path}")
+        ]
+        location = {"$or": [{"path": {"$in": candidates}}, {"thumbnail_path": {"$in": candidates}}]}
+    readers = [{"organization_id": org_id}] if org_id else []
+    if owner_id:
+        readers.append({"owner_id": owner_id})
+    if not readers:
+        return None
+    return files_collection.find_one({"$and": [location, {"$or": readers}]}, {"_id": 1})
+
+def release_blob(sha256: str):
+    """Drop one reference to a blob, removing it from disk with the last one"""
+    blob = file_blobs_collection.find_one_and_update(
+        {"_id": sha256},
+        {"$inc": {"ref_count": -1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if blob and blob.get("ref_count", 0) <= 0:
+        # An upload may have taken a new reference since; then the record
+        # stays and so do the bytes
+        deleted = file_blobs_collection.delete_one({"_id": sha256, "ref_count": {"$lte": 0}})
+        if deleted.deleted_count == 1:
+            _remove_with_renditions(blob["path"], sha256)
+
+def release_file(file_id: str) -> bool:
+    """Delete an upload record and release its blob"""
+    record = files_collection.find_one_and_delete({"_id": file_id})
+    if not record:
+        return False
+    _release_record(record)
+    return True
+
+def track_storage_usage(org_id: Optional[str], file_type: Optional[str], size: int, count: int):
+    """Adjust an organization's storage counters by size bytes and count uploads"""
+    if not org_id:
+        return
+    try:
+        storage_usage_collection.update_one(
+            {"_id": org_id},
+            {
+                "$inc": {
+                    "bytes": size,
+                    "files": count,
+                    f"by_type.{file_type or 'other'}.bytes": size,
+                    f"by_type.{file_type or 'other'}.files": count,
+                },
+                "$set": {"updated_at": datetime.now(ZoneInfo("Asia/Kolkata"))},
+            },
+            upsert=True,
+        )
+    except Exception as e:
+        logger.warning("Failed to update storage usage for %s: %s", org_id, e)
+
+def get_storage_usage(org_id: str) -> Dict[str, Any]:
+    """Storage counters for an organization"""
+    usage = storage_usage_collection.find_one({"_id": org_id}) or {}
+    return {
+        "organization_id": org_id,
+        "bytes": usage.get("bytes", 0),
+        "files": usage.get("files", 0),
+        "by_type": usage.get("by_type", {}),
+        "updated_at": usage["updated_at"].isoformat() if usage.get("updated_at") else None,
+        "reconciled_at": usage["reconciled_at"].isoformat() if usage.get("reconciled_at") else None,
+    }
+
+def _release_record(record: dict):
+    track_storage_usage(record.get("organization_id"), record.get("file_type"), -(record.get("size") or 0), -1)
+    # Backfilled legacy files are not content-addressed and own their path
+    if record.get("legacy"):
+        _remove_with_renditions(record["path"], record["_id"])
+    else:
+        release_blob(record["sha256"])
+
+def serialize_file_record(record: dict) -> Dict[str, Any]:
+    """Client-facing view of an upload record"""
+    renditions = record.get("renditions") or {}
+    return {
+        "file_id": record["_id"],
+        "filename": record.get("original_filename"),
+        "file_type": record.get("file_type"),
+        "content_type": record.get("content_type"),
+        "size": record.get("size"),
+        "owner_id": record.get("owner_id"),
+        "file_url": get_file_url(record["path"]),
+        "thumbnail_url": get_file_url(record["thumbnail_path"]) if record.get("thumbnail_path") else None,
+        "thumbnail_status": record.get("thumbnail_status"),
+        "renditions": {name: get_file_url(path) for name, path in renditions.items()},
+        "uploaded_at": record["uploaded_at"].isoformat() if record.get("uploaded_at") else None,
+    }
+
+def _remove_with_renditions(file_path: str, rendition_key: str):
+    storage = get_storage()
+    key = storage_key(file_path)
+    storage.delete(key)
+    folder = key.rsplit("/", 1)[0] + "/" if "/" in key else ""
+    for size in RENDITION_SIZES:
+        for ext in RENDITION_FORMATS:
+            storage.delete(folder + rendition_name(rendition_key, size, ext))
+
 def delete_file(file_path: str):
     """Delete a file from storage"""
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        # Also delete thumbnail if it exists
-        if file_path.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-            thumbnail_path = file_path.replace('.', '_thumb.')
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
+        # Content-addressed objects are shared; release one upload's reference
+        record = files_collection.find_one_and_delete({"path": file_path})
+        if record:
+            _release_record(record)
+            return
+        # Legacy uuid-named files not yet backfilled, along with their renditions
+        file_id = os.path.splitext(os.path.basename(file_path))[0]
+        _remove_with_renditions(file_path, file_id)
     except Exception as e:
-        print(f"Error deleting file {file_path}: {e}")
+        logger.warning("Error deleting file %s: %s", file_path, e)
@@ -0,0 +1,129 @@
+import logging
+from typing import Iterable, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from ..config import db
+
+# One document per login email, so sign-in and "who is this token" lookups
+# are a single _id read instead of admins-then-users scans:
+#   {"_id": "<normalized email>", "email": ..., "collection": "admins"|"users",
+#    "account_id": ..., "role": ..., "organization_id": ..., "password": <hash>}
+# Kept in sync by user_service and admin_service.
+identities_collection = db["identities"]
+
+ADMINS = "admins"
+USERS = "users"
+# Account fields mirrored into the identity
+IDENTITY_FIELDS = {"email", "password", "role", "organization_id"}
+
+logger = logging.getLogger("chatapp.identities")
+
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def ensure_identity_indexes():
+    identities_collection.create_index("account_id")
+    # Accounts written before identities existed (or while a backfill was
+    # interrupted) get theirs here; accounts that already have one are skipped
+    count = backfill_missing_identities()
+    if count:
+        logger.info("Built %d identities from existing accounts", count)
+
+
+def touches_identity(updates: dict) -> bool:
+    return any(key.split(".", 1)[0] in IDENTITY_FIELDS for key in updates)
+
+
+def sync_identity(collection_name: str, account: Optional[dict]):
+    """Write an account's identity; admins win over a user with the same email.
+
+    An identity held by a different account of the same kind is left alone:
+    the email is taken, and overwriting would lock that account out.
+    """
+    if not account or not account.get("email"):
+        return
+    account_id = str(account["_id"])
+    key = normalize_email(account["email"])
+    organization_id = account.get("organization_id")
+    identity = {
+        "email": account["email"],
+        "collection": collection_name,
+        "account_id": account_id,
+        "role": "admin" if collection_name == ADMINS else account.get("role", "user"),
+        "organization_id": str(organization_id) if organization_id is not None else None,
+        "password": account.get("password"),
+    }
+    if collection_name == ADMINS:
+        query = {"_id": key, "$or": [{"collection": USERS}, {"account_id": account_id}]}
+    else:
+        query = {"_id": key, "collection": USERS, "account_id": account_id}
+    try:
+        identities_collection.update_one(query, {"$set": identity}, upsert=True)
+    except DuplicateKeyError:
+        # The email already belongs to an admin or to another account
+        logger.warning("Email of %s %s is already taken; identity not written", collection_name, account_id)
+        return
+    # The account's email changed: drop the identity under its old one
+    identities_collection.delete_many({"account_id": account_id, "_id": {"$ne": key}})
+
+
+def sync_account(collection_name: str, account_id: str):
+    """Re-read an account and refresh its identity"""
+    account = db[collection_name].find_one({"_id": ObjectId(account_id)})
+    if account is None:
+        remove_identity(collection_name, account_id)
+    else:
+        sync_identity(collection_name, account)
+
+
+def sync_account_by_email(collection_name: str, email: str):
+    account = db[collection_name].find_one({"email": email})
+    if account is not None:
+        sync_identity(collection_name, account)
+
+
+def remove_identity(collection_name: str, account_id: str):
+    removed = identities_collection.find_one_and_delete({"account_id": account_id, "collection": collection_name})
+    if removed and collection_name == ADMINS:
+        # A user with the same email becomes reachable again
+        sync_account_by_email(USERS, removed["email"])
+
+
+def find_identity(email: str) -> Optional[dict]:
+    if not email:
+        return None
+    return identities_collection.find_one({"_id": normalize_email(email)})
+
+
+def get_account_by_email(email: str) -> Optional[dict]:
+    """The admin or user document for an email, found through its identity"""
+    identity = find_identity(email)
+    if identity is None:
+        return None
+    return db[identity["collection"]].find_one({"_id": ObjectId(identity["account_id"])})
+
+
+def backfill_missing_identities(collections: Iterable[str] = (USERS, ADMINS)) -> int:
+    """Sync the accounts that have no identity yet; safe to run repeatedly"""
+    count = 0
+    for collection_name in collections:
+        synced = set(identities_collection.distinct("account_id", {"collection": collection_name}))
+        for account in db[collection_name].find({"email": {"$exists": True}}, {"_id": 1}):
+            if str(account["_id"]) not in synced:
+                sync_account(collection_name, str(account["_id"]))
+                count += 1
+    return count
+
+
+def backfill_identities(collections: Iterable[str] = (USERS, ADMINS)) -> int:
+    """Sync every account's identity; admins go last so they take precedence"""
+    count = 0
+    for collection_name in collections:
+        for account in db[collection_name].find({"email": {"$exists": True}}):
+            sync_identity(collection_name, account)
+            count += 1
+    return count
@@ -5,7 +5,16 @@ from datetime import datetime
 from ..models.message import ChatMessage
 from typing import List, Optional
 from zoneinfo import ZoneInfo
+import logging
 messages_collection = db["messages"]
+logger = logging.getLogger("chatapp.messages")
+
+def ensure_message_indexes():
+    # Messages referencing an upload, for finished thumbnail jobs and the
+    # storage GC (whose $or needs both fields indexed); most messages carry
+    # no attachment, so the indexes are sparse
+    messages_collection.create_index("attachment.file_id", sparse=True)
+    messages_collection.create_index("attachment.file_url", sparse=True)
 
 def send_message(message: ChatMessage) -> str:
     message_dict = message.dict()
@@ -13,37 +22,22 @@ def send_message(message: ChatMessage) -> str:
     timestamp = datetime.utcnow()
     message_dict["timestamp"] = timestamp.isoformat() + "Z"  # Add Z to indicate UTC
 
-    # Debug current time
-    utc_now = datetime.utcnow()
-    ist_now = datetime.now(ZoneInfo("Asia/Kolkata"))
-    
-    print(f"TIME DEBUG:")
-    print(f"  - UTC now: {utc_now}")
-    print(f"  - IST now: {ist_now}")
-    print(f"  - Storing UTC timestamp: {timestamp.isoformat()}Z")
-    print(f"  - Full message: {message_dict}")
-    
     result = messages_collection.insert_one(message_dict)
-    print(f"Message saved with ID: {result.inserted_id}")
+    # Ids and type only; message contents stay out of the logs
+    logger.debug("Message %s saved in chat %s (%s) at %s", result.inserted_id,
+                 message_dict.get("chat_id"), message_dict.get("message_type"), message_dict["timestamp"])
     return str(result.inserted_id)
 
+# Fields of a message in chat history; missing optional ones default to None
+HISTORY_FIELDS = ("chat_id", "sender_id", "message", "message_type", "attachment", "timestamp", "status",
+                  "seen_at", "seenBy", "reply_to")
+
 def get_messages(chat_id: str) -> List[dict]:
-    messages = messages_collection.find({"chat_id": chat_id}).sort("timestamp", 1)
+    """A chat's messages, oldest first, as stored: ObjectIds and legacy datetime
+    timestamps are left for the JSON layer (render with utc=True)"""
+    messages = messages_collection.find({"chat_id": chat_id}, HISTORY_FIELDS).sort("timestamp", 1)
     result = []
     for msg in messages:
-        # Handle timestamp - could be datetime object or ISO string
-        timestamp = msg["timestamp"]
-        if isinstance(timestamp, str):
-            # Already a string, use as is
-            timestamp_str = timestamp
-        elif hasattr(timestamp, 'isoformat'):
-            # Convert datetime to ISO string
-            timestamp_str = timestamp.isoformat()
-            if not timestamp_str.endswith('Z') and not '+' in timestamp_str:
-                timestamp_str += 'Z'  # Add Z if not present
-        else:
-            timestamp_str = str(timestamp)
-            
         # Normalize seenBy to always be an array
         seen_by = msg.get("seenBy")
         if isinstance(seen_by, str):
@@ -51,23 +45,12 @@ def get_messages(chat_id: str) -> List[dict]:
             seen_by = [{"user_id": seen_by, "username": "User", "seen_at": msg.get("seen_at")}]
         elif not isinstance(seen_by, list):
             seen_by = []
-        
-        processed_msg = {
-            "id": str(msg["_id"]),
-            "chat_id": msg["chat_id"],
-            "sender_id": msg["sender_id"],
-            "message": msg["message"],
-            "message_type": msg["message_type"],
-            "attachment": msg.get("attachment"),  # Include attachment data
-            "timestamp": timestamp_str,
-            "status": msg.get("status", "sent"),
-            "seen_at": msg.get("seen_at"),
-            "seenBy": seen_by,  # Always an array now
-            "reply_to": msg.get("reply_to")  # Include reply_to data
-        }
-        if processed_msg["attachment"]:
-            print(f"Message with attachment: {processed_msg['id']} - {processed_msg['attachment']}")
-        result.append(processed_msg)
+        msg["id"] = msg.pop("_id")
+        msg["seenBy"] = seen_by
+        msg.setdefault("status", "sent")
+        for field in ("attachment", "seen_at", "reply_to"):
+            msg.setdefault(field, None)
+        result.append(msg)
     return result
 
 def get_message(message_id: str) -> Optional[dict]:
@@ -120,13 +103,13 @@ def mark_messages_as_read(chat_id: str, user_id: str, username: str = None) -> i
     """
     from datetime import datetime
     from ..services.user_service import get_user_by_id
-    from ..services.admin_service import get_admin_by_id
+    from ..services.admin_service import get_admin
     
     seen_timestamp = datetime.utcnow().isoformat() + "Z"
     
     # Get username if not provided
     if not username:
-        user = get_user_by_id(user_id) or get_admin_by_id(user_id)
+        user = get_user_by_id(user_id) or get_admin(user_id)
         if user:
             username = user.get("username") or user.get("first_name", "User")
         else:
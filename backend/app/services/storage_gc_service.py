@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+from ..config import db
+from .file_service import (
+    files_collection, file_blobs_collection, storage_usage_collection,
+    get_file_url, release_file, forget_resolved_path,
+    TMP_DIR
+)
+from ..storage.base import StoredObject
+from ..storage.factory import get_storage, storage_path
+from .upload_session_service import upload_sessions_collection
+
+STORAGE_GC_ENABLED = os.getenv("STORAGE_GC_ENABLED", "true").lower() == "true"
+STORAGE_GC_INTERVAL_SECONDS = int(os.getenv("STORAGE_GC_INTERVAL_SECONDS", str(6 * 3600)))
+# Uploads are only collected once they are this old, so a file uploaded just
+# before its message or ticket reply is sent is never mistaken for an orphan
+STORAGE_GC_GRACE_HOURS = int(os.getenv("STORAGE_GC_GRACE_HOURS", "24"))
+STORAGE_GC_BATCH_SIZE = int(os.getenv("STORAGE_GC_BATCH_SIZE", "500"))
+# Uploads found referenced are skipped for this long before being checked
+# again (a message or profile image pointing at them may have gone since)
+STORAGE_GC_RECHECK_DAYS = int(os.getenv("STORAGE_GC_RECHECK_DAYS", "7"))
+
+LEGACY_FOLDERS = ("images", "documents")
+# Collections whose documents point at uploads by path
+IMAGE_FIELD_COLLECTIONS = ("users", "admins")
+IMAGE_FIELDS = ("profile_picture", "selfie")
+
+logger = logging.getLogger("chatapp.storage_gc")
+
+_task: Optional[asyncio.Task] = None
+
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def find_referenced(file_ids: List[str], paths: List[str]) -> Set[str]:
+    """Return which of the given file ids and paths are still referenced.
+
+    Messages reference uploads by file_id, profiles by stored path and ticket
+    replies by /files/ URL.
+    """
+    urls = {get_file_url(path): path for path in paths}
+    referenced: Set[str] = set()
+
+    for message in db["messages"].find(
+        {"$or": [{"attachment.file_id": {"$in": file_ids}}, {"attachment.file_url": {"$in": list(urls)}}]},
+        {"attachment.file_id": 1, "attachment.file_url": 1},
+    ):
+        attachment = message.get("attachment") or {}
+        referenced.add(attachment.get("file_id"))
+        referenced.add(urls.get(attachment.get("file_url")))
+
+    image_query = {"$or": [{field: {"$in": paths}} for field in IMAGE_FIELDS]}
+    projection = {field: 1 for field in IMAGE_FIELDS}
+    for collection_name in IMAGE_FIELD_COLLECTIONS:
+        for doc in db[collection_name].find(image_query, projection):
+            referenced.update(doc.get(field) for field in IMAGE_FIELDS)
+
+    for entry in db["ticket_messages"].find({"attachment.url": {"$in": list(urls)}}, {"attachment.url": 1}):
+        referenced.add(urls.get(entry["attachment"].get("url")))
+    # Tickets not yet moved over by migrate_ticket_threads
+    for ticket in db["tickets"].find(
+        {"communication.attachment.url": {"$in": list(urls)}},
+        {"communication.attachment.url": 1},
+    ):
+        for entry in ticket.get("communication") or []:
+            referenced.add(urls.get((entry.get("attachment") or {}).get("url")))
+
+    referenced.discard(None)
+    return referenced
+
+
+def collect_unreferenced_uploads(
+    cutoff: datetime, batch_size: int, dry_run: bool = False, recheck_days: int = STORAGE_GC_RECHECK_DAYS,
+) -> Dict[str, int]:
+    """Release upload records older than cutoff that nothing references.
+
+    Records found referenced get gc_checked_at and are left alone for
+    recheck_days, so each run only looks at new and due uploads.
+    """
+    stats = {"records_checked": 0, "records_released": 0, "bytes_released": 0}
+    checked_at = datetime.now(timezone.utc)
+    recheck_cutoff = checked_at - timedelta(days=recheck_days)
+    cursor = files_collection.find(
+        {
+            "$or": [{"gc_checked_at": None}, {"gc_checked_at": {"$lt": recheck_cutoff}}],
+            "uploaded_at": {"$lt": cutoff},
+        },
+        {"_id": 1, "path": 1, "size": 1},
+    ).batch_size(batch_size)
+    for batch in _batches(cursor, batch_size):
+        stats["records_checked"] += len(batch)
+        referenced = find_referenced([r["_id"] for r in batch], [r["path"] for r in batch])
+        kept = []
+        for record in batch:
+            if record["_id"] in referenced or record["path"] in referenced:
+                kept.append(record["_id"])
+                continue
+            if dry_run or release_file(record["_id"]):
+                stats["records_released"] += 1
+                stats["bytes_released"] += record.get("size") or 0
+                forget_resolved_path(get_file_url(record["path"])[len("/files/"):])
+        if kept and not dry_run:
+            files_collection.update_many({"_id": {"$in": kept}}, {"$set": {"gc_checked_at": checked_at}})
+    return stats
+
+
+def _walk_files(directory: str) -> Iterator[os.DirEntry]:
+    """Yield files under a local directory without building the full listing in memory"""
+    if not os.path.isdir(directory):
+        return
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def _rendition_key(key: str) -> str:
+    """Blob SHA-256 or legacy file id a stored object (or one of its renditions) belongs to"""
+    return os.path.splitext(os.path.basename(key))[0].split("_", 1)[0]
+
+
+def _remove(obj: StoredObject, stats: Dict[str, int], dry_run: bool):
+    try:
+        if not dry_run:
+            get_storage().delete(obj.key)
+        stats["disk_files_removed"] += 1
+        stats["disk_bytes_removed"] += obj.size
+    except Exception as exc:
+        logger.warning("Failed to remove orphaned object %s: %s", obj.key, exc)
+
+
+def sweep_orphaned_files(cutoff: datetime, batch_size: int, dry_run: bool = False) -> Dict[str, int]:
+    """Delete stored objects (originals, renditions, upload chunks) nothing owns any more"""
+    stats = {"disk_files_checked": 0, "disk_files_removed": 0, "disk_bytes_removed": 0}
+    cutoff_ts = cutoff.timestamp()
+    storage = get_storage()
+
+    # Partial uploads staged on this server's disk
+    for entry in _walk_files(TMP_DIR):
+        stats["disk_files_checked"] += 1
+        stat_result = entry.stat()
+        if stat_result.st_mtime < cutoff_ts:
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except OSError as exc:
+                    logger.warning("Failed to remove stale upload %s: %s", entry.path, exc)
+            stats["disk_files_removed"] += 1
+            stats["disk_bytes_removed"] += stat_result.st_size
+
+    # Chunks of resumable uploads whose session has expired
+    old_chunks = (o for o in storage.list("sessions/") if o.mtime < cutoff_ts)
+    for batch in _batches(old_chunks, batch_size):
+        stats["disk_files_checked"] += len(batch)
+        upload_ids = list({o.key.split("/")[1] for o in batch})
+        live = set(upload_sessions_collection.distinct("_id", {"_id": {"$in": upload_ids}}))
+        for obj in batch:
+            if obj.key.split("/")[1] not in live:
+                _remove(obj, stats, dry_run)
+
+    # Content-addressed objects and their renditions belong to a blob
+    old_objects = (o for o in storage.list("objects/") if o.mtime < cutoff_ts)
+    for batch in _batches(old_objects, batch_size):
+        stats["disk_files_checked"] += len(batch)
+        keys = list({_rendition_key(o.key) for o in batch})
+        live = set(file_blobs_collection.distinct("_id", {"_id": {"$in": keys}}))
+        for obj in batch:
+            if _rendition_key(obj.key) not in live:
+                _remove(obj, stats, dry_run)
+
+    # Legacy uuid-named files may not be backfilled yet, so they also survive
+    # while a message or profile still points at them
+    for folder in LEGACY_FOLDERS:
+        old_files = (o for o in storage.list(f"{folder}/") if o.mtime < cutoff_ts)
+        for batch in _batches(old_files, batch_size):
+            stats["disk_files_checked"] += len(batch)
+            keys = list({_rendition_key(o.key) for o in batch})
+            live = set(files_collection.distinct("_id", {"_id": {"$in": keys}}))
+            live |= find_referenced(keys, [storage_path(o.key) for o in batch])
+            for obj in batch:
+                if _rendition_key(obj.key) not in live and storage_path(obj.key) not in live:
+                    _remove(obj, stats, dry_run)
+    return stats
+
+
+def reconcile_storage_usage() -> int:
+    """Recompute every organization's counters from the files collection"""
+    now = datetime.now(ZoneInfo("Asia/Kolkata"))
+    totals: Dict[str, dict] = {}
+    pipeline = [
+        {"$match": {"organization_id": {"$ne": None}}},
+        {"$group": {
+            "_id": {"org": "$organization_id", "type": "$file_type"},
+            "bytes": {"$sum": "$size"},
+            "files": {"$sum": 1},
+        }},
+    ]
+    for row in files_collection.aggregate(pipeline):
+        usage = totals.setdefault(row["_id"]["org"], {"bytes": 0, "files": 0, "by_type": {}})
+        usage["bytes"] += row["bytes"]
+        usage["files"] += row["files"]
+        usage["by_type"][row["_id"]["type"] or "other"] = {"bytes": row["bytes"], "files": row["files"]}
+
+    for org_id, usage in totals.items():
+        storage_usage_collection.update_one(
+            {"_id": org_id},
+            {"$set": {**usage, "updated_at": now, "reconciled_at": now}},
+            upsert=True,
+        )
+    # Organizations whose last upload is gone
+    storage_usage_collection.update_many(
+        {"_id": {"$nin": list(totals)}},
+        {"$set": {"bytes": 0, "files": 0, "by_type": {}, "updated_at": now, "reconciled_at": now}},
+    )
+    return len(totals)
+
+
+def run_storage_gc(
+    grace_hours: int = STORAGE_GC_GRACE_HOURS,
+    batch_size: int = STORAGE_GC_BATCH_SIZE,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """Release unreferenced uploads, delete orphaned files and reconcile usage counters"""
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    stats = collect_unreferenced_uploads(cutoff, batch_size, dry_run)
+    stats.update(sweep_orphaned_files(cutoff, batch_size, dry_run))
+    if not dry_run:
+        stats["organizations"] = reconcile_storage_usage()
+    stats["duration_ms"] = int((time.perf_counter() - started) * 1000)
+    logger.info("Storage GC finished: %s", stats)
+    return stats
+
+
+async def _gc_loop():
+    while True:
+        await asyncio.sleep(STORAGE_GC_INTERVAL_SECONDS)
+        try:
+            # Blocking Mongo and filesystem work stays off the event loop
+            await asyncio.to_thread(run_storage_gc)
+        except Exception as exc:
+            logger.warning("Storage GC failed: %s", exc)
+
+
+def start_storage_gc():
+    global _task
+    if STORAGE_GC_ENABLED and _task is None:
+        _task = asyncio.get_running_loop().create_task(_gc_loop())
+
+
+def stop_storage_gc():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from PIL import Image
+
+from ..core import metrics
+from ..storage.factory import get_storage, storage_key
+
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Renditions generated for every uploaded image: longest side in px x format
+RENDITION_SIZES = (64, 200, 800)
+RENDITION_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+# The 200px JPEG keeps the legacy "<key>_thumb.jpg" name used by thumbnail_url
+THUMBNAIL_SIZE = 200
+
+logger = logging.getLogger("chatapp.thumbnails")
+
+_executor: Optional[ProcessPoolExecutor] = None
+# rendition key -> pending job info; finished jobs are dropped and recognised
+# from the thumbnail on disk, failed ones from the status stored on the record
+_jobs: Dict[str, dict] = {}
+
+
+def rendition_name(key: str, size: int, ext: str) -> str:
+    if size == THUMBNAIL_SIZE and ext == "jpg":
+        return f"{key}_thumb.jpg"
+    return f"{key}_{size}.{ext}"
+
+
+def thumbnail_path_for(image_path: str, key: str) -> str:
+    """Path the 200px JPEG thumbnail of an image will be written to"""
+    return os.path.join(os.path.dirname(image_path), rendition_name(key, THUMBNAIL_SIZE, "jpg"))
+
+
+def render_renditions(image_path: str, key: str, out_dir: Optional[str] = None) -> Dict[str, str]:
+    """Render every rendition of an image into out_dir (next to it by default), named after key.
+
+    Runs inside a worker process.
+    """
+    out_dir = out_dir or os.path.dirname(image_path)
+    renditions = {}
+    with Image.open(image_path) as img:
+        # Let JPEG decode at reduced scale when the largest rendition allows it
+        img.draft("RGB", (max(RENDITION_SIZES), max(RENDITION_SIZES)))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        # Resize from the largest rendition down so each step works on fewer pixels
+        current = img
+        for size in sorted(RENDITION_SIZES, reverse=True):
+            current = current.copy()
+            current.thumbnail((size, size), Image.Resampling.LANCZOS)
+            for ext, fmt in RENDITION_FORMATS.items():
+                path = os.path.join(out_dir, rendition_name(key, size, ext))
+                current.save(path, fmt, quality=85)
+                renditions[f"{size}_{ext}"] = path
+    return renditions
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn avoids forking the parent's MongoClient and event loop
+        _executor = ProcessPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown_thumbnail_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def get_thumbnail_status(key: str, image_path: Optional[str] = None, recorded: Optional[str] = None) -> str:
+    """Return "pending", "failed", "ready" or "missing" for an image.
+
+    recorded is the thumbnail_status stored on the file or blob record; a
+    stored "failed" is reported once no job is running and no thumbnail exists.
+    """
+    job = _jobs.get(key)
+    if job:
+        return job["status"]
+    if image_path and get_storage().exists(storage_key(thumbnail_path_for(image_path, key))):
+        return "ready"
+    return "failed" if recorded == "failed" else "missing"
+
+
+def schedule_thumbnails(
+    image_path: str,
+    key: str,
+    owner_id: Optional[str] = None,
+    file_id: Optional[str] = None,
+) -> str:
+    """Queue rendition generation for an image and return the thumbnail path.
+
+    key names the renditions (the blob's SHA-256); file_id is the upload the
+    owner knows about. The thumbnail does not exist yet; a "thumbnail_ready"
+    event is sent over the WebSocket once every rendition has been written.
+    """
+    _jobs[key] = {"status": "pending", "owner_id": owner_id}
+    asyncio.get_running_loop().create_task(_run_job(image_path, key, owner_id, file_id or key))
+    return thumbnail_path_for(image_path, key)
+
+
+async def _run_job(image_path: str, key: str, owner_id: Optional[str], file_id: str):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        renditions = await _render_into_storage(loop, image_path, key)
+    except Exception as exc:
+        metrics.thumbnail_job_seconds.observe(time.perf_counter() - started, status="failed")
+        logger.warning("Thumbnail generation failed for %s: %s", key, exc)
+        _jobs.pop(key, None)
+        from .file_service import record_renditions
+        record_renditions(key, None)
+        await _announce({"type": "thumbnail_failed", "file_id": file_id}, key, owner_id,
+                        {"attachment.thumbnail_status": "failed"})
+        return
+    elapsed = time.perf_counter() - started
+    metrics.thumbnail_job_seconds.observe(elapsed, status="ok")
+    logger.debug("Rendered %d renditions for %s in %.3fs", len(renditions), key, elapsed)
+
+    from .file_service import get_file_url, record_renditions
+    record_renditions(key, renditions)
+    urls = {name: get_file_url(path) for name, path in renditions.items()}
+    thumbnail_url = get_file_url(thumbnail_path_for(image_path, key))
+    _jobs.pop(key, None)
+    await _announce({
+        "type": "thumbnail_ready",
+        "file_id": file_id,
+        "thumbnail_url": thumbnail_url,
+        "renditions": urls,
+    }, key, owner_id, {"attachment.thumbnail_status": "ready", "attachment.renditions": urls})
+
+
+async def _render_into_storage(loop, image_path: str, key: str) -> Dict[str, str]:
+    """Render an image's renditions through the storage backend; returns logical paths"""
+    storage = get_storage()
+    source_key = storage_key(image_path)
+    folder = os.path.dirname(image_path)
+    local_path = storage.local_path(source_key)
+    if local_path:
+        rendered = await loop.run_in_executor(_get_executor(), render_renditions, local_path, key)
+        return {name: os.path.join(folder, os.path.basename(path)) for name, path in rendered.items()}
+
+    # Remote storage: render from a local copy, then upload the results
+    from .file_service import TMP_DIR
+    work_dir = tempfile.mkdtemp(prefix="thumbs-", dir=TMP_DIR)
+    try:
+        local_copy = os.path.join(work_dir, os.path.basename(image_path))
+        await asyncio.to_thread(storage.get_to_file, source_key, local_copy)
+        rendered = await loop.run_in_executor(_get_executor(), render_renditions, local_copy, key, work_dir)
+        renditions = {}
+        for name, path in rendered.items():
+            rendition_path = os.path.join(folder, os.path.basename(path))
+            content_type = "image/webp" if path.endswith(".webp") else "image/jpeg"
+            await asyncio.to_thread(storage.put_file, storage_key(rendition_path), path, content_type)
+            renditions[name] = rendition_path
+        return renditions
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+async def _announce(event: dict, key: str, owner_id: Optional[str], attachment_updates: dict):
+    """Notify the uploader and any chat whose messages already reference the blob"""
+    from ..websocket_manager import manager
+    from ..config import db
+
+    messages_collection = db["messages"]
+    try:
+        # Every upload of the same content shares these renditions
+        file_ids = db["files"].distinct("_id", {"sha256": key}) + [key]
+        query = {"attachment.file_id": {"$in": file_ids}}
+        chat_ids = messages_collection.distinct("chat_id", query)
+        messages_collection.update_many(query, {"$set": attachment_updates})
+    except Exception as exc:
+        logger.warning("Failed to update attachments for %s: %s", key, exc)
+        chat_ids = []
+
+    if owner_id:
+        await manager.send_personal_message(_sign_event(event), owner_id)
+    for chat_id in chat_ids:
+        await manager.broadcast_to_chat(_sign_event({**event, "chat_id": chat_id}, chat_id), chat_id, exclude_user=owner_id)
+
+
+def _sign_event(event: dict, chat_id: Optional[str] = None) -> dict:
+    """Copy of an event with signed rendition URLs; messages keep the plain ones"""
+    if "renditions" not in event:
+        return event
+    from .file_service import sign_file_url
+    return {
+        **event,
+        "thumbnail_url": sign_file_url(event["thumbnail_url"], chat_id),
+        "renditions": {name: sign_file_url(url, chat_id) for name, url in event["renditions"].items()},
+    }
@@ -1,27 +1,143 @@
+import logging
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from ..config import db
 from ..models.ticket_model import Ticket, TicketStatus, Note, TicketMessage
+from .ticket_stats_service import apply_ticket_change
+from .ticket_timer_service import sync_ticket_timers, TIMER_FIELDS
 
 tickets_collection = db["tickets"]
+# Notes and communication live outside the ticket document, keyed by ticket_id
+# (the ticket's Mongo _id as a string), so tickets stay small however long
+# their history grows
+ticket_notes_collection = db["ticket_notes"]
+ticket_messages_collection = db["ticket_messages"]
+# Per-organization sequences, e.g. {"_id": "ticket:<org_id>", "seq": 42}
+counters_collection = db["counters"]
 
-def create_ticket(ticket_data: dict) -> str:
-    """Create a new ticket and return its ID"""
+TICKET_ID_PREFIX = "TKT-"
+# Fields returned by ticket listings; notes, communication and body are only
+# loaded for a single ticket
+TICKET_SUMMARY_FIELDS = {
+    field: 1 for field in (
+        "id", "name", "pocName", "pocId", "mobile", "destination", "pax", "adults", "children",
+        "infants", "status", "travelDate", "createdAt", "updatedAt", "organization_id",
+        "created_by", "assigned_to", "notes_count", "messages_count", "last_activity",
+    )
+}
+LAST_ACTIVITY_PREVIEW_LENGTH = 140
+# Most recent notes/messages included with a single ticket; older ones are paged
+TICKET_THREAD_LIMIT = 50
+# Ticket desk listings are paged; GET /tickets/ without a limit returns this many
+TICKET_PAGE_SIZE = 50
+MAX_TICKET_PAGE_SIZE = 500
+# Fields the dashboard counters and alert timers depend on (see
+# ticket_stats_service and ticket_timer_service)
+TRACKED_FIELDS = {"organization_id": 1, "status": 1, "assigned_to": 1, "travelDate": 1, **TIMER_FIELDS}
+
+logger = logging.getLogger("chatapp.tickets")
+
+def _ticket_changed(organization_id: Optional[str], before: Optional[dict], after: Optional[dict]):
+    apply_ticket_change(organization_id, before, after)
+    sync_ticket_timers(before, after)
+
+def ensure_ticket_indexes():
+    ticket_notes_collection.create_index([("ticket_id", 1), ("_id", -1)])
+    ticket_messages_collection.create_index([("ticket_id", 1), ("_id", -1)])
+    # Storage GC looks up replies by the upload they attach
+    ticket_messages_collection.create_index("attachment.url", sparse=True)
+    # Ticket desk listings: organization + optional equality filter, newest
+    # first, with _id as the keyset tie-breaker
+    tickets_collection.create_index([("organization_id", 1), ("createdAt", -1), ("_id", -1)])
+    for field in ("status", "assigned_to", "created_by", "destination"):
+        tickets_collection.create_index([("organization_id", 1), (field, 1), ("createdAt", -1), ("_id", -1)])
+    tickets_collection.create_index([("organization_id", 1), ("travelDate", 1)])
+    tickets_collection.create_index([("created_by", 1), ("createdAt", -1)])
+    try:
+        tickets_collection.create_index([("organization_id", 1), ("id", 1)], unique=True)
+    except OperationFailure as exc:
+        # Ids handed out by the old count-based scheme can collide
+        logger.warning(
+            "Duplicate ticket ids prevent the unique (organization_id, id) index; "
+            "run python -m app.commands.renumber_duplicate_tickets: %s", exc
+        )
+
+def format_ticket_id(number: int) -> str:
+    return f"{TICKET_ID_PREFIX}{str(number).zfill(3)}"
+
+def _parse_ticket_number(ticket_id: Optional[str]) -> int:
+    if not ticket_id or not ticket_id.startswith(TICKET_ID_PREFIX):
+        return 0
+    try:
+        return int(ticket_id[len(TICKET_ID_PREFIX):])
+    except ValueError:
+        return 0
+
+def _seed_ticket_counter(counter_id: str, organization_id: str):
+    """Start an organization's sequence after the highest id it already uses"""
+    highest = max(
+        (_parse_ticket_number(t.get("id")) for t in tickets_collection.find({"organization_id": organization_id}, {"id": 1})),
+        default=0,
+    )
+    try:
+        counters_collection.update_one({"_id": counter_id}, {"$setOnInsert": {"seq": highest}}, upsert=True)
+    except DuplicateKeyError:
+        # Another request seeded it first
+        pass
+
+def reserve_ticket_numbers(organization_id: str, count: int = 1) -> int:
+    """Atomically reserve count consecutive ticket numbers and return the first"""
+    counter_id = f"ticket:{organization_id}"
+    counter = counters_collection.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"seq": count}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if counter is None:
+        _seed_ticket_counter(counter_id, organization_id)
+        counter = counters_collection.find_one_and_update(
+            {"_id": counter_id},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    return counter["seq"] - count + 1
+
+def _new_ticket_document(ticket_data: dict, number: int) -> dict:
     ticket_data["createdAt"] = datetime.now(ZoneInfo("Asia/Kolkata"))
     ticket_data["updatedAt"] = datetime.now(ZoneInfo("Asia/Kolkata"))
-    ticket_data["notes"] = []
-    ticket_data["communication"] = []
-    
-    # Generate ticket ID
-    count = tickets_collection.count_documents({})
-    ticket_id = f"TKT-{str(count + 1).zfill(3)}"
-    ticket_data["id"] = ticket_id
-    
-    result = tickets_collection.insert_one(ticket_data)
+    ticket_data["notes_count"] = 0
+    ticket_data["messages_count"] = 0
+    ticket_data["last_activity"] = None
+    ticket_data["id"] = format_ticket_id(number)
+    return ticket_data
+
+def create_ticket(ticket_data: dict) -> str:
+    """Create a new ticket and return its ID"""
+    number = reserve_ticket_numbers(ticket_data["organization_id"])
+    ticket = _new_ticket_document(ticket_data, number)
+    result = tickets_collection.insert_one(ticket)
+    _ticket_changed(ticket["organization_id"], None, ticket)
     return str(result.inserted_id)
 
+def create_tickets_bulk(organization_id: str, tickets_data: List[dict]) -> List[str]:
+    """Create many tickets for one organization, reserving their ids in a single round-trip"""
+    if not tickets_data:
+        return []
+    first = reserve_ticket_numbers(organization_id, len(tickets_data))
+    documents = [
+        _new_ticket_document({**ticket_data, "organization_id": organization_id}, first + offset)
+        for offset, ticket_data in enumerate(tickets_data)
+    ]
+    result = tickets_collection.insert_many(documents)
+    for ticket in documents:
+        _ticket_changed(organization_id, None, ticket)
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
 def get_ticket_by_id(ticket_id: str) -> Optional[dict]:
     """Get ticket by MongoDB _id"""
     try:
@@ -32,23 +148,106 @@ def get_ticket_by_id(ticket_id: str) -> Optional[dict]:
     except:
         return None
 
-def get_ticket_by_ticket_id(ticket_id: str) -> Optional[dict]:
-    """Get ticket by ticket ID (TKT-001 format)"""
-    ticket = tickets_collection.find_one({"id": ticket_id})
+def get_ticket_by_ticket_id(ticket_id: str, organization_id: Optional[str] = None) -> Optional[dict]:
+    """Get ticket by ticket ID (TKT-001 format); ids are only unique within an organization"""
+    query = {"id": ticket_id}
+    if organization_id:
+        query["organization_id"] = organization_id
+    ticket = tickets_collection.find_one(query)
     if ticket:
         ticket["_id"] = str(ticket["_id"])
     return ticket
 
 def get_tickets_by_org(organization_id: str) -> List[dict]:
-    """Get all tickets for an organization"""
-    tickets = list(tickets_collection.find({"organization_id": organization_id}).sort("createdAt", -1))
+    """Get summaries of all tickets for an organization"""
+    tickets = list(tickets_collection.find({"organization_id": organization_id}, TICKET_SUMMARY_FIELDS).sort("createdAt", -1))
     for ticket in tickets:
         ticket["_id"] = str(ticket["_id"])
     return tickets
 
+def build_ticket_filter(
+    organization_id: str,
+    status: Optional[List[str]] = None,
+    assigned_to: Optional[str] = None,
+    created_by: Optional[str] = None,
+    destination: Optional[str] = None,
+    travel_from: Optional[datetime] = None,
+    travel_to: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Mongo filter for an organization's tickets; every argument is optional"""
+    query: Dict[str, Any] = {"organization_id": organization_id}
+    if status:
+        query["status"] = status[0] if len(status) == 1 else {"$in": status}
+    if assigned_to:
+        query["assigned_to"] = assigned_to
+    if created_by:
+        query["created_by"] = created_by
+    if destination:
+        query["destination"] = destination
+    if travel_from or travel_to:
+        query["travelDate"] = {}
+        if travel_from:
+            query["travelDate"]["$gte"] = travel_from
+        if travel_to:
+            query["travelDate"]["$lte"] = travel_to
+    return query
+
+def encode_ticket_cursor(ticket: dict) -> str:
+    created_at = ticket["createdAt"]
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return f"{int(created_at.timestamp() * 1000)}_{ticket['_id']}"
+
+def _decode_ticket_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    millis, _, object_id = cursor.partition("_")
+    if not millis.isdigit() or not ObjectId.is_valid(object_id):
+        raise ValueError("Invalid cursor")
+    return datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc), ObjectId(object_id)
+
+def find_tickets(query: Dict[str, Any], limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Ticket summaries matching query, newest first.
+
+    With a limit, returns one page and the cursor for the next (None on the
+    last page). Pages are keyed on (createdAt, _id), so they stay stable
+    while tickets are being created and cost the same however deep they go.
+    """
+    if cursor:
+        created_at, object_id = _decode_ticket_cursor(cursor)
+        query = {**query, "$or": [
+            {"createdAt": {"$lt": created_at}},
+            {"createdAt": created_at, "_id": {"$lt": object_id}},
+        ]}
+    find = tickets_collection.find(query, TICKET_SUMMARY_FIELDS).sort([("createdAt", -1), ("_id", -1)])
+    if limit:
+        find = find.limit(limit + 1)
+    tickets = list(find)
+    next_cursor = None
+    if limit and len(tickets) > limit:
+        tickets = tickets[:limit]
+        next_cursor = encode_ticket_cursor(tickets[-1])
+    for ticket in tickets:
+        ticket["_id"] = str(ticket["_id"])
+    return tickets, next_cursor
+
+def count_tickets(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Total matching tickets and a per-status breakdown (ignoring any status filter) for tabs"""
+    by_status_query = {k: v for k, v in query.items() if k != "status"}
+    by_status = {
+        row["_id"]: row["count"]
+        for row in tickets_collection.aggregate([
+            {"$match": by_status_query},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])
+    }
+    if "status" in query:
+        total = tickets_collection.count_documents(query)
+    else:
+        total = sum(by_status.values())
+    return {"total": total, "by_status": {status.value: by_status.get(status.value, 0) for status in TicketStatus}}
+
 def get_tickets_by_user(user_id: str) -> List[dict]:
-    """Get all tickets created by a user"""
-    tickets = list(tickets_collection.find({"created_by": user_id}).sort("createdAt", -1))
+    """Get summaries of all tickets created by a user"""
+    tickets = list(tickets_collection.find({"created_by": user_id}, TICKET_SUMMARY_FIELDS).sort("createdAt", -1))
     for ticket in tickets:
         ticket["_id"] = str(ticket["_id"])
     return tickets
@@ -56,42 +255,111 @@ def get_tickets_by_user(user_id: str) -> List[dict]:
 def update_ticket(ticket_id: str, update_data: dict) -> bool:
     """Update ticket fields"""
     update_data["updatedAt"] = datetime.now(ZoneInfo("Asia/Kolkata"))
-    result = tickets_collection.update_one(
+    before = tickets_collection.find_one_and_update(
         {"_id": ObjectId(ticket_id)},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection=TRACKED_FIELDS,
+        return_document=ReturnDocument.BEFORE,
     )
-    return result.modified_count > 0
+    if before is None:
+        return False
+    _ticket_changed(before.get("organization_id"), before, {**before, **update_data})
+    return True
 
-def add_note_to_ticket(ticket_id: str, note_data: dict) -> bool:
-    """Add a note to a ticket"""
-    note_data["id"] = f"N-{int(datetime.now().timestamp() * 1000)}"
-    note_data["createdAt"] = datetime.now(ZoneInfo("Asia/Kolkata"))
-    
+def _last_activity(kind: str, entry: dict) -> dict:
+    content = entry.get("content") or ""
+    if len(content) > LAST_ACTIVITY_PREVIEW_LENGTH:
+        content = content[:LAST_ACTIVITY_PREVIEW_LENGTH - 1] + "…"
+    return {
+        "type": kind,
+        "author": entry.get("author"),
+        "author_id": entry.get("author_id"),
+        "preview": content,
+        "createdAt": entry["createdAt"],
+    }
+
+def _add_ticket_entry(ticket_id: str, collection, kind: str, counter: str, entry: dict) -> bool:
+    ticket = tickets_collection.find_one({"_id": ObjectId(ticket_id)}, {"organization_id": 1})
+    if not ticket:
+        return False
+    entry["ticket_id"] = ticket_id
+    entry["organization_id"] = ticket.get("organization_id")
+    collection.insert_one(entry)
+    entry.pop("_id", None)
     result = tickets_collection.update_one(
         {"_id": ObjectId(ticket_id)},
         {
-            "$push": {"notes": note_data},
-            "$set": {"updatedAt": datetime.now(ZoneInfo("Asia/Kolkata"))}
+            "$inc": {counter: 1},
+            "$set": {
+                "last_activity": _last_activity(kind, entry),
+                "updatedAt": datetime.now(ZoneInfo("Asia/Kolkata")),
+            },
         }
     )
     return result.modified_count > 0
 
+def add_note_to_ticket(ticket_id: str, note_data: dict) -> bool:
+    """Add a note to a ticket"""
+    note_data["id"] = f"N-{int(datetime.now().timestamp() * 1000)}"
+    note_data["createdAt"] = datetime.now(ZoneInfo("Asia/Kolkata"))
+    return _add_ticket_entry(ticket_id, ticket_notes_collection, "note", "notes_count", note_data)
+
 def add_message_to_ticket(ticket_id: str, message_data: dict) -> bool:
     """Add a message to ticket communication"""
     message_data["id"] = f"C-{int(datetime.now().timestamp() * 1000)}"
     message_data["createdAt"] = datetime.now(ZoneInfo("Asia/Kolkata"))
-    
-    result = tickets_collection.update_one(
-        {"_id": ObjectId(ticket_id)},
-        {
-            "$push": {"communication": message_data},
-            "$set": {"updatedAt": datetime.now(ZoneInfo("Asia/Kolkata"))}
-        }
+    return _add_ticket_entry(ticket_id, ticket_messages_collection, "message", "messages_count", message_data)
+
+def _get_ticket_entries(collection, ticket_id: str, limit: int, before: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Page backwards through a ticket's notes or messages.
+
+    Returns up to limit entries in chronological order and the cursor for the
+    page before them (None when there are no older entries).
+    """
+    query = {"ticket_id": ticket_id}
+    if before:
+        if not ObjectId.is_valid(before):
+            raise ValueError("Invalid cursor")
+        query["_id"] = {"$lt": ObjectId(before)}
+    entries = list(
+        collection.find(query, {"ticket_id": 0, "organization_id": 0}).sort("_id", -1).limit(limit + 1)
     )
-    return result.modified_count > 0
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    entries.reverse()
+    next_cursor = str(entries[0]["_id"]) if has_more and entries else None
+    for entry in entries:
+        entry["_id"] = str(entry["_id"])
+    return entries, next_cursor
+
+def get_ticket_notes(ticket_id: str, limit: int = TICKET_THREAD_LIMIT, before: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Get a page of a ticket's notes, oldest first"""
+    return _get_ticket_entries(ticket_notes_collection, ticket_id, limit, before)
+
+def get_ticket_messages(ticket_id: str, limit: int = TICKET_THREAD_LIMIT, before: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Get a page of a ticket's communication, oldest first"""
+    return _get_ticket_entries(ticket_messages_collection, ticket_id, limit, before)
+
+def attach_ticket_threads(ticket: dict, limit: int = TICKET_THREAD_LIMIT) -> dict:
+    """Fill in a ticket's most recent notes and communication.
+
+    Tickets not yet migrated still carry embedded arrays; those entries are
+    older than anything in the separate collections.
+    """
+    ticket_id = str(ticket["_id"])
+    notes, _ = get_ticket_notes(ticket_id, limit)
+    messages, _ = get_ticket_messages(ticket_id, limit)
+    ticket["notes"] = (ticket.get("notes") or []) + notes
+    ticket["communication"] = (ticket.get("communication") or []) + messages
+    return ticket
 
 def delete_ticket(ticket_id: str) -> bool:
-    """Delete a ticket"""
-    result = tickets_collection.delete_one({"_id": ObjectId(ticket_id)})
-    return result.deleted_count > 0
+    """Delete a ticket along with its notes and communication"""
+    deleted = tickets_collection.find_one_and_delete({"_id": ObjectId(ticket_id)}, projection=TRACKED_FIELDS)
+    if deleted is None:
+        return False
+    _ticket_changed(deleted.get("organization_id"), deleted, None)
+    ticket_notes_collection.delete_many({"ticket_id": ticket_id})
+    ticket_messages_collection.delete_many({"ticket_id": ticket_id})
+    return True
 
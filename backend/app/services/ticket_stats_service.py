@@ -0,0 +1,169 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo
+
+from ..config import db
+from ..models.ticket_model import TicketStatus
+
+# One document per organization with running ticket counters, so the
+# dashboard reads a single document instead of every ticket:
+#   {"_id": org_id, "total": n,
+#    "by_status": {"Open": n, ...},
+#    "by_assignee": {"<user_id>|unassigned": {"Open": n, ...}},
+#    "travel_by_day": {"YYYY-MM-DD": n}}   # tickets not yet closed
+ticket_stats_collection = db["ticket_stats"]
+tickets_collection = db["tickets"]
+
+UNASSIGNED = "unassigned"
+UPCOMING_TRAVEL_DAYS = 30
+STATS_TIMEZONE = ZoneInfo("Asia/Kolkata")
+
+logger = logging.getLogger("chatapp.ticket_stats")
+
+
+def _travel_day(travel_date: Any) -> Optional[str]:
+    if not isinstance(travel_date, datetime):
+        return None
+    if travel_date.tzinfo is None:
+        travel_date = travel_date.replace(tzinfo=timezone.utc)
+    return travel_date.astimezone(STATS_TIMEZONE).date().isoformat()
+
+
+def _contributions(ticket: Optional[dict]) -> Dict[str, int]:
+    """Counter increments a ticket accounts for"""
+    if not ticket:
+        return {}
+    status = ticket.get("status") or TicketStatus.OPEN.value
+    assignee = ticket.get("assigned_to") or UNASSIGNED
+    counters = {
+        "total": 1,
+        f"by_status.{status}": 1,
+        f"by_assignee.{assignee}.{status}": 1,
+    }
+    day = _travel_day(ticket.get("travelDate"))
+    if day and status != TicketStatus.CLOSED.value:
+        counters[f"travel_by_day.{day}"] = 1
+    return counters
+
+
+def apply_ticket_change(organization_id: Optional[str], before: Optional[dict], after: Optional[dict]):
+    """Move an organization's counters from a ticket's old state to its new one.
+
+    before is None for a new ticket and after is None for a deleted one.
+    Organizations without a stats document are left alone; their counters
+    are built from scratch on first read.
+    """
+    if not organization_id:
+        return
+    delta: Dict[str, int] = {}
+    for key, value in _contributions(after).items():
+        delta[key] = delta.get(key, 0) + value
+    for key, value in _contributions(before).items():
+        delta[key] = delta.get(key, 0) - value
+    delta = {key: value for key, value in delta.items() if value}
+    if not delta:
+        return
+    try:
+        ticket_stats_collection.update_one(
+            {"_id": organization_id},
+            {"$inc": delta, "$set": {"updated_at": datetime.now(STATS_TIMEZONE)}},
+        )
+    except Exception as exc:
+        # A rebuild brings the counters back in line
+        logger.warning("Failed to update ticket stats for %s: %s", organization_id, exc)
+
+
+def compute_ticket_stats(organization_id: str) -> Dict[str, Any]:
+    """Counters recomputed from the tickets themselves, in the stored document's shape"""
+    closed = TicketStatus.CLOSED.value
+    pipeline = [
+        {"$match": {"organization_id": organization_id}},
+        {"$project": {
+            "status": {"$ifNull": ["$status", TicketStatus.OPEN.value]},
+            "assignee": {"$ifNull": ["$assigned_to", UNASSIGNED]},
+            "day": {"$cond": [
+                {"$eq": [{"$type": "$travelDate"}, "date"]},
+                {"$dateToString": {"format": "%Y-%m-%d", "date": "$travelDate", "timezone": str(STATS_TIMEZONE)}},
+                None,
+            ]},
+        }},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_assignee": [{"$group": {"_id": {"assignee": "$assignee", "status": "$status"}, "count": {"$sum": 1}}}],
+            "travel_by_day": [
+                {"$match": {"status": {"$ne": closed}, "day": {"$ne": None}}},
+                {"$group": {"_id": "$day", "count": {"$sum": 1}}},
+            ],
+        }},
+    ]
+    facets = next(tickets_collection.aggregate(pipeline), {})
+    by_assignee: Dict[str, Dict[str, int]] = {}
+    for row in facets.get("by_assignee", []):
+        by_assignee.setdefault(row["_id"]["assignee"], {})[row["_id"]["status"]] = row["count"]
+    by_status = {row["_id"]: row["count"] for row in facets.get("by_status", [])}
+    return {
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "by_assignee": by_assignee,
+        "travel_by_day": {row["_id"]: row["count"] for row in facets.get("travel_by_day", [])},
+    }
+
+
+def _without_zeros(stats: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "total": stats.get("total", 0),
+        "by_status": {k: v for k, v in (stats.get("by_status") or {}).items() if v},
+        "by_assignee": {
+            assignee: {k: v for k, v in counts.items() if v}
+            for assignee, counts in (stats.get("by_assignee") or {}).items()
+            if any(counts.values())
+        },
+        "travel_by_day": {k: v for k, v in (stats.get("travel_by_day") or {}).items() if v},
+    }
+
+
+def rebuild_ticket_stats(organization_id: str) -> Dict[str, Any]:
+    """Recompute an organization's counters, replace the stored ones and report any drift"""
+    stored = _without_zeros(ticket_stats_collection.find_one({"_id": organization_id}) or {})
+    computed = compute_ticket_stats(organization_id)
+    now = datetime.now(STATS_TIMEZONE)
+    ticket_stats_collection.replace_one(
+        {"_id": organization_id},
+        {**computed, "updated_at": now, "rebuilt_at": now},
+        upsert=True,
+    )
+    drifted = stored != _without_zeros(computed)
+    if drifted:
+        logger.warning("Ticket stats for %s had drifted and were rebuilt", organization_id)
+    return {"drifted": drifted, "stats": serialize_ticket_stats(organization_id)}
+
+
+def serialize_ticket_stats(organization_id: str) -> Dict[str, Any]:
+    """Dashboard view of an organization's counters (a single document read)"""
+    stats = ticket_stats_collection.find_one({"_id": organization_id}) or {}
+    clean = _without_zeros(stats)
+    today = datetime.now(STATS_TIMEZONE).date()
+    horizon = (today + timedelta(days=UPCOMING_TRAVEL_DAYS)).isoformat()
+    return {
+        "organization_id": organization_id,
+        "total": clean["total"],
+        "by_status": {status.value: clean["by_status"].get(status.value, 0) for status in TicketStatus},
+        "by_assignee": [
+            {"assigned_to": None if assignee == UNASSIGNED else assignee, **counts}
+            for assignee, counts in sorted(clean["by_assignee"].items())
+        ],
+        "upcoming_travel": [
+            {"date": day, "count": count}
+            for day, count in sorted(clean["travel_by_day"].items())
+            if today.isoformat() <= day <= horizon
+        ],
+        "updated_at": stats["updated_at"].isoformat() if stats.get("updated_at") else None,
+        "rebuilt_at": stats["rebuilt_at"].isoformat() if stats.get("rebuilt_at") else None,
+    }
+
+
+def get_ticket_stats(organization_id: str) -> Dict[str, Any]:
+    if ticket_stats_collection.count_documents({"_id": organization_id}, limit=1) == 0:
+        rebuild_ticket_stats(organization_id)
+    return serialize_ticket_stats(organization_id)
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+from pymongo import ASCENDING, DeleteOne, UpdateOne
+
+from ..config import db
+from ..models.ticket_model import TicketStatus
+
+# One document per pending alert, so the scheduler only ever reads the head of
+# the due_at index instead of scanning open tickets:
+#   {"_id": "<ticket _id>:<kind>", "ticket_id": ..., "organization_id": ...,
+#    "kind": "sla_breach"|"travel_soon", "due_at": datetime}
+ticket_timers_collection = db["ticket_timers"]
+tickets_collection = db["tickets"]
+
+TICKET_TIMERS_ENABLED = os.getenv("TICKET_TIMERS_ENABLED", "true").lower() == "true"
+# A ticket still Open this long after creation has breached its SLA
+TICKET_SLA_OPEN_HOURS = float(os.getenv("TICKET_SLA_OPEN_HOURS", "24"))
+# Warn this long before a ticket's travel date
+TICKET_TRAVEL_SOON_HOURS = float(os.getenv("TICKET_TRAVEL_SOON_HOURS", "48"))
+TICKET_TIMER_BATCH_SIZE = int(os.getenv("TICKET_TIMER_BATCH_SIZE", "200"))
+# Upper bound on a sleep, so timers written by other app servers are picked up
+TICKET_TIMER_MAX_SLEEP_SECONDS = float(os.getenv("TICKET_TIMER_MAX_SLEEP_SECONDS", "300"))
+
+SLA_BREACH = "sla_breach"
+TRAVEL_SOON = "travel_soon"
+# Ticket fields the timers depend on
+TIMER_FIELDS = {"organization_id": 1, "status": 1, "createdAt": 1, "travelDate": 1}
+
+logger = logging.getLogger("chatapp.ticket_timers")
+
+_task: Optional[asyncio.Task] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wake: Optional[asyncio.Event] = None
+_next_wake_at: Optional[datetime] = None
+
+
+def ensure_ticket_timer_indexes():
+    ticket_timers_collection.create_index([("due_at", ASCENDING)])
+    ticket_timers_collection.create_index("ticket_id")
+
+
+def _aware(value: Any) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def desired_timers(ticket: Optional[dict]) -> Dict[str, datetime]:
+    """kind -> due time of the alerts a ticket in this state should have pending"""
+    if not ticket:
+        return {}
+    status = ticket.get("status") or TicketStatus.OPEN.value
+    timers: Dict[str, datetime] = {}
+    created_at = _aware(ticket.get("createdAt"))
+    if status == TicketStatus.OPEN.value and created_at:
+        timers[SLA_BREACH] = created_at + timedelta(hours=TICKET_SLA_OPEN_HOURS)
+    travel_date = _aware(ticket.get("travelDate"))
+    if status != TicketStatus.CLOSED.value and travel_date and travel_date > datetime.now(timezone.utc):
+        timers[TRAVEL_SOON] = travel_date - timedelta(hours=TICKET_TRAVEL_SOON_HOURS)
+    return timers
+
+
+def _timer_operations(ticket_id: str, organization_id: Optional[str], before: Dict[str, datetime],
+                      after: Dict[str, datetime]) -> List:
+    operations = []
+    for kind, due_at in after.items():
+        if before.get(kind) != due_at:
+            operations.append(UpdateOne(
+                {"_id": f"{ticket_id}:{kind}"},
+                {"$set": {"ticket_id": ticket_id, "organization_id": organization_id, "kind": kind, "due_at": due_at}},
+                upsert=True,
+            ))
+    for kind in before.keys() - after.keys():
+        operations.append(DeleteOne({"_id": f"{ticket_id}:{kind}"}))
+    return operations
+
+
+def sync_ticket_timers(before: Optional[dict], after: Optional[dict]):
+    """Bring a ticket's pending alerts in line with its new state.
+
+    before is None for a new ticket and after is None for a deleted one;
+    both carry at least _id and TIMER_FIELDS.
+    """
+    ticket = after or before
+    if not ticket or "_id" not in ticket:
+        return
+    wanted = desired_timers(after)
+    operations = _timer_operations(str(ticket["_id"]), ticket.get("organization_id"), desired_timers(before), wanted)
+    if not operations:
+        return
+    try:
+        ticket_timers_collection.bulk_write(operations, ordered=False)
+    except Exception as exc:
+        # rebuild_ticket_timers restores anything missed here
+        logger.warning("Failed to update timers for ticket %s: %s", ticket["_id"], exc)
+        return
+    if wanted:
+        _wake_if_sooner(min(wanted.values()))
+
+
+def rebuild_ticket_timers(batch_size: int = 1000, include_overdue: bool = False) -> int:
+    """Recreate the pending alerts of every ticket; returns how many are pending.
+
+    Alerts already past due are skipped unless include_overdue is set, so a
+    first run does not fire one for every old ticket at once.
+    """
+    ticket_timers_collection.delete_many({})
+    operations = []
+    pending = 0
+    now = datetime.now(timezone.utc)
+    cursor = tickets_collection.find(
+        {"status": {"$ne": TicketStatus.CLOSED.value}},
+        {**TIMER_FIELDS, "_id": 1},
+    ).batch_size(batch_size)
+    for ticket in cursor:
+        timers = desired_timers(ticket)
+        if not include_overdue:
+            timers = {kind: due_at for kind, due_at in timers.items() if due_at > now}
+        operations.extend(_timer_operations(str(ticket["_id"]), ticket.get("organization_id"), {}, timers))
+        if len(operations) >= batch_size:
+            ticket_timers_collection.bulk_write(operations, ordered=False)
+            pending += len(operations)
+            operations = []
+    if operations:
+        ticket_timers_collection.bulk_write(operations, ordered=False)
+        pending += len(operations)
+    return pending
+
+
+def claim_due_timers(limit: int) -> List[Tuple[dict, dict]]:
+    """Take up to limit due timers, with the tickets they belong to.
+
+    Each timer is removed as it is claimed, so with several app servers
+    every alert goes out once.
+    """
+    now = datetime.now(timezone.utc)
+    claimed = []
+    while len(claimed) < limit:
+        timer = ticket_timers_collection.find_one_and_delete({"due_at": {"$lte": now}}, sort=[("due_at", ASCENDING)])
+        if timer is None:
+            break
+        try:
+            ticket = tickets_collection.find_one(
+                {"_id": ObjectId(timer["ticket_id"])},
+                {"id": 1, "name": 1, "destination": 1, "assigned_to": 1, "created_by": 1, **TIMER_FIELDS},
+            )
+        except Exception:
+            ticket = None
+        # The ticket may have changed between the claim and now; only alert
+        # if it still calls for this timer
+        if ticket and timer["kind"] in desired_timers(ticket):
+            claimed.append((timer, ticket))
+    return claimed
+
+
+def next_due_at() -> Optional[datetime]:
+    timer = ticket_timers_collection.find_one({}, {"due_at": 1}, sort=[("due_at", ASCENDING)])
+    return _aware(timer["due_at"]) if timer else None
+
+
+def _event_message(kind: str, ticket: dict) -> Dict[str, Any]:
+    summary = {**ticket, "_id": str(ticket["_id"])}
+    for field in ("createdAt", "travelDate"):
+        if isinstance(summary.get(field), datetime):
+            summary[field] = summary[field].isoformat()
+    return {"type": f"ticket_{kind}", "ticket": summary}
+
+
+def _push_text(kind: str, ticket: dict) -> Tuple[str, str]:
+    label = ticket.get("id") or "Ticket"
+    if kind == SLA_BREACH:
+        return f"{label} is overdue", f"{ticket.get('name', '')} has been open for over {TICKET_SLA_OPEN_HOURS:g} hours"
+    travel_date = _aware(ticket.get("travelDate"))
+    when = travel_date.astimezone(ZoneInfo("Asia/Kolkata")).strftime("%d %b %H:%M") if travel_date else ""
+    return f"{label} travels soon", f"{ticket.get('destination', '')} on {when}".strip()
+
+
+async def _emit(timer: dict, ticket: dict):
+    from ..websocket_manager import manager
+
+    kind = timer["kind"]
+    await manager.broadcast_to_org(ticket.get("organization_id"), _event_message(kind, ticket))
+    # Push goes to whoever is handling the ticket, or its creator until assigned
+    recipient = ticket.get("assigned_to") or ticket.get("created_by")
+    if not recipient:
+        return
+    try:
+        from .fcm_notification_service import fcm_service
+        title, body = _push_text(kind, ticket)
+        asyncio.create_task(fcm_service.send_ticket_notification(
+            [recipient], title, body, str(ticket["_id"]), f"ticket_{kind}"
+        ))
+    except Exception as exc:
+        logger.warning("Failed to push %s for ticket %s: %s", kind, ticket["_id"], exc)
+
+
+def _wake_if_sooner(due_at: datetime):
+    """Cut the scheduler's sleep short when a timer is due before it would wake"""
+    if _loop is None or _wake is None:
+        return
+    if _next_wake_at is None or due_at < _next_wake_at:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+async def _timer_loop():
+    global _next_wake_at
+    while True:
+        try:
+            # Clear before reading the next deadline so a wake-up sent in
+            # between is not lost
+            _wake.clear()
+            claimed = await asyncio.to_thread(claim_due_timers, TICKET_TIMER_BATCH_SIZE)
+            for timer, ticket in claimed:
+                await _emit(timer, ticket)
+            if len(claimed) == TICKET_TIMER_BATCH_SIZE:
+                continue
+            due_at = await asyncio.to_thread(next_due_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Ticket timer run failed: %s", exc)
+            due_at = None
+
+        delay = TICKET_TIMER_MAX_SLEEP_SECONDS
+        if due_at is not None:
+            delay = min(max((due_at - datetime.now(timezone.utc)).total_seconds(), 0), delay)
+        _next_wake_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        try:
+            await asyncio.wait_for(_wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_ticket_timers():
+    global _task, _loop, _wake
+    if TICKET_TIMERS_ENABLED and _task is None:
+        _loop = asyncio.get_running_loop()
+        _wake = asyncio.Event()
+        _task = _loop.create_task(_timer_loop())
+
+
+def stop_ticket_timers():
+    global _task, _loop, _wake, _next_wake_at
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    _loop = _wake = _next_wake_at = None
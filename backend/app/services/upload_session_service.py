@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from ..config import db
+from ..storage.factory import get_storage
+from .file_service import validate_upload, write_stream, save_stream, TMP_DIR
+
+# Resumable uploads: init -> PUT numbered chunks (in any order, retried freely) -> complete
+upload_sessions_collection = db["upload_sessions"]
+
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+DEFAULT_SESSION_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB
+MIN_SESSION_CHUNK_SIZE = 256 * 1024  # 256KB
+MAX_SESSION_CHUNK_SIZE = 16 * 1024 * 1024  # 16MB
+
+
+def ensure_upload_session_indexes():
+    # Mongo drops sessions once expires_at passes; leftover chunks are
+    # removed by the storage GC's sweep of sessions/
+    upload_sessions_collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+def _expires_at() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+
+
+def _chunk_key(upload_id: str, index: int) -> str:
+    # Chunks live in shared storage so any app server can take the next PUT
+    return f"sessions/{upload_id}/{index}.chunk"
+
+
+def _expected_chunk_size(session: dict, index: int) -> int:
+    if index == session["total_chunks"] - 1:
+        return session["size"] - index * session["chunk_size"]
+    return session["chunk_size"]
+
+
+def serialize_upload_session(session: dict) -> Dict[str, Any]:
+    received = set(session.get("received", []))
+    return {
+        "upload_id": session["_id"],
+        "filename": session["filename"],
+        "file_type": session["file_type"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": session["total_chunks"],
+        "received_chunks": sorted(received),
+        "missing_chunks": [i for i in range(session["total_chunks"]) if i not in received],
+        "status": session["status"],
+        "expires_at": session["expires_at"].isoformat(),
+    }
+
+
+def create_upload_session(
+    filename: str,
+    content_type: Optional[str],
+    size: int,
+    owner_id: str,
+    org_id: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+) -> dict:
+    """Start a resumable upload; the declared type and size are validated up front"""
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="File size must be greater than zero")
+    file_info = validate_upload(filename, content_type, size)
+    chunk_size = chunk_size or DEFAULT_SESSION_CHUNK_SIZE
+    if not MIN_SESSION_CHUNK_SIZE <= chunk_size <= MAX_SESSION_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"chunk_size must be between {MIN_SESSION_CHUNK_SIZE} and {MAX_SESSION_CHUNK_SIZE} bytes",
+        )
+
+    session = {
+        "_id": uuid.uuid4().hex,
+        "owner_id": owner_id,
+        "organization_id": org_id,
+        "filename": filename,
+        "content_type": content_type,
+        "file_type": file_info["type"],
+        "size": size,
+        "chunk_size": chunk_size,
+        "total_chunks": math.ceil(size / chunk_size),
+        "received": [],
+        "status": "uploading",
+        "created_at": datetime.now(timezone.utc),
+        "expires_at": _expires_at(),
+    }
+    upload_sessions_collection.insert_one(session)
+    return session
+
+
+def get_upload_session(upload_id: str, owner_id: str) -> dict:
+    session = upload_sessions_collection.find_one({"_id": upload_id})
+    if not session or session["expires_at"].replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    if session["owner_id"] != owner_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return session
+
+
+async def write_upload_chunk(upload_id: str, owner_id: str, index: int, chunks: AsyncIterator[bytes]) -> dict:
+    """Store one chunk. Re-sending a chunk replaces it, so retries are safe."""
+    session = get_upload_session(upload_id, owner_id)
+    if session["status"] != "uploading":
+        raise HTTPException(status_code=409, detail=f"Upload is {session['status']}")
+    if not 0 <= index < session["total_chunks"]:
+        raise HTTPException(status_code=400, detail=f"Chunk index must be between 0 and {session['total_chunks'] - 1}")
+
+    expected = _expected_chunk_size(session, index)
+    # Stage locally so a dropped connection never leaves a short chunk in storage
+    tmp_path = os.path.join(TMP_DIR, f"{upload_id}.{index}.{uuid.uuid4().hex}.part")
+    size, _ = await write_stream(chunks, tmp_path, expected, session["file_type"])
+    if size != expected:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes (got {size})")
+    await asyncio.to_thread(get_storage().put_file, _chunk_key(upload_id, index), tmp_path)
+
+    return upload_sessions_collection.find_one_and_update(
+        {"_id": upload_id},
+        {"$addToSet": {"received": index}, "$set": {"expires_at": _expires_at()}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _iter_chunks(session: dict) -> AsyncIterator[bytes]:
+    storage = get_storage()
+    for index in range(session["total_chunks"]):
+        # One chunk (at most MAX_SESSION_CHUNK_SIZE) in memory at a time
+        yield await asyncio.to_thread(storage.get, _chunk_key(session["_id"], index))
+
+
+def _delete_chunks(session: dict):
+    storage = get_storage()
+    for index in range(session["total_chunks"]):
+        storage.delete(_chunk_key(session["_id"], index))
+
+
+async def complete_upload_session(upload_id: str, owner_id: str) -> Dict[str, Any]:
+    """Assemble the chunks into a stored file; repeating the call returns the same file"""
+    session = get_upload_session(upload_id, owner_id)
+    if session["status"] == "completed":
+        return session["file"]
+    missing = session["total_chunks"] - len(set(session.get("received", [])))
+    if missing:
+        raise HTTPException(status_code=400, detail=f"{missing} chunk(s) still missing")
+
+    # Only one request may assemble the file
+    session = upload_sessions_collection.find_one_and_update(
+        {"_id": upload_id, "status": "uploading"},
+        {"$set": {"status": "completing"}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not session:
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+
+    try:
+        file_info = validate_upload(session["filename"], session["content_type"], session["size"])
+        saved_file = await save_stream(
+            _iter_chunks(session), session["filename"], session["content_type"], file_info["type"],
+            owner_id=session["owner_id"], org_id=session["organization_id"],
+        )
+    except BaseException:
+        upload_sessions_collection.update_one({"_id": upload_id}, {"$set": {"status": "uploading"}})
+        raise
+
+    upload_sessions_collection.update_one(
+        {"_id": upload_id},
+        {"$set": {"status": "completed", "file": saved_file, "expires_at": _expires_at()}},
+    )
+    await asyncio.to_thread(_delete_chunks, session)
+    return saved_file
+
+
+def abort_upload_session(upload_id: str, owner_id: str):
+    session = get_upload_session(upload_id, owner_id)
+    upload_sessions_collection.delete_one({"_id": upload_id})
+    _delete_chunks(session)
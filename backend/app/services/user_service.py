@@ -1,11 +1,14 @@
 from ..config import db
 from bson import ObjectId
+from .identity_service import USERS, sync_identity, sync_account, sync_account_by_email, remove_identity, touches_identity
 
 users_collection = db["users"]
 
 
 def create_user(user_data: dict):
-    return  users_collection.insert_one(user_data)
+    result = users_collection.insert_one(user_data)
+    sync_identity(USERS, user_data)
+    return result
 
 def get_user_by_email(email: str):
     return  users_collection.find_one({"email": email})
@@ -21,10 +24,20 @@ def list_users():
     return users
 
 def delete_user(email: str):
-    return  users_collection.delete_one({"email": email})
+    user = users_collection.find_one({"email": email}, {"_id": 1})
+    result = users_collection.delete_one({"email": email})
+    if user and result.deleted_count:
+        remove_identity(USERS, str(user["_id"]))
+    return result
 
 def update_user(email: str, updates: dict):
-    return users_collection.update_one({"email": email}, {"$set": updates})
+    result = users_collection.update_one({"email": email}, {"$set": updates})
+    if result.matched_count and touches_identity(updates):
+        sync_account_by_email(USERS, updates.get("email", email))
+    return result
 
 def update_user_by_id(user_id: str, updates: dict):
-    return users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": updates})
\ No newline at end of file
+    result = users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": updates})
+    if result.matched_count and touches_identity(updates):
+        sync_account(USERS, user_id)
+    return result
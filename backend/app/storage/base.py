@@ -0,0 +1,59 @@
+from typing import Iterator, NamedTuple, Optional
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    mtime: float
+
+
+class StorageBackend:
+    """Where upload bytes live.
+
+    Keys are "/"-separated paths relative to the storage root, e.g.
+    "objects/ab/cd/<sha256>.jpg". Records keep the logical path
+    "uploads/<key>"; see storage_key and storage_path.
+    """
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        raise NotImplementedError
+
+    def put_file(self, key: str, source_path: str, content_type: Optional[str] = None):
+        """Move a finished local file into storage; source_path is consumed"""
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def get_to_file(self, key: str, dest_path: str):
+        raise NotImplementedError
+
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield bytes start..end (inclusive; end of object when None)"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Remove an object; missing objects are ignored"""
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        """Yield every object whose key starts with prefix"""
+        raise NotImplementedError
+
+    def presign(self, key: str, expires_in: int, filename: Optional[str] = None,
+                inline: bool = True) -> Optional[str]:
+        """Short-lived direct download URL, or None if the backend cannot issue one"""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path on this machine's filesystem, for backends that have one"""
+        return None
@@ -0,0 +1,45 @@
+import os
+from typing import Optional
+
+from .base import StorageBackend
+
+# "local" keeps uploads on this machine; "s3" shares them between app servers
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+# Directory the local backend stores objects in
+UPLOAD_ROOT = os.getenv("UPLOAD_ROOT", "uploads")
+# Prefix of the logical paths stored on records ("uploads/objects/...")
+PATH_PREFIX = "uploads/"
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "s3":
+            from .s3 import S3Storage
+            _storage = S3Storage(
+                bucket=os.environ["S3_BUCKET"],
+                prefix=os.getenv("S3_PREFIX", ""),
+                endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+                region_name=os.getenv("S3_REGION") or None,
+            )
+        elif STORAGE_BACKEND == "local":
+            from .local import LocalStorage
+            _storage = LocalStorage(UPLOAD_ROOT)
+        else:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
+
+
+def storage_key(file_path: str) -> str:
+    """Storage key for a logical path such as "uploads/objects/ab/cd/x.jpg" """
+    file_path = file_path.replace("\\", "/").lstrip("/")
+    if file_path.startswith(PATH_PREFIX):
+        file_path = file_path[len(PATH_PREFIX):]
+    return file_path
+
+
+def storage_path(key: str) -> str:
+    """Logical path recorded for a storage key"""
+    return f"{PATH_PREFIX}{key}"
@@ -0,0 +1,88 @@
+import os
+import shutil
+import uuid
+from typing import Iterator, Optional
+
+from .base import StorageBackend, StoredObject, STREAM_CHUNK_SIZE
+
+
+class LocalStorage(StorageBackend):
+    """Objects stored as files under a directory on this machine"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._abs_root = os.path.abspath(root)
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self._abs_root, key))
+        if not path.startswith(self._abs_root + os.sep):
+            raise ValueError(f"Key escapes storage root: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as dest:
+            dest.write(data)
+        os.replace(tmp_path, path)
+
+    def put_file(self, key: str, source_path: str, content_type: Optional[str] = None):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A rename when source_path is on the same filesystem (uploads/tmp is)
+        shutil.move(source_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self.local_path(key), "rb") as source:
+            return source.read()
+
+    def get_to_file(self, key: str, dest_path: str):
+        shutil.copyfile(self.local_path(key), dest_path)
+
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.local_path(key), "rb") as source:
+            source.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = source.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            path = self.local_path(key)
+            if not os.path.isfile(path):
+                return None
+            stat_result = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        return StoredObject(key, stat_result.st_size, stat_result.st_mtime)
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        directory = self.local_path(prefix) if prefix.strip("/") else self._abs_root
+        yield from self._walk(directory)
+
+    def _walk(self, directory: str) -> Iterator[StoredObject]:
+        # scandir keeps memory flat however many files a directory holds
+        if not os.path.isdir(directory):
+            return
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat_result = entry.stat()
+                    key = os.path.relpath(entry.path, self._abs_root).replace(os.sep, "/")
+                    yield StoredObject(key, stat_result.st_size, stat_result.st_mtime)
@@ -0,0 +1,84 @@
+import os
+from typing import Iterator, Optional
+
+from .base import StorageBackend, StoredObject, STREAM_CHUNK_SIZE
+
+
+class S3Storage(StorageBackend):
+    """Objects stored in an S3-compatible bucket (AWS S3, MinIO, Ceph RGW, ...)
+
+    Credentials come from the usual boto3 sources (AWS_ACCESS_KEY_ID /
+    AWS_SECRET_ACCESS_KEY, profile, instance role). Point endpoint_url at a
+    MinIO server to run against a local stand-in.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region_name: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as exc:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from exc
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region_name)
+        self._client_error = ClientError
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _is_missing(self, exc) -> bool:
+        return exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None):
+        extra = {"ContentType": content_type} if content_type else {}
+        self._client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, **extra)
+
+    def put_file(self, key: str, source_path: str, content_type: Optional[str] = None):
+        # upload_file switches to multipart for large files
+        extra = {"ContentType": content_type} if content_type else None
+        self._client.upload_file(source_path, self.bucket, self._key(key), ExtraArgs=extra)
+        os.remove(source_path)
+
+    def get(self, key: str) -> bytes:
+        return self._client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+
+    def get_to_file(self, key: str, dest_path: str):
+        self._client.download_file(self.bucket, self._key(key), dest_path)
+
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = self._client.get_object(**params)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            head = self._client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as exc:
+            if self._is_missing(exc):
+                return None
+            raise
+        return StoredObject(key, head["ContentLength"], head["LastModified"].timestamp())
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get("Contents", []):
+                yield StoredObject(obj["Key"][len(self.prefix):], obj["Size"], obj["LastModified"].timestamp())
+
+    def presign(self, key: str, expires_in: int, filename: Optional[str] = None,
+                inline: bool = True) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if filename:
+            disposition = "inline" if inline else "attachment"
+            params["ResponseContentDisposition"] = f'{disposition}; filename="{filename}"'
+        return self._client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
@@ -1,5 +1,4 @@
-from typing import Dict, List, Set, Optional
-import json
+from typing import Dict, Iterable, List, Set, Optional
 import asyncio
 import logging
 import os
@@ -7,8 +6,14 @@ import time
 from fastapi import WebSocket
 from starlette.websockets import WebSocketState
 
+from .core import metrics
+from .core.serialization import dumps_text
+
 HEARTBEAT_INTERVAL = int(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))
 HEARTBEAT_TIMEOUT = int(os.getenv("WS_HEARTBEAT_TIMEOUT", "60"))
+# A client that cannot take a frame within this long is dropped rather than
+# holding up the rest of a broadcast
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
 
 
 class ConnectionManager:
@@ -16,14 +21,20 @@ class ConnectionManager:
         self.active_connections: Dict[str, WebSocket] = {}
         self.chat_connections: Dict[str, Set[str]] = {}
         self.user_current_chat: Dict[str, str] = {}
+        # Connected users per organization, from the JWT's org_id claim
+        self.org_connections: Dict[str, Set[str]] = {}
+        self.user_org: Dict[str, str] = {}
         self.heartbeat_tasks: Dict[str, asyncio.Task] = {}
         self.last_pong: Dict[str, float] = {}
         self.logger = logging.getLogger("chatapp.websocket")
 
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str, org_id: Optional[str] = None):
         if websocket.client_state == WebSocketState.CONNECTING:
             await websocket.accept()
         self.active_connections[user_id] = websocket
+        if org_id:
+            self.user_org[user_id] = str(org_id)
+            self.org_connections.setdefault(str(org_id), set()).add(user_id)
         self.last_pong[user_id] = time.monotonic()
         self.heartbeat_tasks[user_id] = asyncio.create_task(self._heartbeat_loop(user_id))
         self.logger.info("User %s connected", user_id)
@@ -38,6 +49,13 @@ class ConnectionManager:
         for chat_id, users in self.chat_connections.items():
             users.discard(user_id)
         self.user_current_chat.pop(user_id, None)
+        org_id = self.user_org.pop(user_id, None)
+        if org_id:
+            members = self.org_connections.get(org_id)
+            if members is not None:
+                members.discard(user_id)
+                if not members:
+                    self.org_connections.pop(org_id, None)
         heartbeat = self.heartbeat_tasks.pop(user_id, None)
         if heartbeat:
             heartbeat.cancel()
@@ -51,7 +69,7 @@ class ConnectionManager:
             if not websocket:
                 break
             try:
-                await websocket.send_text(json.dumps({"type": "ping", "ts": time.time()}))
+                await websocket.send_text(dumps_text({"type": "ping", "ts": time.time()}))
             except Exception as exc:
                 self.logger.warning("Failed to send ping to %s: %s", user_id, exc)
                 self.disconnect(user_id)
@@ -77,25 +95,46 @@ class ConnectionManager:
             self.user_current_chat.pop(user_id, None)
         self.logger.debug("User %s left chat %s", user_id, chat_id)
 
+    async def _send_payload(self, user_id: str, websocket: WebSocket, payload: str):
+        metrics.ws_sends_in_flight.inc()
+        try:
+            await asyncio.wait_for(websocket.send_text(payload), SEND_TIMEOUT)
+        except Exception as exc:
+            metrics.ws_send_failures.inc()
+            self.logger.warning("Failed to send message to %s: %s", user_id, exc)
+            # Only drop the connection that failed, not a newer one for the same user
+            if self.active_connections.get(user_id) is websocket:
+                self.disconnect(user_id)
+        finally:
+            metrics.ws_sends_in_flight.dec()
+
     async def _safe_send(self, user_id: str, message: dict):
         websocket = self.active_connections.get(user_id)
         if not websocket:
             return
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as exc:
-            self.logger.warning("Failed to send message to %s: %s", user_id, exc)
-            self.disconnect(user_id)
+        await self._send_payload(user_id, websocket, dumps_text(message))
+
+    async def _fan_out(self, user_ids: Iterable[str], message: dict, exclude_user: Optional[str] = None,
+                       scope: str = "chat"):
+        """Send one message to many users: serialized once, sent concurrently"""
+        targets = [
+            (user_id, websocket)
+            for user_id in list(user_ids)
+            if user_id != exclude_user and (websocket := self.active_connections.get(user_id))
+        ]
+        if not targets:
+            return
+        started = time.perf_counter()
+        payload = dumps_text(message)
+        await asyncio.gather(*(self._send_payload(user_id, websocket, payload) for user_id, websocket in targets))
+        metrics.ws_broadcast_recipients.observe(len(targets), scope=scope)
+        metrics.ws_broadcast_seconds.observe(time.perf_counter() - started, scope=scope)
 
     async def send_personal_message(self, message: dict, user_id: str):
         await self._safe_send(user_id, message)
 
     async def broadcast_to_chat(self, message: dict, chat_id: str, exclude_user: Optional[str] = None):
-        recipients = self.chat_connections.get(chat_id, set())
-        for user_id in list(recipients):
-            if exclude_user and user_id == exclude_user:
-                continue
-            await self._safe_send(user_id, message)
+        await self._fan_out(self.chat_connections.get(chat_id, ()), message, exclude_user)
 
     async def send_typing_indicator(self, chat_id: str, user_id: str, is_typing: bool):
         await self.broadcast_to_chat(
@@ -115,16 +154,11 @@ class ConnectionManager:
         return list(self.chat_connections.get(chat_id, []))
 
     async def broadcast_to_org(self, org_id: str, message: dict, exclude_user: Optional[str] = None):
-        from .services.user_service import users_collection
+        """Send to every connected user and admin of an organization"""
+        await self._fan_out(self.org_connections.get(str(org_id), ()), message, exclude_user, scope="org")
 
-        user_ids = [
-            str(user["_id"])
-            for user in users_collection.find({"organization_id": org_id}, {"_id": 1})
-        ]
-        for user_id in user_ids:
-            if exclude_user and user_id == exclude_user:
-                continue
-            await self._safe_send(user_id, message)
+    def get_connected_users_in_org(self, org_id: str) -> List[str]:
+        return list(self.org_connections.get(str(org_id), []))
 
 
 manager = ConnectionManager()
@@ -0,0 +1,61 @@
+"""Per-request authentication overhead: python-jose verification vs the claims cache.
+
+Run from backend/:
+
+    python -m benchmarks.bench_auth --tokens 100 --requests 100000
+
+"uncached" verifies the signature and parses the claims on every request, the
+way decode_access_token used to; "cached" calls decode_access_token, which
+verifies each token once and then serves its claims from the LRU cache.
+Requests cycle through --tokens distinct tokens, like a set of polling
+clients. Revocation sync is disabled so no database is needed.
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ["TOKEN_REVOCATION_SYNC_SECONDS"] = "inf"
+
+from jose import jwt
+
+from app.core import security
+
+
+def run_mode(tokens, requests: int, mode: str) -> dict:
+    if mode == "uncached":
+        def authenticate(token):
+            return jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+    else:
+        security._claims_cache.clear()
+        authenticate = security.decode_access_token
+    started = time.perf_counter()
+    for i in range(requests):
+        assert authenticate(tokens[i % len(tokens)]) is not None
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "requests": requests,
+        "us_per_request": elapsed / requests * 1e6,
+        "requests_per_s": requests / elapsed,
+    }
+
+
+def main(args):
+    tokens = [
+        security.create_access_token({"sub": f"user{i}@example.com", "role": "user", "org_id": "org", "user_id": str(i)})
+        for i in range(args.tokens)
+    ]
+    report = {
+        "tokens": args.tokens,
+        "cache_size": security.JWT_CACHE_SIZE,
+        "results": [run_mode(tokens, args.requests, mode) for mode in ("uncached", "cached")],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=100000)
+    main(parser.parse_args())
@@ -0,0 +1,131 @@
+"""Message history rendering: stdlib json with hand conversion vs orjson.
+
+Run from backend/:
+
+    python -m benchmarks.bench_json --pages 50,500,10000 --repeat 20
+
+"stdlib" is the old path: each stored message converted field by field as
+get_messages used to, then FastAPI's jsonable_encoder and Starlette's
+JSONResponse. "orjson" is the current one: documents as stored, rendered by
+MongoJSONResponse. Messages are synthetic but shaped like stored ones (ObjectId
+ids, string timestamps with a share of legacy datetimes, seenBy arrays and
+attachments). The WebSocket rows time one new_message frame the same two ways.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.core.serialization import MongoJSONResponse, dumps_text
+
+
+def make_messages(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    started = datetime(2025, 1, 1)
+    senders = [str(ObjectId()) for _ in range(20)]
+    chat_id = str(ObjectId())
+    messages = []
+    for i in range(count):
+        at = started + timedelta(seconds=i * 30)
+        sender = senders[i % len(senders)]
+        message = {
+            "_id": ObjectId(),
+            "chat_id": chat_id,
+            "sender_id": sender,
+            "message": "lorem ipsum dolor sit amet " * rng.randint(1, 12),
+            "message_type": "text",
+            # One in ten stored before timestamps became strings
+            "timestamp": at if i % 10 == 0 else at.isoformat() + "Z",
+            "status": "read",
+            "seenBy": [{"user_id": uid, "username": "Member", "seen_at": at.isoformat() + "Z"}
+                       for uid in rng.sample(senders, 3)],
+        }
+        if i % 15 == 0:
+            message["attachment"] = {"file_id": str(ObjectId()), "filename": "photo.jpg", "file_type": "image",
+                                     "file_url": "/files/uploads/objects/ab/cd/photo.jpg", "size": 123456}
+        messages.append(message)
+    return messages
+
+
+def legacy_convert(msg: dict) -> dict:
+    """get_messages' per-field conversion before the orjson layer"""
+    timestamp = msg["timestamp"]
+    if isinstance(timestamp, str):
+        timestamp_str = timestamp
+    elif hasattr(timestamp, "isoformat"):
+        timestamp_str = timestamp.isoformat()
+        if not timestamp_str.endswith("Z") and "+" not in timestamp_str:
+            timestamp_str += "Z"
+    else:
+        timestamp_str = str(timestamp)
+    seen_by = msg.get("seenBy")
+    if not isinstance(seen_by, list):
+        seen_by = []
+    return {
+        "id": str(msg["_id"]), "chat_id": msg["chat_id"], "sender_id": msg["sender_id"],
+        "message": msg["message"], "message_type": msg["message_type"], "attachment": msg.get("attachment"),
+        "timestamp": timestamp_str, "status": msg.get("status", "sent"), "seen_at": msg.get("seen_at"),
+        "seenBy": seen_by, "reply_to": msg.get("reply_to"),
+    }
+
+
+def current_convert(msg: dict) -> dict:
+    """get_messages as it is now: key renames and defaults only"""
+    msg = {**msg}
+    msg["id"] = msg.pop("_id")
+    msg.setdefault("status", "sent")
+    for field in ("attachment", "seen_at", "reply_to"):
+        msg.setdefault(field, None)
+    return msg
+
+
+def render(messages: list, mode: str) -> bytes:
+    if mode == "stdlib":
+        return JSONResponse(jsonable_encoder([legacy_convert(msg) for msg in messages])).body
+    return MongoJSONResponse([current_convert(msg) for msg in messages], utc=True).body
+
+
+def time_call(fn, repeat: int) -> float:
+    """Median milliseconds of fn() over repeat runs"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(args):
+    pages = [int(size) for size in args.pages.split(",")]
+    messages = make_messages(max(pages))
+    results = []
+    for size in pages:
+        page = messages[-size:]
+        assert json.loads(render(page, "stdlib")) == json.loads(render(page, "orjson"))
+        for mode in ("stdlib", "orjson"):
+            results.append({
+                "mode": mode,
+                "messages": size,
+                "bytes": len(render(page, mode)),
+                "ms_per_page": round(time_call(lambda: render(page, mode), args.repeat), 3),
+            })
+    frame = {"type": "new_message", **legacy_convert(messages[1])}
+    frames = 10000
+    websocket = [
+        {"mode": "stdlib", "us_per_frame": round(time_call(lambda: [json.dumps(frame) for _ in range(frames)], args.repeat) * 1000 / frames, 3)},
+        {"mode": "orjson", "us_per_frame": round(time_call(lambda: [dumps_text(frame) for _ in range(frames)], args.repeat) * 1000 / frames, 3)},
+    ]
+    print(json.dumps({"history": results, "websocket_frame": websocket}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default="50,500,10000", help="comma-separated history sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
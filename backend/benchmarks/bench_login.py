@@ -0,0 +1,74 @@
+"""Login throughput and event-loop lag: inline password checks vs the hashing pool.
+
+Run from backend/:
+
+    python -m benchmarks.bench_login --logins 32 [--method scrypt:32768:8:1]
+
+"inline" verifies every password on the event loop, the way login_admin used
+to; "pool" uses core.passwords.verify_password_async. Each mode runs the
+logins concurrently and reports logins per second and the worst event-loop
+stall seen meanwhile. No database is needed; only the hash check is timed.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.core import passwords
+
+
+async def _lag_probe(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def _login(password_hash: str, password: str, mode: str) -> bool:
+    if mode == "inline":
+        return check_password_hash(password_hash, password)
+    verified, _ = await passwords.verify_password_async(password_hash, password)
+    return verified
+
+
+async def run_mode(password_hash: str, logins: int, mode: str) -> dict:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_lag_probe(stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_login(password_hash, "correct horse", mode) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    worst_lag = await probe
+    assert all(results)
+    return {
+        "mode": mode,
+        "logins": logins,
+        "elapsed_s": elapsed,
+        "logins_per_s": logins / elapsed,
+        "max_loop_lag_ms": worst_lag * 1000,
+    }
+
+
+async def main(args):
+    started = time.perf_counter()
+    password_hash = generate_password_hash("correct horse", method=args.method)
+    report = {
+        "method": args.method,
+        "hash_ms": (time.perf_counter() - started) * 1000,
+        "workers": passwords.PASSWORD_HASH_WORKERS,
+        "results": [await run_mode(password_hash, args.logins, mode) for mode in ("inline", "pool")],
+    }
+    passwords.shutdown_password_pool()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--method", default=passwords.PASSWORD_HASH_METHOD)
+    asyncio.run(main(parser.parse_args()))
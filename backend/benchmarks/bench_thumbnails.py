@@ -0,0 +1,105 @@
+"""Upload latency with large images: inline thumbnailing vs the process pool.
+
+Run from backend/:
+
+    python -m benchmarks.bench_thumbnails --width 3000 --height 2200 --uploads 4
+
+"inline" renders every rendition on the event loop, the way save_file used to;
+"pool" hands rendering to thumbnail_service's ProcessPoolExecutor. For each
+mode the report gives the time until the upload response could be sent, the
+time until renditions exist, and the worst event-loop stall seen meanwhile.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from PIL import Image
+
+from app.services.file_service import UPLOAD_CHUNK_SIZE, write_stream
+from app.services import thumbnail_service
+
+
+def make_image(path: str, width: int, height: int):
+    noise = Image.effect_noise((width, height), 64)
+    Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT))).save(path)
+
+
+async def _file_chunks(path: str):
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def _lag_probe(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def _upload(source: str, workdir: str, index: int, mode: str) -> dict:
+    file_id = f"bench-{mode}-{index}"
+    dest = os.path.join(workdir, f"{file_id}.png")
+    started = time.perf_counter()
+    await write_stream(_file_chunks(source), dest, 1 << 40, "image")
+    if mode == "inline":
+        thumbnail_service.render_renditions(dest, file_id)
+        responded = rendered = time.perf_counter()
+    else:
+        future = asyncio.get_running_loop().run_in_executor(
+            thumbnail_service._get_executor(), thumbnail_service.render_renditions, dest, file_id
+        )
+        responded = time.perf_counter()
+        await future
+        rendered = time.perf_counter()
+    return {"response_s": responded - started, "renditions_s": rendered - started}
+
+
+async def run_mode(source: str, workdir: str, uploads: int, mode: str) -> dict:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_lag_probe(stop))
+    results = await asyncio.gather(*(_upload(source, workdir, i, mode) for i in range(uploads)))
+    stop.set()
+    worst_lag = await probe
+    response = [r["response_s"] for r in results]
+    rendered = [r["renditions_s"] for r in results]
+    return {
+        "mode": mode,
+        "uploads": uploads,
+        "response_ms_median": statistics.median(response) * 1000,
+        "response_ms_max": max(response) * 1000,
+        "renditions_ms_max": max(rendered) * 1000,
+        "max_loop_lag_ms": worst_lag * 1000,
+    }
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "source.png")
+        make_image(source, args.width, args.height)
+        # Warm the worker processes so spawn cost is not billed to the first upload
+        await asyncio.get_running_loop().run_in_executor(thumbnail_service._get_executor(), os.getpid)
+        report = {
+            "image": {"width": args.width, "height": args.height, "bytes": os.path.getsize(source)},
+            "workers": thumbnail_service.THUMBNAIL_WORKERS,
+            "results": [await run_mode(source, workdir, args.uploads, mode) for mode in ("inline", "pool")],
+        }
+    thumbnail_service.shutdown_thumbnail_pool()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2200)
+    parser.add_argument("--uploads", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,143 @@
+"""S3Storage against a live S3-compatible endpoint, normally a local MinIO.
+
+Run from backend/:
+
+    docker run -d -p 9000:9000 minio/minio server /data
+    AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin \\
+        python -m benchmarks.check_s3 --endpoint-url http://localhost:9000
+
+Exercises every operation the app uses (put, put_file, get, get_to_file,
+stream with and without a range, stat, exists, list, presign and delete) under
+a fresh prefix, reports each check with its latency, and exits non-zero if any
+failed. The bucket is created when missing; the objects written are removed
+afterwards unless --keep.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from app.storage.s3 import S3Storage
+
+PAYLOAD_SIZE = 3 * 1024 * 1024 + 123
+
+
+def _ensure_bucket(storage: S3Storage):
+    try:
+        storage._client.head_bucket(Bucket=storage.bucket)
+    except storage._client_error:
+        storage._client.create_bucket(Bucket=storage.bucket)
+
+
+def run_checks(storage: S3Storage, work_dir: str) -> list:
+    payload = os.urandom(PAYLOAD_SIZE)
+    results = []
+
+    def check(name: str, fn):
+        started = time.perf_counter()
+        error = None
+        try:
+            fn()
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        result = {"check": name, "ok": error is None, "ms": round((time.perf_counter() - started) * 1000, 2)}
+        if error:
+            result["error"] = error
+        results.append(result)
+
+    def expect(condition: bool, message: str):
+        if not condition:
+            raise AssertionError(message)
+
+    def put():
+        storage.put("objects/small.txt", b"hello", "text/plain")
+        expect(storage.get("objects/small.txt") == b"hello", "get returned different bytes")
+
+    def put_file():
+        source = os.path.join(work_dir, "upload.bin")
+        with open(source, "wb") as out:
+            out.write(payload)
+        storage.put_file("objects/large.bin", source, "application/octet-stream")
+        expect(not os.path.exists(source), "put_file left its source file behind")
+
+    def get():
+        expect(storage.get("objects/large.bin") == payload, "get returned different bytes")
+
+    def get_to_file():
+        dest = os.path.join(work_dir, "download.bin")
+        storage.get_to_file("objects/large.bin", dest)
+        with open(dest, "rb") as downloaded:
+            expect(downloaded.read() == payload, "get_to_file wrote different bytes")
+
+    def stream():
+        expect(b"".join(storage.stream("objects/large.bin")) == payload, "stream returned different bytes")
+
+    def stream_range():
+        start, end = 1000, 200_000
+        data = b"".join(storage.stream("objects/large.bin", start, end))
+        expect(data == payload[start:end + 1], "ranged stream returned different bytes")
+        tail = b"".join(storage.stream("objects/large.bin", PAYLOAD_SIZE - 10))
+        expect(tail == payload[-10:], "open-ended ranged stream returned different bytes")
+
+    def stat():
+        found = storage.stat("objects/large.bin")
+        expect(found is not None and found.size == PAYLOAD_SIZE, f"stat gave {found}")
+        expect(found.key == "objects/large.bin", f"stat key {found.key!r} should not include the prefix")
+        expect(storage.stat("objects/missing.bin") is None, "stat of a missing key is not None")
+        expect(storage.exists("objects/large.bin") and not storage.exists("objects/missing.bin"), "exists disagrees")
+
+    def listing():
+        keys = sorted(obj.key for obj in storage.list("objects/"))
+        expect(keys == ["objects/large.bin", "objects/small.txt"], f"list gave {keys}")
+
+    def presign():
+        url = storage.presign("objects/large.bin", 60, "large.bin", inline=False)
+        expect(bool(url), "presign returned no URL")
+        response = httpx.get(url, headers={"Range": "bytes=0-99"})
+        expect(response.status_code == 206, f"presigned ranged GET answered {response.status_code}")
+        expect(response.content == payload[:100], "presigned GET returned different bytes")
+        disposition = response.headers.get("content-disposition", "")
+        expect(disposition.startswith("attachment"), f"Content-Disposition was {disposition!r}")
+
+    def delete():
+        storage.delete("objects/large.bin")
+        storage.delete("objects/small.txt")
+        expect(storage.stat("objects/large.bin") is None, "object still there after delete")
+        # Missing objects are ignored
+        storage.delete("objects/large.bin")
+
+    for name, fn in (("put", put), ("put_file", put_file), ("get", get), ("get_to_file", get_to_file),
+                     ("stream", stream), ("stream_range", stream_range), ("stat", stat), ("list", listing),
+                     ("presign", presign), ("delete", delete)):
+        check(name, fn)
+    return results
+
+
+def main(args):
+    storage = S3Storage(args.bucket, f"{args.prefix}/{uuid.uuid4().hex}", args.endpoint_url, args.region)
+    _ensure_bucket(storage)
+    with tempfile.TemporaryDirectory(prefix="chatapp-s3-check-") as work_dir:
+        try:
+            results = run_checks(storage, work_dir)
+        finally:
+            if not args.keep:
+                for obj in storage.list(""):
+                    storage.delete(obj.key)
+    print(json.dumps({"endpoint": args.endpoint_url, "bucket": args.bucket, "prefix": storage.prefix,
+                      "results": results}, indent=2))
+    if not all(result["ok"] for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoint-url", default=os.getenv("S3_ENDPOINT_URL", "http://localhost:9000"))
+    parser.add_argument("--bucket", default=os.getenv("S3_BUCKET", "chatapp-check"))
+    parser.add_argument("--prefix", default="storage-check", help="objects go under <prefix>/<random>/")
+    parser.add_argument("--region", default=os.getenv("S3_REGION") or "us-east-1")
+    parser.add_argument("--keep", action="store_true", help="leave the written objects in the bucket")
+    main(parser.parse_args())
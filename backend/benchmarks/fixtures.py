@@ -0,0 +1,151 @@
+"""Throwaway database and seed data shared by the end-to-end benchmarks.
+
+use_test_database() must run before anything under app/ is imported: the
+Mongo client, log setup and Firebase are configured at import time.
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from bson import ObjectId
+
+SEED_BATCH_SIZE = 1000
+
+
+def add_database_args(parser):
+    parser.add_argument("--backend", choices=("mongo", "memory"), default="mongo",
+                        help="mongo: a real mongod at --mongo-url; memory: mongomock, in-process")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="chatapp_bench", help="dropped before seeding and afterwards unless --keep")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded database in place")
+
+
+def use_test_database(args, fresh: bool = True):
+    """Point the app at the benchmark database and keep it away from external services.
+
+    fresh drops the database first; a server process started on data seeded
+    by its parent passes False.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    if args.db == os.getenv("DB_NAME", "internal_chatapp"):
+        raise SystemExit(f"--db {args.db} is the configured DB_NAME; benchmarks drop their database")
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("UPLOAD_ROOT", tempfile.mkdtemp(prefix="chatapp-bench-"))
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["TOKEN_REVOCATION_SYNC_SECONDS"] = "inf"
+    os.environ["PROFILE_SAMPLE_RATE"] = "0"
+    os.environ["SLOW_QUERY_MS"] = "-1"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.backend == "memory":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("--backend memory needs mongomock: pip install mongomock")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    # Seeded accounts have no FCM tokens, so nothing is ever sent; an app
+    # without a service account key only has to exist for the import to work
+    import firebase_admin
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(options={"projectId": "chatapp-bench"})
+
+    if fresh:
+        from app.config import client
+        client.drop_database(args.db)
+
+
+def drop_test_database(args):
+    if args.keep:
+        return
+    from app.config import client
+    client.drop_database(args.db)
+
+
+def ensure_indexes():
+    """The indexes the app creates on startup, so queries are planned as in production"""
+    from app.services.file_service import ensure_file_indexes
+    from app.services.upload_session_service import ensure_upload_session_indexes
+    from app.services.ticket_service import ensure_ticket_indexes
+    from app.services.ticket_timer_service import ensure_ticket_timer_indexes
+    from app.services.identity_service import ensure_identity_indexes
+    from app.services.message_service import ensure_message_indexes
+    ensure_file_indexes()
+    ensure_upload_session_indexes()
+    ensure_ticket_indexes()
+    ensure_ticket_timer_indexes()
+    ensure_identity_indexes()
+    ensure_message_indexes()
+
+
+def seed_org(name: str = "Bench Org") -> str:
+    from app.config import db
+    return str(db["organizations"].insert_one({"name": name, "created_at": datetime.now(timezone.utc)}).inserted_id)
+
+
+def seed_members(org_id: str, count: int) -> List[dict]:
+    """count users in the org, with identities; passwords are unusable"""
+    from app.config import db
+    from app.services.identity_service import backfill_identities
+    members = [
+        {
+            "_id": ObjectId(),
+            "email": f"member{i}@bench.local",
+            "username": f"member{i}",
+            "first_name": "Member",
+            "last_name": str(i),
+            "organization_id": org_id,
+            "role": "user",
+            "password": "!",
+            "is_online": False,
+        }
+        for i in range(count)
+    ]
+    for start in range(0, count, SEED_BATCH_SIZE):
+        db["users"].insert_many(members[start:start + SEED_BATCH_SIZE])
+    backfill_identities(["users"])
+    return members
+
+
+def member_token(member: dict) -> str:
+    from app.core.security import create_access_token
+    return create_access_token({
+        "sub": member["email"], "role": member["role"],
+        "org_id": member["organization_id"], "user_id": str(member["_id"]),
+    }, expires_delta=timedelta(hours=24))
+
+
+def seed_chat(org_id: str, participants: List[dict], group_name: Optional[str] = None) -> str:
+    from app.services.chat_service import create_chat
+    ids = [str(member["_id"]) for member in participants]
+    chat = {"type": "group" if group_name else "direct", "participants": ids, "organization_id": org_id}
+    if group_name:
+        chat.update({"group_name": group_name, "created_by": ids[0], "admins": ids[:1]})
+    return create_chat(chat)
+
+
+def seed_messages(chat_id: str, senders: List[dict], count: int, status: str = "read") -> None:
+    """count text messages, one second apart and ending now, cycling through senders"""
+    from app.services.message_service import messages_collection
+    started = datetime.utcnow() - timedelta(seconds=count)
+    batch = []
+    for i in range(count):
+        sender_id = str(senders[i % len(senders)]["_id"])
+        batch.append({
+            "chat_id": chat_id,
+            "sender_id": sender_id,
+            "message": f"Benchmark message {i} " + "lorem ipsum " * (i % 8),
+            "message_type": "text",
+            "attachment": None,
+            "reply_to": None,
+            "timestamp": (started + timedelta(seconds=i)).isoformat() + "Z",
+            "status": status,
+            "seenBy": [],
+        })
+        if len(batch) == SEED_BATCH_SIZE:
+            messages_collection.insert_many(batch)
+            batch = []
+    if batch:
+        messages_collection.insert_many(batch)
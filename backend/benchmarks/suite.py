@@ -0,0 +1,253 @@
+"""Backend benchmark suite: the hot HTTP endpoints against a seeded throwaway database.
+
+Run from backend/:
+
+    python -m benchmarks.suite --output bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite --backend memory --only history,mark_read
+    python -m benchmarks.suite --compare bench-base.json bench-head.json
+
+Requests go through the ASGI app in-process with httpx, so timings cover
+routing, auth, validation, database work and serialization but no network.
+--backend mongo (the default) needs a local mongod; the --db database is
+dropped before seeding and afterwards. --backend memory uses mongomock: good
+for catching regressions in Python-side work, but its query engine is not
+mongod's, so index effects do not show.
+
+Each case reports request latency and, as settle_ms, the time until the
+background work the request started (FCM fan-out, thumbnails) finished. A
+case that errors is reported as {"error": ...} and the rest still run.
+"""
+import argparse
+import asyncio
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import fixtures
+
+CASES = ("send_message", "history", "mark_read", "users_by_org", "my_chats", "tickets", "tickets_page", "upload")
+
+
+class Case:
+    def __init__(self, name: str, method: str, path: str, reset=None, body=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        # Untimed, before every iteration: put back what the previous request changed
+        self.reset = reset
+        # Callable returning request kwargs (json=..., files=...) per iteration
+        self.body = body
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def _settle():
+    """Wait for the tasks the last request left on the loop"""
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def seed(args) -> dict:
+    from app.config import db
+    from app.services.ticket_service import create_tickets_bulk
+    started = time.perf_counter()
+    fixtures.ensure_indexes()
+    org_id = fixtures.seed_org()
+    members = fixtures.seed_members(org_id, args.members)
+    me = members[0]
+
+    for other in members[1:args.chats + 1]:
+        chat_id = fixtures.seed_chat(org_id, [me, other])
+        fixtures.seed_messages(chat_id, [me, other], 1)
+    room = members[:args.group_size]
+    history_chat = fixtures.seed_chat(org_id, room, "History")
+    fixtures.seed_messages(history_chat, room, args.history)
+    unread_chat = fixtures.seed_chat(org_id, [me, members[1]], "Unread")
+    fixtures.seed_messages(unread_chat, [members[1]], args.unread, status="sent")
+    send_chat = fixtures.seed_chat(org_id, room, "Send")
+
+    travel = datetime.now(timezone.utc) + timedelta(days=30)
+    create_tickets_bulk(org_id, [{
+        "name": f"Traveller {i}", "pocName": "Member 0", "mobile": "9999999999",
+        "destination": ("Goa", "Manali", "Dubai", "Bali")[i % 4], "adults": 2, "children": 0, "infants": 0,
+        "pax": 2, "body": "Benchmark ticket", "travelDate": travel + timedelta(hours=i),
+        "status": "open", "created_by": str(me["_id"]),
+    } for i in range(args.tickets)])
+
+    return {
+        "org_id": org_id,
+        "token": fixtures.member_token(me),
+        "history_chat": history_chat,
+        "unread_chat": unread_chat,
+        "send_chat": send_chat,
+        "db": db,
+        "seed_s": round(time.perf_counter() - started, 2),
+    }
+
+
+def _image_bytes(width: int, height: int) -> bytes:
+    from PIL import Image
+    noise = Image.effect_noise((width, height), 64)
+    buffer = io.BytesIO()
+    Image.merge("RGB", (noise, noise.rotate(90), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT))).save(
+        buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def build_cases(args, ctx: dict) -> dict:
+    db = ctx["db"]
+    counter = iter(range(1 << 30))
+
+    def reset_unread():
+        db["messages"].update_many({"chat_id": ctx["unread_chat"]}, {"$set": {"status": "sent", "seenBy": []}})
+
+    def message_body():
+        return {"json": {"chat_id": ctx["send_chat"], "message": f"Benchmark send {next(counter)}"}}
+
+    def upload_body():
+        # A fresh image each time: identical bytes would be deduplicated and never rendered
+        return {"files": {"file": (f"bench-{next(counter)}.jpg", _image_bytes(args.image_width, args.image_height), "image/jpeg")}}
+
+    cases = [
+        Case("send_message", "POST", "/messages/send", body=message_body),
+        Case("history", "GET", f"/messages/chat/{ctx['history_chat']}"),
+        Case("mark_read", "POST", f"/messages/mark-read/{ctx['unread_chat']}", reset=reset_unread),
+        Case("users_by_org", "GET", "/users/by_org"),
+        Case("my_chats", "GET", "/chats/my-chats"),
+        Case("tickets", "GET", "/tickets/"),
+        Case("tickets_page", "GET", "/tickets/?limit=50"),
+        Case("upload", "POST", "/files/upload", body=upload_body),
+    ]
+    return {case.name: case for case in cases}
+
+
+async def run_case(client, case: Case, iterations: int, warmup: int) -> dict:
+    latencies, settles, sizes = [], [], []
+    for i in range(warmup + iterations):
+        if case.reset:
+            case.reset()
+        kwargs = case.body() if case.body else {}
+        started = time.perf_counter()
+        response = await client.request(case.method, case.path, **kwargs)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{case.name}: {response.status_code} {response.text[:200]}")
+        settle_started = time.perf_counter()
+        await _settle()
+        if i >= warmup:
+            latencies.append(elapsed * 1000)
+            settles.append((time.perf_counter() - settle_started) * 1000)
+            sizes.append(len(response.content))
+    return {
+        "iterations": iterations,
+        "median_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "min_ms": round(min(latencies), 3),
+        "max_ms": round(max(latencies), 3),
+        "settle_ms": round(statistics.median(settles), 3),
+        "response_bytes": int(statistics.median(sizes)),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    import httpx
+    from app.main import app
+    from app.services import thumbnail_service
+
+    ctx = seed(args)
+    cases = build_cases(args, ctx)
+    selected = args.only.split(",") if args.only else CASES
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {ctx['token']}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=None) as client:
+        for name in selected:
+            # A broken route fails its own case, not the whole report
+            try:
+                results[name] = await run_case(client, cases[name], args.iterations, args.warmup)
+            except Exception as exc:
+                await _settle()
+                results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+    thumbnail_service.shutdown_thumbnail_pool()
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "dataset": {
+            "members": args.members, "chats": args.chats, "group_size": args.group_size,
+            "history": args.history, "unread": args.unread, "tickets": args.tickets,
+            "image": [args.image_width, args.image_height], "seed_s": ctx["seed_s"],
+        },
+        "results": results,
+    }
+
+
+def compare(base_path: str, head_path: str) -> dict:
+    """Median latency change per case between two reports; positive is slower"""
+    with open(base_path) as base_file, open(head_path) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+    changes = {}
+    for name, result in head["results"].items():
+        before = base["results"].get(name)
+        if before and "median_ms" in before and "median_ms" in result:
+            changes[name] = {
+                "base_ms": before["median_ms"],
+                "head_ms": result["median_ms"],
+                "change_pct": round((result["median_ms"] - before["median_ms"]) / before["median_ms"] * 100, 1),
+            }
+    return {"base": base.get("commit"), "head": head.get("commit"), "changes": changes}
+
+
+def main(args):
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2))
+        return
+    unknown = set(args.only.split(",")) - set(CASES) if args.only else set()
+    if unknown:
+        raise SystemExit(f"Unknown cases: {', '.join(sorted(unknown))}; choose from {', '.join(CASES)}")
+    fixtures.use_test_database(args)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        fixtures.drop_test_database(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    fixtures.add_database_args(parser)
+    parser.add_argument("--only", help="comma-separated cases: " + ",".join(CASES))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=200, help="direct chats of the benchmark user")
+    parser.add_argument("--group-size", type=int, default=50)
+    parser.add_argument("--history", type=int, default=10000, help="messages in the history chat")
+    parser.add_argument("--unread", type=int, default=2000, help="unread messages for mark_read")
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--image-width", type=int, default=1600)
+    parser.add_argument("--image-height", type=int, default=1200)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="diff two saved reports and exit")
+    main(parser.parse_args())
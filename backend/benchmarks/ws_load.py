@@ -0,0 +1,353 @@
+"""WebSocket load generator: N authenticated sockets in chat rooms, with fan-out latency.
+
+Run from backend/:
+
+    python -m benchmarks.ws_load --users 1000 --room-size 50 --rate 0.5 --duration 30
+
+Seeds --users members of one organization into a test database, groups them
+into rooms of --room-size and starts a uvicorn worker on that database (or
+targets --url, which must share the database and SECRET_KEY). Every member
+connects to /ws/{user_id} with a minted JWT, joins its room, and then sends
+Poisson-timed events at --rate per second, mixed by --mix.
+
+Latency is measured from the moment a client sends an event to the moment
+each other member of the room receives the broadcast it causes: new_message
+for "message", typing for "typing", messages_read for "mark_read". Clients
+run in this process, so both ends share one clock. Frames still missing
+--drain seconds after the last send count as dropped. Server memory is
+sampled from /proc (Linux); ws and event-loop gauges come from /metrics.
+
+Raise the open-file limit (ulimit -n) above twice --users first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from benchmarks import fixtures
+
+# Client event -> broadcast type the other room members receive
+BROADCASTS = {"message": "new_message", "typing": "typing", "mark_read": "messages_read"}
+TRACKED = {broadcast: event for event, broadcast in BROADCASTS.items()}
+SCRAPED_METRICS = ("chatapp_ws_connections", "chatapp_ws_send_failures_total", "chatapp_event_loop_lag_window_seconds")
+
+
+class Stats:
+    def __init__(self):
+        # (sender_id, event) -> send times, in order; receivers match the nth
+        # frame from a sender to its nth send, as one socket delivers in order
+        self.sent: Dict[tuple, List[float]] = defaultdict(list)
+        self.received: Dict[tuple, int] = defaultdict(int)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.expected: Dict[str, int] = defaultdict(int)
+        self.send_errors = 0
+        self.disconnects = 0
+        self.unmatched = 0
+
+    def record_send(self, sender_id: str, event: str, recipients: int):
+        self.sent[(sender_id, event)].append(time.perf_counter())
+        self.expected[event] += recipients
+
+    def record_receive(self, receiver_id: str, frame: dict):
+        event = TRACKED.get(frame.get("type"))
+        sender_id = frame.get("sender_id") or frame.get("user_id")
+        if event is None or sender_id is None:
+            return
+        key = (receiver_id, sender_id, event)
+        index = self.received[key]
+        self.received[key] = index + 1
+        sent = self.sent.get((sender_id, event), [])
+        if index < len(sent):
+            self.latencies[event].append(time.perf_counter() - sent[index])
+        else:
+            self.unmatched += 1
+
+
+def _percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def at(q):
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 2)
+    return {"count": len(ordered), "p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+class Client:
+    def __init__(self, member: dict, token: str, room: str, room_members: int):
+        self.user_id = str(member["_id"])
+        self.token = token
+        self.room = room
+        self.room_members = room_members
+        # Joined room members other than this client, set once everyone has joined
+        self.recipients = room_members - 1
+        self.websocket = None
+        self.joined = asyncio.Event()
+
+    async def connect(self, base_url: str):
+        from websockets.asyncio.client import connect
+        self.websocket = await connect(f"{base_url}/ws/{self.user_id}?token={self.token}", max_queue=None)
+
+    async def receive(self, stats: Stats):
+        try:
+            async for raw in self.websocket:
+                frame = json.loads(raw)
+                kind = frame.get("type")
+                if kind == "ping":
+                    await self.websocket.send(json.dumps({"type": "pong"}))
+                elif kind == "joined_chat":
+                    self.joined.set()
+                else:
+                    stats.record_receive(self.user_id, frame)
+        except Exception:
+            stats.disconnects += 1
+
+    async def drive(self, stats: Stats, rate: float, mix: Dict[str, float], until: float, rng: random.Random):
+        events, weights = list(mix), list(mix.values())
+        typing = False
+        sequence = 0
+        while True:
+            await asyncio.sleep(rng.expovariate(rate))
+            if time.perf_counter() >= until:
+                return
+            event = rng.choices(events, weights)[0]
+            if event == "message":
+                sequence += 1
+                frame = {"type": "message", "chat_id": self.room, "message": f"load {self.user_id} {sequence}"}
+            elif event == "typing":
+                typing = not typing
+                frame = {"type": "typing", "chat_id": self.room, "is_typing": typing}
+            else:
+                frame = {"type": "mark_read", "chat_id": self.room}
+            stats.record_send(self.user_id, event, self.recipients)
+            try:
+                await self.websocket.send(json.dumps(frame))
+            except Exception:
+                stats.send_errors += 1
+                return
+
+
+def _server_rss_mb(pid: Optional[int]) -> Optional[float]:
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+async def _scrape_metrics(http_url: str) -> dict:
+    import httpx
+    values = {}
+    try:
+        async with httpx.AsyncClient() as client:
+            text = (await client.get(f"{http_url}/metrics")).text
+    except httpx.HTTPError:
+        return values
+    for line in text.splitlines():
+        if line.startswith(SCRAPED_METRICS):
+            name, _, value = line.rpartition(" ")
+            values[name] = float(value)
+    return values
+
+
+async def _wait_for_server(http_url: str, timeout: float = 60):
+    import httpx
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{http_url}/api/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit(f"Server at {http_url} did not come up")
+
+
+def seed(args) -> List[Client]:
+    org_id = fixtures.seed_org()
+    members = fixtures.seed_members(org_id, args.users)
+    fixtures.ensure_indexes()
+    clients = []
+    for start in range(0, len(members), args.room_size):
+        room_members = members[start:start + args.room_size]
+        room = fixtures.seed_chat(org_id, room_members, f"Load room {start // args.room_size}")
+        clients.extend(Client(member, fixtures.member_token(member), room, len(room_members)) for member in room_members)
+    return clients
+
+
+async def _connect_all(clients: List[Client], base_url: str, concurrency: int) -> dict:
+    limit = asyncio.Semaphore(concurrency)
+    times, failures = [], 0
+
+    async def connect(client: Client):
+        nonlocal failures
+        async with limit:
+            started = time.perf_counter()
+            try:
+                await client.connect(base_url)
+                times.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+    started = time.perf_counter()
+    await asyncio.gather(*(connect(client) for client in clients))
+    return {"total_s": round(time.perf_counter() - started, 2), "failures": failures, **_percentiles(times)}
+
+
+async def run(args, clients: List[Client], server_pid: Optional[int]) -> dict:
+    http_url = args.url.replace("ws://", "http://", 1).replace("wss://", "https://", 1)
+    await _wait_for_server(http_url)
+    stats = Stats()
+    rss_before = _server_rss_mb(server_pid)
+
+    connect_report = await _connect_all(clients, args.url, args.connect_concurrency)
+    connected = [client for client in clients if client.websocket is not None]
+    receivers = [asyncio.create_task(client.receive(stats)) for client in connected]
+    for client in connected:
+        await client.websocket.send(json.dumps({"type": "join_chat", "chat_id": client.room}))
+    try:
+        await asyncio.wait_for(asyncio.gather(*(client.joined.wait() for client in connected)), 30)
+    except asyncio.TimeoutError:
+        pass
+    joined = Counter(client.room for client in connected if client.joined.is_set())
+    for client in connected:
+        client.recipients = joined[client.room] - client.joined.is_set()
+
+    rng = random.Random(args.seed)
+    until = time.perf_counter() + args.duration
+    rss_samples = []
+
+    async def sample_memory():
+        while time.perf_counter() < until:
+            rss = _server_rss_mb(server_pid)
+            if rss is not None:
+                rss_samples.append(rss)
+            await asyncio.sleep(1)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        sample_memory(),
+        *(client.drive(stats, args.rate, args.mix, until, random.Random(rng.random())) for client in connected),
+    )
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(args.drain)
+    server_metrics = await _scrape_metrics(http_url)
+
+    for client in connected:
+        await client.websocket.close()
+    await asyncio.gather(*receivers, return_exceptions=True)
+
+    events = {}
+    for event in BROADCASTS:
+        sent = sum(len(times) for (_, kind), times in stats.sent.items() if kind == event)
+        received = len(stats.latencies[event])
+        events[event] = {
+            "sent": sent,
+            "frames_expected": stats.expected[event],
+            "frames_received": received,
+            "frames_dropped": max(stats.expected[event] - received, 0),
+            "latency": _percentiles(stats.latencies[event]),
+        }
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    return {
+        "users": args.users,
+        "room_size": args.room_size,
+        "rooms": len({client.room for client in clients}),
+        "rate_per_user": args.rate,
+        "mix": args.mix,
+        "duration_s": round(elapsed, 2),
+        "connect": connect_report,
+        "connected": len(connected),
+        "joined": sum(client.joined.is_set() for client in connected),
+        "events_per_s": round(sum(event["sent"] for event in events.values()) / elapsed, 1),
+        "frames_per_s": round(len(all_latencies) / elapsed, 1),
+        "delivery": _percentiles(all_latencies),
+        "events": events,
+        "send_errors": stats.send_errors,
+        "disconnects": stats.disconnects,
+        "unmatched_frames": stats.unmatched,
+        "server_rss_mb": {
+            "before_connect": rss_before,
+            "peak": max(rss_samples) if rss_samples else None,
+            "after": _server_rss_mb(server_pid),
+        },
+        "server_metrics": server_metrics,
+    }
+
+
+def serve(args):
+    """Child process: the app on the already seeded test database"""
+    fixtures.use_test_database(args, fresh=False)
+    import uvicorn
+    from app.main import app
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name not in BROADCASTS:
+            raise argparse.ArgumentTypeError(f"unknown event {name!r}; choose from {', '.join(BROADCASTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(args):
+    if args.serve:
+        serve(args)
+        return
+    if args.backend != "mongo":
+        raise SystemExit("The server runs in its own process, so it needs a shared database: use --backend mongo")
+    fixtures.use_test_database(args)
+    clients = seed(args)
+    server = None
+    if args.url is None:
+        args.url = f"ws://127.0.0.1:{args.port}"
+        command = [sys.executable, "-m", "benchmarks.ws_load", "--serve", "--port", str(args.port),
+                   "--mongo-url", args.mongo_url, "--db", args.db]
+        server = subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        report = asyncio.run(run(args, clients, server.pid if server else args.server_pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        fixtures.drop_test_database(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    fixtures.add_database_args(parser)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--room-size", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.5, help="events per second per user")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("message=6,typing=3,mark_read=1"),
+                        help="event weights, e.g. message=6,typing=3,mark_read=1")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--drain", type=float, default=3, help="seconds to wait for late frames")
+    parser.add_argument("--connect-concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="ws:// base URL of a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="with --url, the server's pid for memory sampling")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    main(parser.parse_args())
@@ -21,6 +21,8 @@ export default function TicketsPage() {
   const router = useRouter();
   const [tickets, setTickets] = useState<Ticket[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filterStatus, setFilterStatus] = useState<TicketStatus | 'all'>('all');
   const [sortConfig, setSortConfig] = useState<{ key: keyof Ticket, direction: 'asc' | 'desc' } | null>({ 
     key: 'createdAt', 
@@ -32,15 +34,37 @@ export default function TicketsPage() {
   const loadTickets = useCallback(async () => {
     try {
       setLoading(true);
-      const data = viewMode === 'all' ? await getTickets() : await getMyTickets();
-      setTickets(data || []);
+      if (viewMode === 'all') {
+        const page = await getTickets();
+        setTickets(page.tickets || []);
+        setNextCursor(page.nextCursor);
+      } else {
+        const data = await getMyTickets();
+        setTickets(data || []);
+        setNextCursor(null);
+      }
     } catch (error) {
       console.error('Failed to load tickets:', error);
       setTickets([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
   }, [viewMode]);
+
+  const loadMoreTickets = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const page = await getTickets(nextCursor);
+      setTickets(prev => [...prev, ...(page.tickets || [])]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Failed to load more tickets:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
   
   // WebSocket for real-time ticket updates
   useWebSocket({
@@ -225,6 +249,17 @@ export default function TicketsPage() {
                 </tbody>
               </table>
             </div>
+            {!loading && nextCursor && (
+              <div className="flex justify-center mt-4">
+                <button
+                  onClick={loadMoreTickets}
+                  disabled={loadingMore}
+                  className="px-4 py-2 text-sm font-medium rounded-lg border border-gray-300 dark:border-gray-600 bg-white dark:bg-gray-800 text-gray-700 dark:text-gray-300 hover:bg-gray-50 dark:hover:bg-gray-700 disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         </div>
       </div>
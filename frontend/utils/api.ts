@@ -107,9 +107,10 @@ export const createTicket = async (ticketData: TicketCreate): Promise<Ticket> =>
   }
 };
 
-export const getTickets = async (): Promise<Ticket[]> => {
-  const response = await instance.get("/tickets/");
-  return response.data;
+// One page of the organization's tickets, newest first; pass nextCursor back for the next page
+export const getTickets = async (cursor?: string | null): Promise<{ tickets: Ticket[]; nextCursor: string | null }> => {
+  const response = await instance.get("/tickets/", { params: cursor ? { cursor } : undefined });
+  return { tickets: response.data, nextCursor: response.headers["x-next-cursor"] || null };
 };
 
 export const getMyTickets = async (): Promise<Ticket[]> => {